@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+
+import yaml
+
+LOG = logging.getLogger('epic_narrator.background')
+
+
+def get_file_key(path):
+    """Size and modification time of the file, a cached result stays valid as long as both are the same"""
+    stat = os.stat(path)
+    return dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+
+def get_file_hash(path, *params):
+    """Hash of the file key and the parameters of a result, to name the files a result is cached in"""
+    key = get_file_key(path)
+    fields = [os.path.abspath(path), key['size'], key['mtime_ns']] + list(params)
+    return hashlib.sha1(':'.join(str(field) for field in fields).encode('utf-8')).hexdigest()
+
+
+class FileIndex:
+    """
+    Entries about files kept in a yaml file, keyed by absolute path. An entry is only returned while the size and
+    modification time of its file are the ones it was stored with.
+    """
+
+    def __init__(self, index_path, lock=None, log=LOG):
+        self.index_path = index_path
+        self.log = log
+        self._lock = lock if lock is not None else threading.Lock()
+        self._entries = self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return {}
+
+        try:
+            with open(self.index_path) as f:
+                return yaml.load(f, Loader=yaml.FullLoader) or {}
+        except Exception:
+            self.log.exception('Could not read {}'.format(self.index_path))
+            return {}
+
+    def get(self, path):
+        """Returns the entry of the file, or None if there is none or the file changed since it was stored"""
+        try:
+            key = get_file_key(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(os.path.abspath(path), None)
+
+        if entry is None or entry.get('size') != key['size'] or entry.get('mtime_ns') != key['mtime_ns']:
+            return None
+
+        return entry
+
+    def put(self, path, **values):
+        entry = dict(values, **get_file_key(path))
+
+        with self._lock:
+            self._entries[os.path.abspath(path)] = entry
+
+            with open(self.index_path, 'w') as f:
+                yaml.dump(self._entries, f, default_flow_style=False)
+
+
+class BackgroundWorker:
+    """
+    Runs `function(key, *args)` for the requests of a cache in daemon threads. Requests for a key already in the
+    works only add their callback, which is called with `(key, result)` from the worker thread. `store(key, result)`
+    is called under the lock first, so the cache can keep the result before any callback runs. When the function
+    raises, the traceback is logged and the request dropped. Requests without a result (None, or failed) only call
+    back if `report_failures` is True, with None as the result.
+    """
+
+    def __init__(self, function, name, failure_message, log=LOG, lock=None, store=None, workers=1,
+                 report_failures=False):
+        self.function = function
+        self.name = name
+        self.failure_message = failure_message  # formatted with the key
+        self.log = log
+        self.lock = lock if lock is not None else threading.Lock()
+        self.store = store
+        self.workers = workers
+        self.report_failures = report_failures
+        self._pending = {}  # key -> callbacks
+        self._requests = queue.Queue()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            name = self.name if self.workers == 1 else '{}-{}'.format(self.name, i)
+            thread = threading.Thread(target=self._work, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def is_pending(self, key):
+        """Call it holding `lock`"""
+        return key in self._pending
+
+    def request(self, key, callback=None, *args):
+        with self.lock:
+            if key in self._pending:
+                self._pending[key].append(callback)
+                return
+
+            self._pending[key] = [callback]
+
+        self._requests.put((key, args))
+
+    def _work(self):
+        while True:
+            key, args = self._requests.get()
+            self.run(key, *args)
+
+    def run(self, key, *args):
+        """Does the work of a request in the calling thread, `request` runs it in a worker thread"""
+        try:
+            result = self.function(key, *args)
+        except Exception:
+            self.log.exception(self.failure_message.format(key))
+            result = None
+
+        with self.lock:
+            callbacks = self._pending.pop(key, [])
+
+            if result is not None and self.store is not None:
+                self.store(key, result)
+
+        if result is not None or self.report_failures:
+            for callback in callbacks:
+                if callback is not None:
+                    callback(key, result)
+
+        return result
@@ -0,0 +1,99 @@
+"""
+Compares the jitter of the audio callback (how late the microphone blocks arrive, see `CallbackJitter`) when the
+recorder runs in the narrator process and when it runs in a separate capture process (`capture_process: true`), while
+Python threads keep the GIL busy the way VLC event handlers and GLib idle callbacks do in the narrator. The monitor
+data is read every 30ms, as the ui does.
+
+Run with `python benchmarks/capture_jitter.py`, add `--device` to use a microphone other than the default one
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+# the narrator modules live in the parent folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--device', type=int, default=None, help='Id of the microphone to use')
+parser.add_argument('--profile', type=str, default='low_latency', help='Stream profile to record with')
+parser.add_argument('--seconds', type=float, default=20, help='How long to measure each recorder for')
+parser.add_argument('--warm-up', type=float, default=2, help='Seconds to wait before measuring')
+parser.add_argument('--busy-threads', type=int, default=4, help='Number of threads keeping the GIL busy')
+parser.add_argument('--busy-ms', type=float, default=5, help='How long each busy thread holds the GIL at a time')
+parser.add_argument('--idle-ms', type=float, default=10, help='How long each busy thread sleeps in between')
+parser.add_argument('--percentiles', type=int, nargs='+', default=[50, 90, 99, 100], help='Percentiles to report')
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.stop = threading.Event()
+
+    def keep_busy(self):
+        # pure Python work holds the GIL, as handling VLC events or drawing from an idle callback does
+        while not self.stop.is_set():
+            end = time.perf_counter() + self.args.busy_ms / 1000
+
+            while time.perf_counter() < end:
+                sum(i * i for i in range(1000))
+
+            time.sleep(self.args.idle_ms / 1000)
+
+    def read_monitor(self, recorder):
+        while not self.stop.is_set():
+            try:
+                while True:
+                    recorder.get_monitor_data()
+            except queue.Empty:
+                pass
+
+            time.sleep(0.03)
+
+    def measure(self, recorder):
+        self.stop.clear()
+        threads = [threading.Thread(target=self.read_monitor, args=(recorder,), daemon=True)]
+        threads += [threading.Thread(target=self.keep_busy, daemon=True) for _ in range(self.args.busy_threads)]
+        recorder.start_stream()
+        time.sleep(self.args.warm_up)
+
+        for thread in threads:
+            thread.start()
+
+        time.sleep(self.args.seconds)
+        percentiles = recorder.get_jitter_percentiles(self.args.percentiles)
+        self.stop.set()
+
+        for thread in threads:
+            thread.join()
+
+        recorder.close_stream()
+        return percentiles
+
+    def run(self):
+        from capture import CaptureProcess
+        from recorder import Recorder
+
+        options = dict(profile=self.args.profile)
+
+        if self.args.device is not None:
+            options['device_id'] = self.args.device
+
+        print('{} busy threads, {}ms busy every {}ms'.format(self.args.busy_threads, self.args.busy_ms,
+                                                             self.args.busy_ms + self.args.idle_ms))
+        print('{:>16}: {}'.format('jitter (ms)', ' '.join('{:>8}'.format('p{}'.format(p))
+                                                          for p in self.args.percentiles)))
+
+        for name, recorder_class in [('in process', Recorder), ('capture process', CaptureProcess)]:
+            percentiles = self.measure(recorder_class(**options))
+
+            if percentiles is None:
+                print('{:>16}: no audio blocks received'.format(name))
+            else:
+                print('{:>16}: {}'.format(name, ' '.join('{:8.2f}'.format(value) for value in percentiles)))
+
+
+if __name__ == '__main__':
+    Bench(parser.parse_args()).run()
@@ -0,0 +1,113 @@
+"""
+Compares the time-to-interactive after reaching the end of a video, i.e. the time between the end of the playback and
+the moment a backward seek is displayed, with the two strategies used by the narrator:
+
+- reload: let VLC end the stream, then open the media again paused close to the end (the old behaviour)
+- pause: pause on the last frame before VLC ends the stream, keeping the media loaded (`Player.pause_at_end`)
+
+Run with `python benchmarks/end_of_video.py path/to/video.mp4`
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import vlc
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('video', type=str, help='Path to the video to use')
+parser.add_argument('--repeat', type=int, default=5, help='Number of runs for each strategy')
+parser.add_argument('--play-ms', type=int, default=1500, help='How long to play before reaching the end')
+parser.add_argument('--seek-back-ms', type=int, default=10000, help='How far to seek back after the end')
+parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for VLC events')
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.instance = vlc.Instance('--no-xlib', '--vout=dummy', '--aout=dummy')
+        self.player = self.instance.media_player_new()
+        self.events = {e: threading.Event() for e in ['paused', 'ended', 'time_changed']}
+        manager = self.player.event_manager()
+        manager.event_attach(vlc.EventType.MediaPlayerPaused, lambda *a: self.events['paused'].set())
+        manager.event_attach(vlc.EventType.MediaPlayerEndReached, lambda *a: self.events['ended'].set())
+        manager.event_attach(vlc.EventType.MediaPlayerTimeChanged, lambda *a: self.events['time_changed'].set())
+        self.length = 0
+
+    def wait(self, event):
+        if not self.events[event].wait(self.args.timeout):
+            raise RuntimeError('Timed out waiting for VLC to be {}'.format(event))
+
+        self.events[event].clear()
+
+    def open(self, start_time_ms=0):
+        media = self.instance.media_new_path(self.args.video)
+        media.add_option(':start-paused')
+
+        if start_time_ms > 0:
+            media.add_option(':start-time={:.3f}'.format(start_time_ms / 1000))
+
+        self.events['paused'].clear()
+        self.player.set_media(media)
+        self.player.play()
+        self.wait('paused')
+        self.length = self.player.get_length()
+
+    def seek_back_and_wait(self, from_ms):
+        target = max(0, from_ms - self.args.seek_back_ms)
+        self.events['time_changed'].clear()
+        self.player.set_time(target)
+
+        # wait until VLC reports a position close to the target
+        deadline = time.perf_counter() + self.args.timeout
+
+        while time.perf_counter() < deadline:
+            self.events['time_changed'].wait(0.01)
+            self.events['time_changed'].clear()
+
+            if abs(self.player.get_time() - target) < 1000:
+                return
+
+        raise RuntimeError('Timed out waiting for the backward seek')
+
+    def run_reload(self):
+        self.open(max(0, self.length - self.args.play_ms))
+        self.events['ended'].clear()
+        self.player.play()
+        self.wait('ended')
+
+        start = time.perf_counter()
+        end_time = self.length - 500
+        self.player.stop()
+        self.open(end_time)
+        self.seek_back_and_wait(end_time)
+        return time.perf_counter() - start
+
+    def run_pause(self):
+        last_frame_time = self.length - 100
+        self.open(max(0, self.length - self.args.play_ms))
+        self.player.play()
+
+        while self.player.get_time() < last_frame_time - 40:
+            time.sleep(0.005)
+
+        start = time.perf_counter()
+        self.player.set_pause(True)
+        self.seek_back_and_wait(last_frame_time)
+        return time.perf_counter() - start
+
+    def run(self):
+        self.open()
+        print('Video length: {}ms'.format(self.length))
+
+        for name, run in [('reload', self.run_reload), ('pause', self.run_pause)]:
+            timings = [run() * 1000 for _ in range(self.args.repeat)]
+            print('{:>7}: median {:8.1f}ms, min {:8.1f}ms, max {:8.1f}ms'.format(
+                name, statistics.median(timings), min(timings), max(timings)))
+
+        self.player.stop()
+        self.instance.release()
+
+
+if __name__ == '__main__':
+    Bench(parser.parse_args()).run()
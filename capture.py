@@ -0,0 +1,362 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from levels import LevelMeter
+from routing import ChannelRouter
+
+LOG = logging.getLogger('epic_narrator.capture')
+
+
+class MonitorRing:
+    """
+    Ring buffer of monitor frames in shared memory, written by the capture process and read by the ui. There is a
+    single writer and a single reader and the writer only moves `written` once the frames are in place, so no lock is
+    needed. A reader that falls behind by more than the size of the ring loses the oldest frames, which is fine for
+    a monitor.
+    """
+
+    def __init__(self, n_frames, n_channels, context=multiprocessing):
+        self.n_frames = n_frames
+        self.n_channels = n_channels
+        self.buffer = context.RawArray('f', n_frames * n_channels)
+        self.written = context.RawValue('q', 0)  # frames written since the start
+        self.read_position = 0
+        self._frames = None
+
+    def __getstate__(self):
+        # the numpy view is created again on the other side of the process
+        state = self.__dict__.copy()
+        state['_frames'] = None
+        return state
+
+    def get_frames(self):
+        if self._frames is None:
+            self._frames = np.frombuffer(self.buffer, dtype=np.float32).reshape(self.n_frames, self.n_channels)
+
+        return self._frames
+
+    def write(self, block):
+        frames = self.get_frames()
+        block = block[-self.n_frames:]
+        written = self.written.value
+        start = written % self.n_frames
+        end = start + len(block)
+
+        if end <= self.n_frames:
+            frames[start:end] = block
+        else:
+            split = self.n_frames - start
+            frames[start:] = block[:split]
+            frames[:end - self.n_frames] = block[split:]
+
+        self.written.value = written + len(block)
+
+    def read(self):
+        """Returns a copy of the frames written since the last read, or None if there are none"""
+        written = self.written.value
+        n_new = min(written - self.read_position, self.n_frames)
+        self.read_position = written
+
+        if n_new <= 0:
+            return None
+
+        return self.get_frames()[(np.arange(written - n_new, written)) % self.n_frames]
+
+
+def run_capture(connection, ring, recorder_options, log_level=logging.INFO):
+    """Main function of the capture process: creates the recorder and runs the methods the narrator asks for"""
+    # the process starts from scratch, so it logs to the console rather than to the narrator's log file
+    logging.basicConfig(level=log_level, format='%(asctime)s [capture] %(name)s %(levelname)s: %(message)s')
+    from recorder import Recorder
+
+    try:
+        recorder = Recorder(monitor_sink=ring.write, **recorder_options)
+    except Exception:
+        connection.send((0, 'error', traceback.format_exc()))
+        return
+
+    connection.send((0, 'ok', dict(window_size=recorder.get_window_size(), device_id=recorder.device_id,
+                                   stream_info=recorder.get_stream_info())))
+
+    while True:
+        try:
+            request_id, method, args = connection.recv()
+        except EOFError:
+            break  # the narrator is gone
+
+        try:
+            result = getattr(recorder, method)(*args)
+        except Exception:
+            if request_id is not None:
+                connection.send((request_id, 'error', traceback.format_exc()))
+            else:
+                LOG.error('{} failed:\n{}'.format(method, traceback.format_exc()))
+
+            continue
+
+        if request_id is not None:
+            connection.send((request_id, 'ok', result))
+
+        if method == 'close_stream':
+            break
+
+
+class CaptureConnection:
+    """
+    Narrator end of the pipe to the capture process. Every request that wants a reply gets an id, and a reader thread
+    hands each reply to whoever asked for it, so waiting for a reply never blocks the other callers: the pipe is only
+    locked while a request is being sent. If the capture process goes away, the requests still waiting get an error.
+    """
+
+    def __init__(self, connection, timeout_s=10):
+        self.connection = connection
+        self.timeout_s = timeout_s
+        self._lock = threading.Lock()
+        self._next_id = 1  # 0 is the message the capture process sends once it has started
+        self._callbacks = {}  # request id -> callback(error, result)
+        self._is_closed = False
+        self._reader = None
+
+    def receive_started(self):
+        """Waits for the message the capture process sends once it has started and returns its content"""
+        if not self.connection.poll(self.timeout_s):
+            raise RuntimeError('The capture process did not start in {}s'.format(self.timeout_s))
+
+        _, status, result = self.connection.recv()
+
+        if status == 'error':
+            raise RuntimeError('Error in the capture process:\n{}'.format(result))
+
+        self._reader = threading.Thread(target=self._read_replies, name='capture-replies', daemon=True)
+        self._reader.start()
+
+        return result
+
+    def request(self, method, *args, callback=None):
+        """
+        Runs the method in the capture process without waiting for it. `callback(error, result)` is called from the
+        reader thread with the result, or with the traceback as the error. Without a callback, errors are logged by
+        the capture process.
+        """
+        with self._lock:
+            request_id = None
+
+            if callback is not None:
+                request_id = self._next_id
+                self._next_id += 1
+                self._callbacks[request_id] = callback
+
+            try:
+                self.connection.send((request_id, method, args))
+                return
+            except OSError:
+                LOG.error('Could not send {} to the capture process, it is gone'.format(method))
+                self._callbacks.pop(request_id, None)
+
+        if callback is not None:
+            callback('The capture process is gone', None)
+
+    def call(self, method, *args):
+        """Runs the method in the capture process and returns its result, waiting at most timeout_s"""
+        done = threading.Event()
+        reply = []
+
+        def replied(error, result):
+            reply.append((error, result))
+            done.set()
+
+        self.request(method, *args, callback=replied)
+
+        if not done.wait(self.timeout_s):
+            raise RuntimeError('The capture process did not answer {} in {}s'.format(method, self.timeout_s))
+
+        error, result = reply[0]
+
+        if error is not None:
+            raise RuntimeError('Error in the capture process:\n{}'.format(error))
+
+        return result
+
+    def close(self):
+        self._is_closed = True
+
+    def _read_replies(self):
+        while True:
+            try:
+                request_id, status, result = self.connection.recv()
+            except (EOFError, OSError):
+                break
+
+            with self._lock:
+                callback = self._callbacks.pop(request_id, None)
+
+            if callback is None:
+                LOG.warning('Reply to unknown request {} from the capture process'.format(request_id))
+            elif status == 'error':
+                callback(result, None)
+            else:
+                callback(None, result)
+
+        if not self._is_closed:
+            LOG.error('The capture process is gone')
+
+        with self._lock:
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+
+        for callback in callbacks:
+            callback('The capture process is gone', None)
+
+
+class CaptureProcess:
+    """
+    Runs the recorder in a separate process, so the audio callbacks do not compete for the GIL with the ui, VLC and
+    the waveforms. It offers the methods of the Recorder that the controller uses: calls go through a pipe to the
+    capture process, which owns the stream and writes the recordings, and the monitor data comes back through a
+    MonitorRing in shared memory.
+
+    Calls made from the ui thread wait for the capture process, so the ones whose result we do not need (e.g.
+    switching profiles, which opens a stream) do not wait for it, starting and stopping a recording do not wait either
+    (the statistics of a recording come back through a callback) and the stream info is kept up to date by a
+    background thread.
+    """
+
+    def __init__(self, channels=[1], downmix=False, monitor_mode='waveform', ring_frames=16384, timeout_s=10,
+                 info_interval_s=1, **recorder_options):
+        # forking the ui process with all its threads is not safe, the capture process starts from scratch instead
+        context = multiprocessing.get_context('spawn')
+        # as many channels as the channel router of the recorder outputs
+        n_channels = ChannelRouter(channels, max(channels), downmix=downmix).n_output_channels
+        self.ring = MonitorRing(ring_frames, n_channels, context)
+        self.monitor_mode = monitor_mode
+        self.level_meter = LevelMeter(n_channels, context=context) if monitor_mode == 'levels' else None
+        self.timeout_s = timeout_s
+        self.info_interval_s = info_interval_s
+        self.is_recording = False
+        self._is_closed = False
+        connection, child_connection = context.Pipe()
+        self.connection = CaptureConnection(connection, timeout_s)
+        options = dict(recorder_options, channels=channels, downmix=downmix, monitor_mode=monitor_mode,
+                       level_meter=self.level_meter)
+        self.process = context.Process(target=run_capture, name='epic-narrator-capture', daemon=True,
+                                       args=(child_connection, self.ring, options, LOG.getEffectiveLevel()))
+        self.process.start()
+
+        try:
+            info = self.connection.receive_started()
+        except Exception:
+            self.process.join(self.timeout_s)
+            raise
+
+        self.window_size = tuple(info['window_size'])
+        self.device_id = info['device_id']
+        self.stream_info = info['stream_info']
+        threading.Thread(target=self._update_stream_info, name='capture-stream-info', daemon=True).start()
+        LOG.info('Capture process {} started for device id {}'.format(self.process.pid, self.device_id))
+
+    def call(self, method, *args):
+        """Runs the method in the capture process and returns its result"""
+        return self.connection.call(method, *args)
+
+    def post(self, method, *args):
+        """Runs the method in the capture process without waiting for it, errors are logged by the process"""
+        self.connection.request(method, *args)
+
+    def _update_stream_info(self):
+        while True:
+            time.sleep(self.info_interval_s)
+
+            if self._is_closed or not self.process.is_alive():
+                break
+
+            try:
+                self.stream_info = self.call('get_stream_info')
+            except Exception:
+                if not self._is_closed:
+                    LOG.exception('Could not get the stream info from the capture process')
+
+    def start_stream(self):
+        self.call('start_stream')
+
+    def start_recording(self, filename):
+        # the pipe keeps the order of the requests, so a stop sent right after is run after the start
+        self.connection.request('start_recording', filename, callback=self._recording_started)
+        self.is_recording = True
+
+    def _recording_started(self, error, result):
+        if error is not None:
+            LOG.error('Could not start recording:\n{}'.format(error))
+            self.is_recording = False
+
+    def stop_recording(self, callback=None):
+        """
+        Returns the statistics of the recording or, if `callback` is given, calls `callback(stats)` from the reader
+        thread once the capture process has closed the file, with None as `stats` if it could not
+        """
+        self.is_recording = False
+
+        if callback is None:
+            return self.call('stop_recording')
+
+        def stopped(error, stats):
+            if error is not None:
+                LOG.error('Could not stop recording:\n{}'.format(error))
+
+            callback(stats)
+
+        self.connection.request('stop_recording', callback=stopped)
+
+    def set_profile(self, profile):
+        self.post('set_profile', profile)
+
+    def tune_profile(self):
+        return self.call('tune_profile')
+
+    def get_profiles(self):
+        return self.call('get_profiles')
+
+    def set_auto_tune(self, auto_tune):
+        self.post('set_auto_tune', auto_tune)
+
+    def get_stream_info(self):
+        return self.stream_info  # as of at most info_interval_s ago
+
+    def get_jitter_percentiles(self, percentiles=(50, 95, 99)):
+        return self.call('get_jitter_percentiles', percentiles)
+
+    def change_device(self, device_id):
+        self.call('change_device', device_id)
+        self.device_id = device_id
+
+    def close_stream(self):
+        self._is_closed = True
+        self.connection.close()
+
+        if self.process.is_alive():
+            self.call('close_stream')
+            self.process.join(self.timeout_s)
+
+        LOG.info('Capture process stopped')
+
+    def get_monitor_data(self):
+        """Returns the monitor data captured since the last call, raises queue.Empty if there is none"""
+        data = self.ring.read()
+
+        if data is None:
+            raise queue.Empty
+
+        return data
+
+    def get_levels(self):
+        return self.level_meter.read() if self.level_meter is not None else None
+
+    def get_monitor_mode(self):
+        return self.monitor_mode
+
+    def get_window_size(self):
+        return self.window_size
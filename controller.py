@@ -1,5 +1,7 @@
 import logging
 import os
+import queue
+import threading
 import traceback
 import gi
 from player import Player
@@ -7,8 +9,8 @@ from recordings import Recordings
 
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk, GLib, GObject
-from recorder import Recorder
 from settings import Settings
+from startup import PROFILER
 
 LOG = logging.getLogger('epic_narrator.controller')
 
@@ -80,13 +82,52 @@ class SignalSender(GObject.Object):
     def output_path_changed(self, output_path):
         pass
 
+    @GObject.Signal(flags=GObject.SignalFlags.RUN_FIRST, arg_types=(int,))
+    def waveform_ready(self, rec_time):
+        pass
+
+    # the statistics of a new take are in, i.e. we know whether it has issues
+    @GObject.Signal(flags=GObject.SignalFlags.RUN_FIRST, arg_types=(int,))
+    def narration_checked(self, rec_time):
+        pass
+
+    @GObject.Signal(flags=GObject.SignalFlags.RUN_FIRST)
+    def motion_index_ready(self):
+        pass
+
+    @GObject.Signal(flags=GObject.SignalFlags.RUN_FIRST)
+    def recorder_ready(self):
+        pass
+
+    @GObject.Signal(flags=GObject.SignalFlags.RUN_FIRST, arg_types=(bool,))
+    def ask_video_queue_path(self, from_folder):
+        pass
+
+    # position is 1-based, 0 means no queue
+    @GObject.Signal(flags=GObject.SignalFlags.RUN_FIRST, arg_types=(int, int,))
+    def video_queue_changed(self, position, length):
+        pass
+
 
 class Controller:
-    def __init__(self, this_os):
+    def __init__(self, this_os, vlc_options=()):
         LOG.info('Creating controller')
         self.settings = Settings()
-        self.recorder = self.create_recorder()
+        # options given on the command line are added to those saved in the settings
+        self.vlc_options = list(self.get_setting('vlc_options', [])) + list(vlc_options)
+        self.recorder = None  # opening the microphone is slow, this is done by setup_recorder once the window is shown
+        self._profile_requests = queue.Queue()  # stream profiles to switch the recorder to, in the background
         self.recordings = None
+        # the caches, the review engine and the video queue are created on first use or by setup_caches once the
+        # window is shown, so neither their imports nor their setup delay the first frame
+        self._waveforms = None
+        self._thumbnails = None
+        self._motion = None
+        self._review = None
+        self._video_queue = None
+        self._is_video_queue_loaded = False
+        self.motion_index = None
+        self.preloader = None
         self.video_length = 0
         self.is_video_loaded = False
         self.video_path = None
@@ -96,45 +137,202 @@ class Controller:
         self.was_playing_before_recording = False
         self.was_playing_before_dragging = False
         self.stop_recording_delay_ms = 500
+        self.max_playback_speed = 4
         self.is_dragging = False
         self.highlighted_rec = None
+        self.recordings_being_saved = set()  # stopped recordings whose file is still being closed
         self.loaded_last_video = False
         self.rec_played_with_video = False
+        self.rec_played_over_video = False
         self.last_played_rec = None
+        self.narrations_to_play = []
+        self.narration_position = None  # position up to which narrations have been played with the video
+        self.narration_timeout = 0
         self.this_os = this_os
 
         self.signal_sender = SignalSender()
         self.signal_sender.connect('video_moving', self.catch_video_moving)
+        self.signal_sender.connect('playback_changed', self.update_recorder_profile)
         LOG.info('Controller created')
 
+    @property
+    def waveforms(self):
+        if self._waveforms is None:
+            from waveforms import WaveformCache
+            self._waveforms = WaveformCache()
+
+        return self._waveforms
+
+    @property
+    def thumbnails(self):
+        if self._thumbnails is None:
+            from thumbnails import ThumbnailCache
+            self._thumbnails = ThumbnailCache(interval_ms=self.get_setting('thumbnail_interval_ms', 5000))
+
+        return self._thumbnails
+
+    @property
+    def motion(self):
+        if self._motion is None:
+            from motion import MotionAnalyzer
+            self._motion = MotionAnalyzer()
+
+        return self._motion
+
+    @property
+    def review(self):
+        if self._review is None:
+            from review import ReviewEngine
+            self._review = ReviewEngine(self, speed=self.get_setting('review_speed', 1.5),
+                                        skip_silence=self.get_setting('review_skip_silence', True))
+
+        return self._review
+
+    @property
+    def video_queue(self):
+        if not self._is_video_queue_loaded:
+            self._video_queue = self.load_video_queue()
+            self._is_video_queue_loaded = True
+
+        return self._video_queue
+
+    @video_queue.setter
+    def video_queue(self, video_queue):
+        self._video_queue = video_queue
+        self._is_video_queue_loaded = True
+
+    def setup_caches(self):
+        # run from an idle callback once the window is shown, whatever the first video needed already exists
+        video_queue = self.video_queue
+
+        if video_queue is not None:
+            self.signal_sender.emit('video_queue_changed', video_queue.position + 1, len(video_queue))
+
+        PROFILER.mark('video queue loaded')
+
+        # reading the properties creates what they return
+        for name in ('waveforms', 'thumbnails', 'motion', 'review'):
+            getattr(self, name)
+            PROFILER.mark('{} created'.format(name))
+
+        return False
+
+    def setup_recorder(self):
+        # sounddevice (i.e. PortAudio) is imported and initialised in the background, as it can take a while
+        threading.Thread(target=self._create_recorder, name='recorder-setup', daemon=True).start()
+        return False
+
+    def _create_recorder(self):
+        try:
+            recorder, fallback_microphone = self.create_recorder()
+        except Exception:
+            LOG.error(traceback.format_exc())
+            return
+
+        GLib.idle_add(self.recorder_created, recorder, fallback_microphone)
+
+    def recorder_created(self, recorder, fallback_microphone=None):
+        # the stream callback feeds the ui, so the stream is started from the main thread once the recorder is set
+        self.recorder = recorder
+
+        if fallback_microphone is not None:
+            # the settings are only written from the main thread
+            self.settings.update_settings(microphone=fallback_microphone)
+
+        self.recorder.start_stream()
+        threading.Thread(target=self._switch_recorder_profiles, name='recorder-profiles', daemon=True).start()
+        self.update_recorder_profile()
+        PROFILER.mark('recorder ready')
+        self.signal_sender.emit('recorder_ready')
+
     def create_recorder(self):
+        # also returns the id of the default mic if it replaced the saved one, for the main thread to save it
         LOG.info('Creating recorder')
+        from recorder import Recorder
+
+        if self.get_setting('capture_process', False):
+            from capture import CaptureProcess
+            recorder_class = CaptureProcess
+        else:
+            recorder_class = Recorder
+
         saved_microphone = self.settings.get_setting('microphone')
+        fallback_microphone = None
+        # the stream profiles as tuned in previous runs
+        options = dict(profiles=self.get_setting('recorder_profiles', None),
+                       auto_tune=self.get_setting('auto_tune_audio', False),
+                       channels=self.get_setting('recorder_channels', [1]),
+                       downmix=self.get_setting('recorder_downmix', False),
+                       output_rate=self.get_setting('recording_sample_rate', None),
+                       monitor_mode=self.get_setting('monitor_mode', 'waveform'))
 
         if saved_microphone is not None:
             try:
-                recorder = Recorder(device_id=saved_microphone)
+                recorder = recorder_class(device_id=saved_microphone, **options)
             except Exception:
-                recorder = Recorder()
-                default_mic_device = Recorder.get_default_device()
+                recorder = recorder_class(**options)
+                fallback_microphone = Recorder.get_default_device()
 
                 LOG.error('Could not use device with ID {}. This is likely due to a saved configuration '
                           'that is no longer available '
                           '(e.g. you used a device that is not plugged anymore).'
-                          'Using default mic with ID {} now'.format(saved_microphone, default_mic_device))
-                self.settings.update_settings(microphone=default_mic_device)
+                          'Using default mic with ID {} now'.format(saved_microphone, fallback_microphone))
         else:
-            recorder = Recorder()
+            recorder = recorder_class(**options)
+
+        LOG.info('Recorder stream profiles: {}'.format(recorder.get_profiles()))
 
-        recorder.stream.start()
+        return recorder, fallback_microphone
 
-        return recorder
+    def update_recorder_profile(self, sender=None, state=None):
+        # low latency while the video is paused (i.e. we might record), the monitor alone is fine otherwise
+        if self.recorder is None or self.is_recording():
+            return
+
+        if state is None:
+            state = 'play' if self.is_video_loaded and self.player.is_playing() else 'pause'
+
+        # 'playback_changed' is emitted before VLC (asynchronously) changes state, so we go by the state it gives
+        might_record = self.holding_enter or (self.is_video_loaded and state == 'pause')
+        # opening a stream takes a while (a round trip to the capture process if there is one), so it is not done
+        # on the main thread
+        self._profile_requests.put('low_latency' if might_record else 'idle')
+
+    def _switch_recorder_profiles(self):
+        while True:
+            profile = self._profile_requests.get()
+
+            # only the latest request matters if several came in while we were switching
+            while not self._profile_requests.empty():
+                profile = self._profile_requests.get()
+
+            try:
+                # the recorder only raises its blocksize if it overflowed, in which case we keep it for the next runs
+                if self.recorder.tune_profile() is not None:
+                    GLib.idle_add(self.save_recorder_profiles, self.recorder.get_profiles())
+
+                self.recorder.set_profile(profile)
+            except Exception:
+                LOG.error(traceback.format_exc())
+
+    def save_recorder_profiles(self, profiles):
+        self.settings.update_settings(recorder_profiles=profiles)
+
+    def auto_tune_audio_toggled(self, widget):
+        self.settings.update_settings(auto_tune_audio=widget.get_active())
+
+        if self.recorder is not None:
+            self.recorder.set_auto_tune(widget.get_active())
+
+    def get_recorder_stream_info(self):
+        return self.recorder.get_stream_info() if self.recorder is not None else None
 
     def get_mic_devices(self):
+        from recorder import Recorder
         return Recorder.get_devices()
 
     def get_current_mic_device(self):
-        return self.recorder.device_id
+        return self.recorder.device_id if self.recorder is not None else None
 
     def get_setting(self, key, default_value):
         setting = self.settings.get_setting(key)
@@ -147,15 +345,22 @@ class Controller:
         self.video_length = video_length
 
     def get_recorder_data(self):
-        return self.recorder.q.get_nowait()
+        return self.recorder.get_monitor_data()
+
+    def get_recorder_levels(self):
+        return self.recorder.get_levels()
+
+    def get_recorder_monitor_mode(self):
+        return self.recorder.get_monitor_mode() if self.recorder is not None else None
 
     def is_recording(self):
-        return self.recorder.is_recording
+        return self.recorder is not None and self.recorder.is_recording
 
     def shutting_down(self, *args):
         LOG.info('shutting down')
 
-        self.recorder.close_stream()
+        if self.recorder is not None:
+            self.recorder.close_stream()
 
         if self.is_video_loaded:
             self.settings.update_settings(last_video_position=self.player.get_current_position())
@@ -173,7 +378,7 @@ class Controller:
 
         try:
             self.recorder.change_device(mic_id)
-            self.recorder.stream.start()  # starts the microphone stream
+            self.recorder.start_stream()  # starts the microphone stream
             self.settings.update_settings(microphone=mic_id)
             return True
         except Exception:
@@ -181,7 +386,7 @@ class Controller:
             return False
 
     def get_recorder_window_size(self):
-        return self.recorder.get_window_size()
+        return self.recorder.get_window_size() if self.recorder is not None else None
 
     def is_output_path_valid(self, output_path, video_path):
         return not(output_path is None or
@@ -205,6 +410,79 @@ class Controller:
 
         self.signal_sender.emit('ask_video_path', saved_video_folder, resetting)
 
+    def load_video_queue(self):
+        videos = self.get_setting('video_queue', None)
+
+        if not videos:
+            return None
+
+        from work_queue import VideoQueue
+        return VideoQueue([v for v in videos if os.path.exists(v)], self.get_setting('video_queue_position', 0))
+
+    def save_video_queue(self):
+        if self.video_queue is None:
+            self.settings.update_settings(video_queue=None, video_queue_position=0)
+            self.signal_sender.emit('video_queue_changed', 0, 0)
+        else:
+            self.settings.update_settings(video_queue=self.video_queue.videos,
+                                          video_queue_position=self.video_queue.position)
+            self.signal_sender.emit('video_queue_changed', self.video_queue.position + 1, len(self.video_queue))
+
+    def get_video_queue_state(self):
+        # the queue is not read for this, setup_caches updates the menu once it has read it
+        if not self._is_video_queue_loaded or self.video_queue is None:
+            return 0, 0
+
+        return self.video_queue.position + 1, len(self.video_queue)
+
+    def load_video_queue_menu_pressed(self, widget, event, from_folder):
+        if self.is_recording():
+            return
+
+        LOG.info('Load video queue menu pressed (from folder={})'.format(from_folder))
+
+        if self.is_video_loaded:
+            self.pause_video()
+
+        self.signal_sender.emit('ask_video_queue_path', from_folder)
+
+    def video_queue_selected(self, path):
+        LOG.info('Video queue selected: {}'.format(path))
+
+        from work_queue import VideoQueue
+
+        try:
+            video_queue = VideoQueue.from_path(path)
+        except Exception:
+            LOG.error(traceback.format_exc())
+            return
+
+        if len(video_queue) == 0:
+            LOG.warning('No videos found in {}'.format(path))
+            return
+
+        self.video_queue = video_queue
+        self.save_video_queue()
+        self.video_selected(self.video_queue.get_current())
+
+    def next_video_menu_pressed(self, *args):
+        if self.is_recording() or self.video_queue is None or not self.video_queue.has_next():
+            return
+
+        LOG.info('Next video menu pressed')
+
+        if self.is_video_loaded:
+            self.pause_video()
+
+        self.video_selected(self.video_queue.advance())
+
+    def preload_next_video(self):
+        if self.video_queue is None or not self.video_queue.has_next() or self.preloader is None:
+            return
+
+        next_video = self.video_queue.get_next()
+        self.preloader.preload(next_video, self.output_path, media_path=self.player.get_media_path(next_video))
+
     def change_output_menu_pressed(self, *args):
         if self.is_recording() or not self.is_video_loaded:
             return
@@ -226,6 +504,9 @@ class Controller:
         video_folder = os.path.dirname(video_path)
         self.settings.update_settings(last_video=video_path, video_folder=video_folder)
 
+        if self.video_queue is not None and self.video_queue.move_to(video_path):
+            self.save_video_queue()
+
         saved_output = self.get_setting('output_path', None)
 
         if self.output_path is None and not self.is_output_path_valid(saved_output, self.video_path):
@@ -250,7 +531,15 @@ class Controller:
 
     def ui_video_area_ready(self, widget):
         LOG.info('Video area ready')
-        self.player = Player(widget, self)
+        self.player = Player(widget, self, vlc_options=self.vlc_options)
+        PROFILER.mark('player created')
+        from work_queue import VideoPreloader
+        self.preloader = VideoPreloader(self.player.media_probe)
+        self.player.pause_at_end = self.get_setting('pause_at_end', True)
+        self.player.skip_static = self.get_setting('skip_static', False)
+        self.player.use_proxies = self.get_setting('use_proxies', False)
+        self.player.set_show_stats(self.get_setting('show_playback_stats', False))
+        self.player.prefetcher.set_budget(self.get_setting('read_ahead_mb', 64))
         self.ready_to_load_video()
 
     def ready_to_load_video(self):
@@ -271,10 +560,11 @@ class Controller:
 
         playback_speed = self.get_setting('playback_speed', 1)
 
-        if type(playback_speed) == float and 0 <= playback_speed <= 1:
+        if isinstance(playback_speed, (int, float)) and 0 < playback_speed <= self.max_playback_speed:
             self.player.set_speed(playback_speed)
 
-        self.player.load_video(self.video_path)
+        start_time = self.get_setting('last_video_position', 0) if self.loaded_last_video else 0
+        self.player.load_video(self.video_path, start_time_ms=start_time)
 
     def setup_recordings(self):
         LOG.info('Setting up recordings')
@@ -284,9 +574,16 @@ class Controller:
             self.signal_sender.emit('resetting_recordings')
 
         self.recordings = Recordings(self.output_path, self.video_path)
+        preloaded = self.preloader.pop(self.video_path, self.output_path) if self.preloader is not None else None
+        audio_files = preloaded.get_audio_files() if preloaded is not None else None
+
+        if audio_files is not None:
+            LOG.info('Using the recordings found when preloading the video')
+        elif self.recordings.narrations_exist():
+            audio_files = self.recordings.scan_folder()
 
-        if self.recordings.narrations_exist():
-            self.recordings.load_narrations()
+        if audio_files:
+            self.recordings.load_narrations(audio_files)
 
             for rec_idx, rec_ms in enumerate(self.recordings.get_recordings_times()):
                 self.signal_sender.emit('recording_added', rec_ms, rec_idx, False)
@@ -303,15 +600,30 @@ class Controller:
         self.highlighted_rec = None
         self.loaded_last_video = False
         self.rec_played_with_video = False
+        self.rec_played_over_video = False
         self.last_played_rec = None
+        self.narrations_to_play = []
+        self.narration_position = None
+        self.cancel_narration_timer()
+
+        if self._review is not None:
+            self._review.stop()
+
+        self.motion_index = None
         self.player.reset()
 
     def video_loaded(self):
         LOG.info('Video loaded')
+        PROFILER.mark('video loaded')
 
         self.is_video_loaded = True
         self.video_length = self.player.get_video_length()
         self.signal_sender.emit('video_loaded', self.video_length, self.video_path, self.output_path)
+        self.thumbnails.request(self.video_path, self.video_length)
+        self.request_motion_index(compute=self.get_setting('skip_static', False))
+        # we are likely to jump to the narrations, so have the video around them ready
+        self.player.prefetcher.prefetch_times(self.recordings.get_recordings_times())
+        self.preload_next_video()
 
         if self.loaded_last_video:
             last_position = self.get_setting('last_video_position', 1)
@@ -320,13 +632,56 @@ class Controller:
             self.settings.update_settings(last_video_position=1)
             self.go_to(1, jumped=True)
 
+    def request_motion_index(self, compute):
+        # if compute is False this only loads a previously computed motion index
+        self.motion.request(self.video_path, self.video_length,
+                            lambda path, energy: GLib.idle_add(self.motion_energy_computed, path, energy),
+                            compute=compute)
+
+    def motion_energy_computed(self, video_path, energy):
+        if video_path != self.video_path or not self.is_video_loaded:
+            return
+
+        from motion import MotionIndex
+        self.motion_index = MotionIndex(energy)
+        LOG.info('Motion index ready, {} static seconds'.format(int(self.motion_index.static.sum())))
+        self.player.set_motion_index(self.motion_index)
+        self.signal_sender.emit('motion_index_ready')
+
+    def get_static_spans(self):
+        return self.motion_index.get_static_spans() if self.motion_index is not None else []
+
+    def skip_static_toggled(self, widget):
+        self.settings.update_settings(skip_static=widget.get_active())
+
+        if self.player is not None:
+            self.player.skip_static = widget.get_active()
+
+        if widget.get_active() and self.is_video_loaded and self.motion_index is None:
+            self.request_motion_index(compute=True)
+
+    def playback_rate_changed(self):
+        if self.narration_timeout != 0:
+            self.arm_narration_timer()
+
+    def video_reached_end(self, last_frame_time):
+        LOG.info('Video reached the end')
+
+        # the media is still loaded and paused on the last frame, so we can seek backwards straight away
+        self.signal_sender.emit('playback_changed', 'pause')
+        self.settings.update_settings(last_video_position=last_frame_time)
+        self.signal_sender.emit('video_jumped', last_frame_time)
+
     def reload_current_video(self):
         LOG.info('Reloading current video')
 
-        self.pause_video()
-        # set the last position to the end, so when we reload the video (we have to do that) is at the end
-        self.settings.update_settings(last_video_position=self.video_length)
-        self.player.load_video(self.video_path)
+        self.signal_sender.emit('playback_changed', 'pause')
+        # VLC cannot seek once the stream ended, so we open the media again, paused close to the end.
+        # The length is known already so this does not go through video_loaded again
+        last_frame_time = self.player.get_last_frame_time()
+        self.settings.update_settings(last_video_position=last_frame_time)
+        self.player.reopen_video(last_frame_time)
+        self.signal_sender.emit('video_jumped', last_frame_time)
 
     def playback_speed_selected(self, sender, speed):
         current_speed = self.get_setting('playback_speed', 1)
@@ -341,46 +696,105 @@ class Controller:
         if self.is_video_loaded:
             self.player.set_speed(speed)
 
+            if self.narration_timeout != 0:
+                self.arm_narration_timer()  # the next narration will be reached sooner or later
+
     def hold_to_record_toggled(self, widget):
         self.settings.update_settings(hold_to_record=widget.get_active())
 
+    def play_recordings_over_video_toggled(self, widget):
+        self.settings.update_settings(play_recs_over_video=widget.get_active())
+
+    def show_playback_stats_toggled(self, widget):
+        self.settings.update_settings(show_playback_stats=widget.get_active())
+
+        if self.player is not None:
+            self.player.set_show_stats(widget.get_active())
+
+    def use_proxies_toggled(self, widget):
+        self.settings.update_settings(use_proxies=widget.get_active())
+
+        if self.player is not None:
+            self.player.set_use_proxies(widget.get_active())
+
+    def review_speed_selected(self, widget, speed):
+        if not widget.get_active():
+            return
+
+        LOG.info('Review speed selected: {}'.format(speed))
+        self.settings.update_settings(review_speed=speed)
+        self.review.speed = speed
+
+    def review_skip_silence_toggled(self, widget):
+        self.settings.update_settings(review_skip_silence=widget.get_active())
+        self.review.skip_silence = widget.get_active()
+
+    def start_review(self, *args):
+        if not self.is_video_loaded or self.is_recording() or self.review.is_active:
+            return
+
+        LOG.info('Start review')
+        self.pause_video()
+        self.review.start(self.player.get_current_position())
+
+    def stop_review(self, *args):
+        if not self.review.is_active:
+            return
+
+        LOG.info('Stop review')
+        self.review.stop()
+        self.player.stop_playing_recording()
+
     def play_after_delete_toggled(self, widget):
         self.settings.update_settings(play_after_delete=widget.get_active())
 
     def play_recordings_with_video_toggled(self, widget):
         self.settings.update_settings(play_recs_with_video=widget.get_active())
 
+        if widget.get_active() and self.is_video_loaded and self.player.is_playing():
+            self.narration_position = self.player.get_current_position()
+            self.arm_narration_timer()
+        else:
+            self.cancel_narration_timer()
+
     def play_video(self, *args):
-        if not self.is_video_loaded or self.recorder.is_recording:
+        if not self.is_video_loaded or self.is_recording():
             return
 
         LOG.info("Play video")
 
         self.signal_sender.emit('playback_changed', 'play')
         self.player.play_video()
+        self.catch_up_narration_position()
+        self.arm_narration_timer()
 
     def pause_video(self, *args):
-        if not self.is_video_loaded or self.recorder.is_recording:
+        if not self.is_video_loaded or self.is_recording():
             return
 
         LOG.info("Pause video")
 
         self.signal_sender.emit('playback_changed', 'pause')
         self.player.pause_video()
+        self.cancel_narration_timer()
 
     def toggle_player_playback(self, *args):
-        if not self.is_video_loaded or self.recorder.is_recording:
+        if not self.is_video_loaded or self.is_recording():
             return
 
         LOG.info("Toggle playback")
 
+        if self.review.is_active:
+            self.stop_review()
+            return
+
         if self.player.is_playing():
             self.pause_video()
         else:
             self.play_video()
 
     def toggle_audio(self, *args):
-        if not self.is_video_loaded or self.recorder.is_recording:
+        if not self.is_video_loaded or self.is_recording():
             return
 
         LOG.info("Toggle audio")
@@ -410,7 +824,7 @@ class Controller:
             self.recordings.reset_highlighted()
 
     def start_seek(self, widget, direction):
-        if not self.is_video_loaded or self.player.is_seeking() or self.recorder.is_recording:
+        if not self.is_video_loaded or self.player.is_seeking() or self.is_recording():
             return
 
         LOG.info('Start seeking')
@@ -428,35 +842,53 @@ class Controller:
         LOG.info('Stop seeking')
 
         self.player.stop_seek()
+        self.narration_position = self.player.get_target_position() - 1
 
         if self.player.was_playing_before_seek:
             self.signal_sender.emit('playback_changed', 'play')
+            self.arm_narration_timer()
 
-    def go_to(self, time_ms, jumped=False):
-        if not self.is_video_loaded or self.recorder.is_recording:
+    def go_to(self, time_ms, jumped=False, fast=False):
+        if not self.is_video_loaded or self.is_recording():
             return
 
         if time_ms < 0 or time_ms > self.video_length:
             return
 
         self.recordings.reset_highlighted()
-        self.player.go_to(int(time_ms))
+        self.player.go_to(int(time_ms), fast=fast)
+        # a narration starting exactly where we land should be played
+        self.narration_position = int(time_ms) - 1
 
+        if self.narration_timeout != 0:
+            self.arm_narration_timer()
+
+        # seeks are scheduled, so report where the video is going rather than where it is now
         if jumped:
             # this will not highlight since it is called when clicking a narration timestamps
-            self.signal_sender.emit('video_jumped', self.player.get_current_position())
+            self.signal_sender.emit('video_jumped', self.player.get_target_position())
         else:
             # the controller is connected to this signal, so it will highlight and scroll to the narration
-            self.signal_sender.emit('video_moving', self.player.get_current_position(), self.player.is_seeking())
+            self.signal_sender.emit('video_moving', self.player.get_target_position(), self.player.is_seeking())
+
+    def has_thumbnails(self):
+        return self.is_video_loaded and self.thumbnails.has_thumbnails(self.video_path)
+
+    def get_thumbnail(self, time_ms):
+        if not self.is_video_loaded:
+            return None
+
+        return self.thumbnails.get_thumbnail(self.video_path, time_ms)
 
     def start_dragging(self):
-        if not self.is_video_loaded or self.recorder.is_recording:
+        if not self.is_video_loaded or self.is_recording():
             return
 
         LOG.info('Start dragging')
 
         self.is_dragging = True
         self.reset_highlighted_rec()
+        self.player.reset_seek_stats()
 
         if self.player.is_playing():
             self.pause_video()
@@ -465,13 +897,14 @@ class Controller:
             self.was_playing_before_dragging = False
 
     def stop_dragging(self, time_ms):
-        if not self.is_video_loaded or self.recorder.is_recording:
+        if not self.is_video_loaded or self.is_recording():
             return
 
         LOG.info('Stop dragging')
 
-        self.go_to(time_ms, jumped=True)
+        self.go_to(time_ms, jumped=True)  # precise seek to the final position
         self.is_dragging = False
+        LOG.info('Seek stats for this drag: {}'.format(self.player.get_seek_stats()))
 
         if self.was_playing_before_dragging:
             self.play_video()
@@ -484,15 +917,92 @@ class Controller:
 
         self.highlight_recording(sender, time_ms, is_seeking)
 
-        if self.get_setting('play_recs_with_video', False) \
-                and self.highlighted_rec is not None \
-                and not is_seeking \
-                and not self.is_dragging \
-                and self.last_played_rec != self.highlighted_rec:
+        # the timer is armed only while playing with recordings, this catches anything the timer did not
+        if self.narration_timeout != 0 and not is_seeking and not self.is_dragging:
+            self.play_crossed_narrations(time_ms)
+
+    def arm_narration_timer(self):
+        # instead of checking every position update, we wake up when the playhead reaches the next narration
+        self.cancel_narration_timer()
+
+        if not self.is_video_loaded or self.rec_played_with_video or \
+                not self.get_setting('play_recs_with_video', False):
+            return
+
+        position = self.player.get_current_position()
+
+        if self.narration_position is None:
+            self.narration_position = position - 1
+
+        next_rec = self.recordings.get_next_recording(self.narration_position)
+
+        if next_rec is None:
+            return
+
+        delay = max(0, next_rec - position) / max(0.1, self.player.get_speed())
+        self.narration_timeout = GLib.timeout_add(max(1, int(delay)), self.narration_timer_fired)
+
+    def catch_up_narration_position(self, time_ms=None):
+        # the position only moves while the timer is armed, so narrations we went past with the timer off (e.g. while
+        # recording, or with the setting off) count as played rather than being played all at once now
+        # the target rather than the current position, which is still the old one right after a seek
+        position = max(self.player.get_target_position() - 1, -1 if time_ms is None else time_ms)
+
+        if self.narration_position is None or self.narration_position < position:
+            self.narration_position = position
+
+    def cancel_narration_timer(self):
+        if self.narration_timeout != 0:
+            GLib.source_remove(self.narration_timeout)
+            self.narration_timeout = 0
+
+    def narration_timer_fired(self):
+        self.narration_timeout = 0
+
+        if self.player.is_playing():
+            self.play_crossed_narrations(self.player.get_current_position())
+
+            if not self.rec_played_with_video:
+                self.arm_narration_timer()  # the timer fired a bit early, or there are more narrations ahead
+
+        return False
+
+    def play_crossed_narrations(self, time_ms):
+        if self.player.is_seek_pending():
+            return  # the position might still be the one before the seek
+
+        if self.narration_position is None or time_ms < self.narration_position:
+            # we moved backwards without going through go_to, start again from here
+            self.narration_position = time_ms
+            return
+
+        crossed = self.recordings.get_recordings_between(self.narration_position, time_ms)
+        self.narration_position = time_ms
+
+        if not crossed:
+            return
+
+        if self.get_setting('play_recs_over_video', False):
+            # keep the video going and mix the narrations over it, queueing the ones that overlap
+            self.narrations_to_play.extend(crossed)
+
+            if not self.rec_played_over_video:
+                self.rec_played_over_video = True
+                self.player.duck_video_audio()
+                self.play_next_narration()
+        else:
+            # play all the narrations we went past, in order, then resume the video
+            self.narrations_to_play = list(crossed)
             self.rec_played_with_video = True
-            self.last_played_rec = self.highlighted_rec
             self.pause_video()
-            self.play_recording(self.highlighted_rec)
+            self.play_next_narration()
+
+    def play_next_narration(self):
+        rec_time = self.narrations_to_play.pop(0)
+        self.last_played_rec = rec_time
+        self.highlighted_rec = rec_time
+        self.signal_sender.emit('set_highlighted_rec', rec_time, False)
+        self.play_recording(rec_time)
 
     def highlight_recording(self, sender, time_ms, is_seeking):
         if is_seeking or self.is_dragging:
@@ -504,7 +1014,9 @@ class Controller:
             elif self.highlighted_rec is not None:
                 self.reset_highlighted_rec()
         else:
-            rec = self.recordings.get_next_from_highlighted(time_ms)
+            # position updates are further apart (in video time) at high speeds, so look further ahead
+            neighbourhood = 500 * max(1, self.player.get_speed())
+            rec = self.recordings.get_next_from_highlighted(time_ms, neighbourhood=neighbourhood)
 
             if rec is not None:
                 self.highlighted_rec = rec
@@ -518,7 +1030,7 @@ class Controller:
         LOG.info("Record button pressed")
 
         if self.get_setting('hold_to_record', False):
-            if not self.holding_enter and not self.recorder.is_recording:
+            if not self.holding_enter and not self.is_recording():
                 self.holding_enter = True
                 self.start_recording()
         else:
@@ -531,18 +1043,25 @@ class Controller:
         LOG.info("Record button released")
 
         if self.get_setting('hold_to_record', False):
-            if self.recorder.is_recording:
+            if self.is_recording():
                 self.invoke_stop_recording()
 
     def toggle_record(self):
         LOG.info("Toggle recording")
 
-        if not self.recorder.is_recording:
+        if not self.is_recording():
             self.start_recording()
         else:
             self.invoke_stop_recording()
 
     def start_recording(self, overwrite=False, rec_time=None):
+        if self.recorder is None:
+            LOG.warning('Cannot record, the microphone is not ready yet')
+            self.holding_enter = False
+            return
+
+        self.stop_review()
+
         # first start the recording and then update the ui to prevent clipping
         if self.player.is_playing():
             self.pause_video()
@@ -569,6 +1088,8 @@ class Controller:
 
         self.recorder.start_recording(path)
         self.highlighted_rec = rec_time
+        # the narration we are recording must not be played back as soon as the video plays again
+        self.catch_up_narration_position(None if overwrite else rec_time)
 
         if overwrite:
             self.signal_sender.emit('set_highlighted_rec', rec_time, True)
@@ -583,22 +1104,49 @@ class Controller:
         GLib.timeout_add(self.stop_recording_delay_ms, self.stop_recording)
 
     def stop_recording(self):
-        self.recorder.stop_recording()
+        rec_time = self.highlighted_rec
+        self.recordings_being_saved.add(rec_time)
+        # the capture process closes the file without holding up the ui, what needs the file waits for its statistics
+        self.recorder.stop_recording(lambda stats: GLib.idle_add(self.recording_saved, rec_time, stats))
+        self.catch_up_narration_position(self.player.get_current_position())
 
         LOG.info("Recording stopped")
         self.signal_sender.emit('recording_state_changed', 'not_recording')
         self.reset_highlighted_rec()
         self.holding_enter = False
+        self.update_recorder_profile()
 
         if self.was_playing_before_recording:
             self.play_video()
 
         return False  # reset the GLib timer
 
+    def recording_saved(self, rec_time, stats):
+        self.recordings_being_saved.discard(rec_time)
+
+        if stats is not None:
+            self.save_narration_stats(rec_time, stats)
+
+        self.refresh_waveform(rec_time)
+        return False
+
+    def save_narration_stats(self, rec_time, stats):
+        # the statistics are kept with the narration, so bad takes are flagged without reading the audio again
+        if rec_time is None or not self.recordings.recording_exists(rec_time):
+            return
+
+        self.recordings.set_metadata(rec_time, **stats)
+        issues = self.recordings.get_issues(rec_time)
+
+        if issues:
+            LOG.warning('Recording at {}ms has issues: {}'.format(rec_time, ', '.join(issues)))
+
+        self.signal_sender.emit('narration_checked', rec_time)
+
     def overwrite_recording(self, time_ms):
         LOG.info('Overwriting recording at {}ms'.format(time_ms))
 
-        if self.recorder.is_recording:
+        if self.is_recording():
             return
 
         if self.player.is_playing():
@@ -625,9 +1173,14 @@ class Controller:
         if time_ms == self.highlighted_rec:
             self.reset_highlighted_rec()
 
-        if self.recorder.is_recording:
+        if self.is_recording():
             self.stop_recording()
 
+        recording_path = self.recordings.get_path_for_recording(time_ms)
+
+        if recording_path is not None:
+            self.waveforms.discard(recording_path)
+
         self.recordings.delete_recording(time_ms)
         self.signal_sender.emit('recording_deleted', time_ms)
 
@@ -638,13 +1191,63 @@ class Controller:
         if not self.is_video_loaded:
             return
 
-        if self.rec_played_with_video:
-            self.play_video()
-            self.rec_played_with_video = False
+        if self.review.is_active:
+            self.review.play_next()
+            return
+
+        if self.rec_played_with_video or self.rec_played_over_video:
+            if self.narrations_to_play:
+                self.play_next_narration()
+                return
+
+            if self.rec_played_over_video:
+                self.rec_played_over_video = False
+                self.player.restore_video_audio()
+            else:
+                self.rec_played_with_video = False
+                self.play_video()
 
     def get_recording_times(self):
         return self.recordings.get_recordings_times()
 
+    def get_waveform(self, rec_time):
+        # never blocks: if the waveform is not in memory it will be loaded or computed in the background and
+        # `waveform_ready` will be emitted when done
+        if self.recordings is None:
+            return None
+
+        recording_path = self.recordings.get_path_for_recording(rec_time)
+
+        if recording_path is None or (self.is_recording() and rec_time == self.highlighted_rec) or \
+                rec_time in self.recordings_being_saved:
+            return None  # the file is still being written
+
+        waveform = self.waveforms.get(recording_path)
+
+        if waveform is None:
+            self.waveforms.request(recording_path,
+                                   lambda path, _: GLib.idle_add(self.waveform_computed, rec_time, path))
+
+        return waveform
+
+    def get_narration_issues(self, rec_time):
+        return self.recordings.get_issues(rec_time) if self.recordings is not None else []
+
+    def refresh_waveform(self, rec_time):
+        if rec_time is None or self.recordings is None:
+            return
+
+        recording_path = self.recordings.get_path_for_recording(rec_time)
+
+        if recording_path is not None:
+            self.waveforms.discard(recording_path)
+            self.get_waveform(rec_time)
+
+    def waveform_computed(self, rec_time, recording_path):
+        # recordings might have been reset or deleted while computing the waveform
+        if self.recordings is not None and self.recordings.get_path_for_recording(rec_time) == recording_path:
+            self.signal_sender.emit('waveform_ready', rec_time)
+
     def main_window_key_pressed(self, widget, event):
         if not self.is_video_loaded:
             return True
@@ -664,9 +1267,10 @@ class Controller:
             # this will be set to False when actually finishing the recording
             self.holding_enter = True
             LOG.info("Pressing enter")
+            self.update_recorder_profile()  # we are about to record
 
             if self.get_setting('hold_to_record', False):
-                if not self.recorder.is_recording:
+                if not self.is_recording():
                     self.start_recording()
         else:
             pass
@@ -684,7 +1288,7 @@ class Controller:
             LOG.info("Enter released")
 
             if self.get_setting('hold_to_record', False):
-                if self.recorder.is_recording:
+                if self.is_recording():
                     self.invoke_stop_recording()
             else:
                 self.toggle_record()
@@ -3,16 +3,14 @@ import faulthandler
 import logging
 import os
 import sys
+import threading
 from logging.handlers import RotatingFileHandler
 
-from controller import Controller
-from recorder import Recorder
 from settings import Settings
-from ui import MainWindow, HelpWindow
+from startup import PROFILER
 
-import gi
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk
+# GTK, VLC, numpy and the audio libraries are imported in main(), so that --help and --profile-startup are quick
+# and the import time shows up in the startup profile
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 LOG = logging.getLogger('epic_narrator')
@@ -40,6 +38,15 @@ parser.add_argument('--verbosity',
                     help="Logging verbosity, one of 'debug', 'info', 'warning', "
                          "'error', 'critical'.")
 parser.add_argument('--log-file', type=str, help='Path to log file.')
+parser.add_argument('--profile-startup', action='store_true',
+                    help='Print how long each phase of the startup takes')
+parser.add_argument('--narrations-report', type=str, metavar='OUTPUT_PATH',
+                    help='Print a CSV report of the narrations saved under the given output path, with the levels '
+                         'of every narration and whether it clipped, is too quiet or has dropouts')
+parser.add_argument('--vlc-option',
+                    action='append', default=[], dest='vlc_options', metavar='OPTION',
+                    help="Extra option for VLC, e.g. '--vlc-option=--avcodec-hw=none'. "
+                         "Can be given multiple times.")
 
 
 def get_os():
@@ -54,29 +61,69 @@ def get_os():
 
 
 def main(args):
+    if args.profile_startup:
+        PROFILER.enable()
+
+    PROFILER.mark('interpreter and arguments')
     setup_logging(args)
-    commit_hash = get_git_commit_hash()
-    LOG.info("Starting the EPIC-narrator" +
-             (" ({})".format(commit_hash) if commit_hash is not None else ""))
+    LOG.info("Starting the EPIC-narrator")
+    # git can take a while on some systems, the commit is only needed for the log
+    threading.Thread(target=log_git_commit_hash, name='git-hash', daemon=True).start()
 
     if args.query_audio_devices:
+        from recorder import Recorder
         print(Recorder.get_devices())
         exit()
 
+    if args.narrations_report is not None:
+        from recordings import Recordings
+        recordings_path = Recordings.get_recordings_path(args.narrations_report)
+
+        if not os.path.isdir(recordings_path):
+            print('No narrations found under {}: {} does not exist'.format(args.narrations_report, recordings_path),
+                  file=sys.stderr)
+            exit(1)
+
+        Recordings.write_report(args.narrations_report, sys.stdout)
+        exit()
+
     if args.set_audio_device >= 0:
+        from recorder import Recorder
         LOG.info('Changing default mic device to {}'.format(args.set_audio_device))
         Recorder.set_default_device(args.set_audio_device)
 
+    PROFILER.mark('logging and settings')
+
+    import gi
+    gi.require_version('Gtk', '3.0')
+    from gi.repository import Gtk, GLib
+    from controller import Controller
+    from ui import MainWindow
+    PROFILER.mark('imports')
+
     this_os = get_os()
     single_window = this_os in ['linux', 'windows']
 
-    controller = Controller(this_os)
+    controller = Controller(this_os, vlc_options=args.vlc_options)
+    PROFILER.mark('controller created')
     main_window = MainWindow(controller, this_os, single_window=single_window)
+    PROFILER.mark('main window created')
     main_window.show()
 
+    # the microphone is opened and the caches are created once the window is up
+    GLib.idle_add(controller.setup_recorder)
+    GLib.idle_add(controller.setup_caches)
+
     Gtk.main()
 
 
+def log_git_commit_hash():
+    commit_hash = get_git_commit_hash()
+
+    if commit_hash is not None:
+        LOG.info("Running commit {}".format(commit_hash))
+
+
 def get_git_commit_hash():
     import subprocess
 
@@ -0,0 +1,135 @@
+import math
+import multiprocessing
+
+import numpy as np
+
+
+def to_db(level, floor_db=-120):
+    return round(20 * math.log10(level), 1) if level > 10 ** (floor_db / 20) else floor_db
+
+
+class LevelMeter:
+    """
+    Peak, RMS and clipped samples of every channel, accumulated by the audio callback block after block in a small
+    fixed array, and read by the monitor. The array is a RawArray so it can be shared with the capture process.
+
+    There is no lock. The callback is the only writer and marks the levels as being written by making the sequence
+    number odd, the monitor reads them again if they changed while it was reading. The monitor never writes: the sums
+    only grow and it subtracts the ones it saw at its previous read, and the peaks of the last `history` blocks are
+    kept so it can take the highest since then. A monitor that reads less often than every `history` blocks gets the
+    peak of the last `history` blocks only.
+    """
+
+    # header: sequence, blocks accumulated since the start
+    SEQUENCE, BLOCKS = range(2)
+    # per channel, since the start: sum of squares, frames, clipped samples
+    SUM_SQUARES, FRAMES, CLIPS = range(3)
+
+    def __init__(self, n_channels, clip_level=0.999, history=64, context=multiprocessing):
+        self.n_channels = n_channels
+        self.clip_level = clip_level
+        self.history = history
+        self.buffer = context.RawArray('d', 2 + (3 + history) * n_channels)
+        self._arrays = None
+        # what the reader saw at its previous read
+        self._last_blocks = 0
+        self._last_totals = np.zeros((3, n_channels))
+
+    def __getstate__(self):
+        # the numpy views are created again on the other side of the process
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    def get_arrays(self):
+        if self._arrays is None:
+            values = np.frombuffer(self.buffer, dtype=np.float64)
+            totals = values[2:2 + 3 * self.n_channels].reshape(3, self.n_channels)
+            peaks = values[2 + 3 * self.n_channels:].reshape(self.history, self.n_channels)
+            self._arrays = values[:2], totals, peaks
+
+        return self._arrays
+
+    def add_block(self, block):
+        """Called from the audio callback with a (frames, channels) block"""
+        header, totals, peaks = self.get_arrays()
+        magnitudes = np.abs(block)
+        header[self.SEQUENCE] += 1
+        # block n goes in the slot n % history of the peaks
+        peaks[int(header[self.BLOCKS]) % self.history] = magnitudes.max(axis=0)
+        totals[self.SUM_SQUARES] += np.einsum('ij,ij->j', block, block)
+        totals[self.FRAMES] += len(block)
+        totals[self.CLIPS] += np.count_nonzero(magnitudes >= self.clip_level, axis=0)
+        header[self.BLOCKS] += 1
+        header[self.SEQUENCE] += 1
+
+    def read(self):
+        """
+        Returns the levels since the previous read as a dict of per channel arrays (peak, rms and clips), or None if
+        no block was added since then
+        """
+        header, totals, peaks = self.get_arrays()
+
+        while True:
+            sequence = header[self.SEQUENCE]
+            n_blocks = int(header[self.BLOCKS])
+            totals_snapshot = totals.copy()
+            peaks_snapshot = peaks.copy()
+
+            if sequence % 2 == 0 and sequence == header[self.SEQUENCE]:
+                break
+
+        n_new = min(n_blocks - self._last_blocks, self.history)
+        levels = totals_snapshot - self._last_totals
+        self._last_blocks = n_blocks
+        self._last_totals = totals_snapshot
+
+        if n_new <= 0:
+            return None
+
+        slots = np.arange(n_blocks - n_new, n_blocks) % self.history
+        frames = np.maximum(levels[self.FRAMES], 1)
+
+        return dict(peak=peaks_snapshot[slots].max(axis=0), rms=np.sqrt(np.maximum(levels[self.SUM_SQUARES], 0) / frames),
+                    clips=np.rint(levels[self.CLIPS]).astype(int))
+
+
+class TakeStats:
+    """
+    Peak, RMS and clipped samples of a whole recording, over all its channels, accumulated block after block as it
+    is written so we know straight away if the take is any good, without reading it again. The pauses between words
+    would drag the RMS of the whole take down, so the RMS of the blocks above `voice_gate_db` (i.e. while the
+    narrator speaks) is computed too.
+    """
+
+    def __init__(self, clip_level=0.999, voice_gate_db=-50):
+        self.clip_level = clip_level
+        self.voice_gate = 10 ** (voice_gate_db / 20)
+        self.peak = 0
+        self.sum_squares = 0
+        self.n_samples = 0
+        self.voiced_sum_squares = 0
+        self.n_voiced_samples = 0
+        self.clipped = 0
+
+    def add_block(self, block):
+        if block.size == 0:
+            return
+
+        magnitudes = np.abs(block)
+        samples = block.reshape(-1)
+        self.peak = max(self.peak, float(magnitudes.max()))
+        sum_squares = float(np.dot(samples, samples))
+        self.sum_squares += sum_squares
+        self.n_samples += block.size
+        self.clipped += int(np.count_nonzero(magnitudes >= self.clip_level))
+
+        if sum_squares >= self.voice_gate ** 2 * block.size:
+            self.voiced_sum_squares += sum_squares
+            self.n_voiced_samples += block.size
+
+    def get_stats(self):
+        rms = math.sqrt(self.sum_squares / self.n_samples) if self.n_samples else 0
+        voiced_rms = math.sqrt(self.voiced_sum_squares / self.n_voiced_samples) if self.n_voiced_samples else 0
+        return dict(peak_db=to_db(self.peak), rms_db=to_db(rms), voiced_rms_db=to_db(voiced_rms),
+                    clipped=self.clipped)
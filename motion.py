@@ -0,0 +1,191 @@
+import argparse
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+
+from background import BackgroundWorker, get_file_hash
+from settings import Settings
+
+LOG = logging.getLogger('epic_narrator.motion')
+
+
+class MotionIndex:
+    """Per-second motion energy of a video, with the spans considered static"""
+
+    def __init__(self, energy, threshold=None, min_static_s=3):
+        self.energy = energy
+        # egocentric videos always move a bit, so the threshold is relative to the typical motion of the video itself
+        if threshold is None:
+            threshold = 0.25 * float(np.percentile(energy, 90)) if len(energy) else 0
+
+        self.threshold = threshold
+        self.min_static_s = min_static_s
+        self.static = self.compute_static_mask()
+
+    def compute_static_mask(self):
+        low = self.energy < self.threshold
+        static = np.zeros(len(low), dtype=bool)
+
+        for start, end in self.get_runs(low):
+            if end - start >= self.min_static_s:
+                static[start:end] = True
+
+        return static
+
+    @staticmethod
+    def get_runs(mask):
+        # start (inclusive) and end (exclusive) indices of the runs of True values
+        padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+        edges = np.flatnonzero(np.diff(padded))
+        return list(zip(edges[0::2], edges[1::2]))
+
+    def is_static(self, time_ms):
+        second = int(time_ms // 1000)
+        return 0 <= second < len(self.static) and bool(self.static[second])
+
+    def get_static_spans(self):
+        return [(int(start) * 1000, int(end) * 1000) for start, end in self.get_runs(self.static)]
+
+
+class MotionAnalyzer:
+    """
+    Computes the motion energy of each second of a video, as the mean absolute difference of consecutive downscaled
+    grey frames decoded by ffmpeg. The video is split in chunks analysed in a process pool, and the result is cached
+    per video file under the narrator directory.
+    """
+
+    def __init__(self, fps=4, width=64, height=36, min_chunk_s=60, workers=None):
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.min_chunk_s = min_chunk_s
+        self.workers = workers if workers is not None else max(1, (os.cpu_count() or 2) - 1)
+        self.ffmpeg = shutil.which('ffmpeg')
+        self.cache_folder = os.path.join(Settings.get_epic_narrator_directory(), 'motion')
+        self._lock = threading.Lock()
+        self._worker = BackgroundWorker(self.load_or_compute, 'motion-analyzer',
+                                        'Could not analyse motion in {}, its static parts will not be skipped',
+                                        log=LOG, lock=self._lock)
+
+        if self.ffmpeg is None:
+            LOG.warning('ffmpeg not found, motion analysis will not be available')
+        else:
+            self._worker.start()
+
+    def is_available(self):
+        return self.ffmpeg is not None
+
+    def get_cache_path(self, video_path):
+        key = get_file_hash(video_path, self.fps, '{}x{}'.format(self.width, self.height))
+        return os.path.join(self.cache_folder, '{}.npy'.format(key))
+
+    def load(self, video_path):
+        cache_path = self.get_cache_path(video_path)
+        return np.load(cache_path) if os.path.exists(cache_path) else None
+
+    def request(self, video_path, video_length, callback, compute=True):
+        """
+        Loads (or computes, if `compute` is True) the motion energy in the background, calling
+        `callback(video_path, energy)` from a worker thread
+        """
+        if not self.is_available() or (not compute and not os.path.exists(self.get_cache_path(video_path))):
+            return
+
+        self._worker.request(video_path, callback, video_length)
+
+    def load_or_compute(self, video_path, video_length):
+        energy = self.load(video_path)
+        return energy if energy is not None else self.compute(video_path, video_length)
+
+    def compute(self, video_path, video_length):
+        """Returns the motion energy of each second of the video, or None if its length is not known"""
+        duration_s = int(math.ceil((video_length or 0) / 1000))
+
+        if duration_s <= 0:
+            LOG.info('The length of {} is not known, not analysing its motion'.format(video_path))
+            return None
+
+        n_chunks = max(1, min(self.workers * 4, duration_s // self.min_chunk_s))
+        chunk_s = int(math.ceil(duration_s / n_chunks))
+        chunks = [(start, min(chunk_s, duration_s - start)) for start in range(0, duration_s, chunk_s)]
+        LOG.info('Analysing motion in {} ({} chunks, {} workers)'.format(video_path, len(chunks), self.workers))
+
+        energy = np.full(duration_s, np.nan, dtype=np.float32)
+        # spawn rather than fork, forking a process with GTK and VLC threads running is not safe
+        context = multiprocessing.get_context('spawn')
+
+        # a pool of the context rather than ProcessPoolExecutor(mp_context=...), which needs Python 3.7
+        with context.Pool(processes=self.workers) as pool:
+            results = [pool.apply_async(compute_chunk_energy, (self.ffmpeg, video_path, start, length, self.fps,
+                                                               self.width, self.height)) for start, length in chunks]
+
+            for (start, length), result in zip(chunks, results):
+                chunk_energy = result.get()
+                n = min(len(chunk_energy), length)
+                energy[start:start + n] = chunk_energy[:n]
+
+        # seconds without frames (e.g. chunk boundaries) take the value of the previous second
+        for i in np.flatnonzero(np.isnan(energy)):
+            energy[i] = energy[i - 1] if i > 0 and not np.isnan(energy[i - 1]) else 0
+
+        os.makedirs(self.cache_folder, exist_ok=True)
+        np.save(self.get_cache_path(video_path), energy)
+        LOG.info('Motion analysis of {} done'.format(video_path))
+
+        return energy
+
+
+def compute_chunk_energy(ffmpeg, video_path, start_s, length_s, fps, width, height):
+    # this runs in a worker process
+    output = subprocess.run([ffmpeg, '-nostdin', '-v', 'error', '-ss', str(start_s), '-t', str(length_s),
+                             '-i', video_path, '-vf', 'fps={},scale={}:{},format=gray'.format(fps, width, height),
+                             '-f', 'rawvideo', '-'],
+                            check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    frame_size = width * height
+    n_frames = len(output.stdout) // frame_size
+    energy = np.full(length_s, np.nan, dtype=np.float32)
+
+    if n_frames < 2:
+        return energy
+
+    frames = np.frombuffer(output.stdout, dtype=np.uint8, count=n_frames * frame_size).reshape(n_frames, frame_size)
+    diffs = np.abs(np.diff(frames.astype(np.int16), axis=0)).mean(axis=1)
+
+    # average the differences falling in each second
+    seconds = np.minimum((np.arange(1, n_frames) // fps).astype(np.int64), length_s - 1)
+    sums = np.bincount(seconds, weights=diffs, minlength=length_s)
+    counts = np.bincount(seconds, minlength=length_s)
+    has_frames = counts > 0
+    energy[has_frames] = sums[has_frames] / counts[has_frames]
+
+    return energy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute and cache the motion energy of videos, so the narrator '
+                                                 'can skip their static parts')
+    parser.add_argument('videos', nargs='+', help='Videos to analyse')
+    args = parser.parse_args()
+    analyzer = MotionAnalyzer()
+
+    for path in args.videos:
+        energy = analyzer.load(path)
+
+        if energy is None:
+            duration = subprocess.run([shutil.which('ffprobe'), '-v', 'error', '-show_entries', 'format=duration',
+                                       '-of', 'default=noprint_wrappers=1:nokey=1', path],
+                                      check=True, stdout=subprocess.PIPE).stdout
+            energy = analyzer.compute(path, int(float(duration) * 1000))
+
+        if energy is None:
+            print('{}: empty video'.format(path))
+            continue
+
+        index = MotionIndex(energy)
+        print('{}: {} static seconds out of {}'.format(path, int(index.static.sum()), len(index.static)))
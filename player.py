@@ -1,22 +1,100 @@
 import ctypes
 import logging
 import threading
+import time
 
 import vlc
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import GLib
+from prefetch import ReadAheadPrefetcher
+from probe import MediaProbe
+from proxies import ProxyCache
+from seeking import SeekScheduler, get_seek_step
 
 LOG = logging.getLogger('epic_narrator.player')
 
+
+class PlaybackStats:
+    """
+    Samples the input, demux, decoding and rendering statistics of the media played by VLC, turning the counters into
+    rates since the previous sample. Comparing decoded, displayed and lost frames tells whether a choppy playback is
+    demux, decode or display bound.
+    """
+
+    counters = ('read_bytes', 'demux_read_bytes', 'demux_corrupted', 'demux_discontinuity', 'decoded_video',
+                'displayed_pictures', 'lost_pictures', 'lost_abuffers')
+
+    def __init__(self):
+        self.previous = None
+        self.previous_time = None
+        self.last_sample = None
+
+    def reset(self):
+        self.previous = None
+        self.previous_time = None
+        self.last_sample = None
+
+    def sample(self, media):
+        stats = vlc.MediaStats()
+
+        if media is None or not media.get_stats(stats):
+            return None
+
+        now = time.monotonic()
+        totals = {name: getattr(stats, name) for name in self.counters}
+        # VLC gives bitrates in bytes per microsecond
+        sample = dict(totals, input_kbps=stats.input_bitrate * 8000, demux_kbps=stats.demux_bitrate * 8000,
+                      decoded_fps=0, displayed_fps=0, lost_fps=0)
+
+        # counters start from 0 again when the media is opened again
+        if self.previous is not None and totals['decoded_video'] >= self.previous['decoded_video']:
+            elapsed = now - self.previous_time
+
+            if elapsed > 0:
+                sample['decoded_fps'] = (totals['decoded_video'] - self.previous['decoded_video']) / elapsed
+                sample['displayed_fps'] = (totals['displayed_pictures'] - self.previous['displayed_pictures']) / elapsed
+                sample['lost_fps'] = (totals['lost_pictures'] - self.previous['lost_pictures']) / elapsed
+
+        self.previous = totals
+        self.previous_time = now
+        self.last_sample = sample
+
+        return sample
+
+    @staticmethod
+    def format(sample):
+        return 'decoded {decoded_fps:.1f} fps, displayed {displayed_fps:.1f} fps, lost {lost_fps:.1f} fps ' \
+               '({lost_pictures} total), input {input_kbps:.0f} kb/s, demux {demux_kbps:.0f} kb/s, ' \
+               'corrupted {demux_corrupted}, discontinuities {demux_discontinuity}'.format(**sample)
+
+
 class Player:
-    def __init__(self, widget, controller):
-        LOG.info('Creating VLC player')
+    def __init__(self, widget, controller, vlc_options=()):
+        LOG.info('Creating VLC player (options: {})'.format(' '.join(vlc_options)))
         self.controller = controller
-        self.vlc_instance = vlc.Instance('--no-xlib')
+        self.vlc_instance = vlc.Instance('--no-xlib', *vlc_options)
         self.video_player = self.vlc_instance.media_player_new()
         self.rec_player = self.vlc_instance.media_player_new()
+        self.media_probe = MediaProbe(self.vlc_instance)
+        self.proxies = ProxyCache()
+        self.use_proxies = False  # play low resolution proxies of the videos, when available
+        self.video_path = None
+        self.media_path = None  # what VLC is playing, either the video or its proxy
+        self.video_info = None
         self.video_length = 0
+        self._waiting_for_media = False
+        self.pause_at_end = True  # pause on the last frame instead of letting VLC end the stream
+        self.ducking_ratio = 0.3  # video volume while a narration is played over it
+        self.fast_decoding_speed = 2  # above this speed the decoder is allowed to skip work and drop frames
+        self._fast_decoding = False
+        self._resume_after_reopen = False
+        self.motion_index = None
+        self.skip_static = False  # play static parts of the video (according to the motion index) faster
+        self.skip_static_speed = 4
+        self._speed_before_skip = None
+        self._volume_before_ducking = None
+        self._end_timeout = 0
         self.set_vlc_window(widget, controller.this_os)
         self.mute_video()
         self._seeking_timeout = 0
@@ -25,6 +103,19 @@ class Player:
         self.is_dragging = False
         self.seek_refresh = 50  # milliseconds
         self.seek_step = 500  # milliseconds
+        self.seek_max_step = 60000  # milliseconds
+        self.seek_doubling_time = 1  # seconds, the step doubles every time the key is held for this long
+        self._seek_started = None
+        self._seek_direction = 1
+        self._seek_target = 0
+        self.seek_scheduler = SeekScheduler(self.set_time, GLib.timeout_add, GLib.source_remove)
+        self._moving_pending = False
+        self.media = None
+        self.prefetcher = ReadAheadPrefetcher()
+        self.stats = PlaybackStats()
+        self.stats_interval_ms = 1000
+        self.show_stats = False  # show the playback statistics over the video
+        self._stats_timeout = 0
 
         # from lib vlc documentation. Make sure you don't use wait anywhere in the program
         '''
@@ -42,6 +133,7 @@ class Player:
         main_events.event_attach(vlc.EventType.MediaPlayerPositionChanged, self.video_moving_handler)
         main_events.event_attach(vlc.EventType.MediaPlayerEndReached, self.video_ended_handler)
         main_events.event_attach(vlc.EventType.MediaPlayerLengthChanged, self.video_loaded_handler)
+        main_events.event_attach(vlc.EventType.MediaPlayerPaused, self.video_loaded_handler)
 
         rec_events = self.rec_player.event_manager()
         rec_events.event_attach(vlc.EventType.MediaPlayerStopped, self.finished_playing_recording_handler)
@@ -82,24 +174,178 @@ class Player:
         self.rec_player.stop()
         self.vlc_instance.release()
 
-    def load_video(self, video_path):
+    def load_video(self, video_path, start_time_ms=0):
         LOG.info('Loading video {} (thread={})'.format(video_path, threading.current_thread().getName()))
-        media = self.vlc_instance.media_new_path(video_path)
-        self.video_player.set_mrl(media.get_mrl())
-        self.play_video()  # we need to play the video for a while to get the length in milliseconds
+        self.video_path = video_path
+        self.media_path = self.get_media_path(video_path)
+        self.video_info = None
+        self._waiting_for_media = True
+        self.open_media(start_time_ms)
+        # duration, fps and resolution come from the probe (cached per file), no need to play the video to get them
+        self.media_probe.probe(video_path, self.video_probed_handler)
+
+    def get_media_path(self, video_path):
+        proxy_path = self.proxies.get_proxy(video_path) if self.use_proxies else None
+
+        if proxy_path is not None:
+            LOG.info('Playing proxy {} for {}'.format(proxy_path, video_path))
+
+        return proxy_path if proxy_path is not None else video_path
+
+    def set_use_proxies(self, use_proxies):
+        self.use_proxies = use_proxies
+
+        if self.video_length <= 0:
+            return  # the video will be played (or the proxy requested) once loaded
+
+        if use_proxies:
+            self.request_proxy()
+
+        self.switch_media(self.get_media_path(self.video_path))
+
+    def request_proxy(self):
+        self.proxies.request(self.video_path,
+                             lambda video_path, proxy_path: GLib.idle_add(self.proxy_ready, video_path, proxy_path))
+
+    def proxy_ready(self, video_path, proxy_path):
+        if video_path == self.video_path and self.use_proxies and self.video_length > 0:
+            self.switch_media(proxy_path)
+
+    def switch_media(self, media_path):
+        if media_path == self.media_path:
+            return
+
+        # the proxy has the same timeline as the video, so we just carry on from the same position
+        LOG.info('Switching to {} (thread={})'.format(media_path, threading.current_thread().getName()))
+        self.media_path = media_path
+        self.prefetcher.set_video(media_path, self.video_length)
+        self._resume_after_reopen = self.video_player.is_playing()
+        self.reopen_video(self.get_current_position())
+
+    def open_media(self, start_time_ms=0):
+        media = self.vlc_instance.media_new_path(self.media_path)
+        # open the video paused on the first frame to show, rather than playing it and pausing it afterwards
+        media.add_option(':start-paused')
+
+        if start_time_ms > 0:
+            media.add_option(':start-time={:.3f}'.format(start_time_ms / 1000))
+
+        # late frames are dropped anyway, at high speeds we also let the decoder skip non-reference frames and
+        # the loop filter. These are read when the decoder is created, so they need the media to be opened again
+        media.add_option(':drop-late-frames')
+        media.add_option(':skip-frames')
+
+        if self._fast_decoding:
+            media.add_option(':avcodec-hurry-up')
+            media.add_option(':avcodec-skip-frame=1')
+            media.add_option(':avcodec-skiploopfilter=4')
+
+        self.media = media
+        self.stats.reset()
+        self.video_player.set_media(media)
+        self.video_player.play()
+
+    def reopen_video(self, time_ms):
+        LOG.info('Reopening video at {}ms (thread={})'.format(time_ms, threading.current_thread().getName()))
+        # we know the length and media info already, so this only opens the media again
+        self.open_media(time_ms)
+
+    def video_probed_handler(self, video_path, media_info):
+        GLib.idle_add(self.video_probed, video_path, media_info)
+
+    def video_probed(self, video_path, media_info):
+        if video_path != self.video_path:
+            return  # another video has been loaded meanwhile
+
+        LOG.info('Video probed: {} (thread={})'.format(media_info, threading.current_thread().getName()))
+        self.video_info = media_info
+        self.check_video_loaded()
 
     def video_loaded_handler(self, *args):
-        GLib.idle_add(self.video_loaded)
+        GLib.idle_add(self.check_video_loaded)
+
+    def check_video_loaded(self):
+        if self._resume_after_reopen and self.video_player.get_state() == vlc.State.Paused:
+            self._resume_after_reopen = False
+            self.play_video()
+            return
+
+        # the video is loaded once VLC opened it (paused) and we know its length, either from the probe or from VLC
+        if not self._waiting_for_media or self.video_player.get_state() not in (vlc.State.Paused, vlc.State.Playing):
+            return
 
-    def video_loaded(self):
+        if self.video_info is not None and self.video_info.duration_ms > 0:
+            video_length = self.video_info.duration_ms
+        else:
+            video_length = self.video_player.get_length()
+
+        if video_length <= 0:
+            return  # we will get another event when VLC knows the length
+
+        self._waiting_for_media = False
+        self.video_loaded(video_length)
+
+    def video_loaded(self, video_length):
         LOG.info('Video loaded (thread={})'.format(threading.current_thread().getName()))
-        self.pause_video()
-        self.video_length = self.get_video_length()
+
+        if self.video_player.is_playing():
+            self.pause_video()  # in case this VLC version does not support start-paused
+
+        self.video_length = video_length
+        self.prefetcher.set_video(self.media_path, video_length)
+
+        if self.use_proxies and self.media_path == self.video_path:
+            self.request_proxy()
+
+        if self._stats_timeout == 0:
+            self._stats_timeout = GLib.timeout_add(self.stats_interval_ms, self.sample_stats)
+
         self.controller.video_loaded()
 
+    def sample_stats(self):
+        if self.video_length <= 0:
+            self._stats_timeout = 0
+            return False
+
+        sample = self.stats.sample(self.media)
+
+        if sample is None:
+            return True
+
+        text = PlaybackStats.format(sample)
+
+        if sample['lost_fps'] > 0 and self.video_player.is_playing():
+            LOG.info('Losing frames: {}'.format(text))
+        else:
+            LOG.debug('Playback stats: {}'.format(text))
+
+        if self.show_stats:
+            self.video_player.video_set_marquee_string(vlc.VideoMarqueeOption.Text, text)
+
+        return True
+
+    def set_show_stats(self, show_stats):
+        self.show_stats = show_stats
+        # the marquee is drawn by VLC itself, so it works over any video output
+        self.video_player.video_set_marquee_int(vlc.VideoMarqueeOption.Enable, int(show_stats))
+
+        if show_stats:
+            self.video_player.video_set_marquee_int(vlc.VideoMarqueeOption.Size, 14)
+            self.video_player.video_set_marquee_int(vlc.VideoMarqueeOption.Position, 5)  # top (4) + left (1)
+            self.video_player.video_set_marquee_int(vlc.VideoMarqueeOption.Refresh, self.stats_interval_ms)
+            self.video_player.video_set_marquee_string(vlc.VideoMarqueeOption.Text, 'Collecting statistics...')
+
+    def get_stats(self):
+        return self.stats.last_sample
+
     def get_video_length(self):
         LOG.info('Getting video length (thread={})'.format(threading.current_thread().getName()))
-        return self.video_player.get_length()
+        return self.video_length if self.video_length > 0 else self.video_player.get_length()
+
+    def get_last_frame_time(self):
+        # time of a frame just before the end, where we can stay without VLC reaching the end of the stream
+        frame_ms = 1000 / self.video_info.fps if self.video_info is not None and self.video_info.fps > 0 else 250
+        return max(0, int(self.video_length - 2 * frame_ms))
 
     def play_video(self):
         LOG.info('Playing video (thread={})'.format(threading.current_thread().getName()))
@@ -112,6 +358,20 @@ class Player:
     def set_speed(self, speed):
         LOG.info('Setting playback speed to {} (thread={})'.format(speed, threading.current_thread().getName()))
         self.video_player.set_rate(speed)
+        self._speed_before_skip = None  # if we are skipping a static part, we will start again at the next update
+        fast_decoding = speed > self.fast_decoding_speed
+
+        if fast_decoding != self._fast_decoding:
+            self._fast_decoding = fast_decoding
+
+            if self.video_length > 0:
+                # reopen where we are, resuming the playback if needed, so the decoder picks up the new options
+                LOG.info('Switching fast decoding {}'.format('on' if fast_decoding else 'off'))
+                self._resume_after_reopen = self.video_player.is_playing()
+                self.reopen_video(self.get_current_position())
+
+    def get_speed(self):
+        return self.video_player.get_rate()
 
     def mute_video(self):
         LOG.info('Mute video (thread={})'.format(threading.current_thread().getName()))
@@ -121,6 +381,18 @@ class Player:
         LOG.info('Unmute video (thread={})'.format(threading.current_thread().getName()))
         self.video_player.audio_set_mute(False)
 
+    def duck_video_audio(self):
+        if self._volume_before_ducking is None:
+            self._volume_before_ducking = self.video_player.audio_get_volume()
+            LOG.info('Ducking video audio (thread={})'.format(threading.current_thread().getName()))
+            self.video_player.audio_set_volume(int(self._volume_before_ducking * self.ducking_ratio))
+
+    def restore_video_audio(self):
+        if self._volume_before_ducking is not None:
+            LOG.info('Restoring video audio (thread={})'.format(threading.current_thread().getName()))
+            self.video_player.audio_set_volume(self._volume_before_ducking)
+            self._volume_before_ducking = None
+
     def get_current_position(self):
         # this is called constantly as the video plays, avoid logging
         return max(0, self.video_player.get_time())
@@ -138,12 +410,76 @@ class Player:
         return self._is_seeking or self._seeking_timeout != 0
 
     def video_moving_handler(self, *args):
-        # this will be run in the main thread when possible
-        GLib.idle_add(self.video_moving, priority=GLib.PRIORITY_HIGH)
+        # this will be run in the main thread when possible. If the main thread has not caught up with the previous
+        # event yet there is no need to queue another one, it will read the latest position anyway
+        if not self._moving_pending:
+            self._moving_pending = True
+            GLib.idle_add(self.video_moving, priority=GLib.PRIORITY_HIGH)
 
     def video_moving(self):
         # this is called constantly as the video plays, avoid logging
-        self.controller.signal_sender.emit('video_moving', self.get_current_position(), self.is_seeking())
+        self._moving_pending = False
+        self.seek_scheduler.position_reported(self.get_current_position())
+        # when scrubbing with the keys VLC lands on key frames, report where we are going instead
+        position = self._seek_target if self._is_seeking else self.get_current_position()
+        self.controller.signal_sender.emit('video_moving', position, self.is_seeking())
+
+        if self.pause_at_end and self._end_timeout == 0:
+            self.arm_end_of_video(position)
+
+        if not self._is_seeking:
+            self.update_static_skip(position)
+
+        if self._is_seeking:
+            self.prefetcher.update(position, direction=self._seek_direction, rate=self.get_seek_step() / self.seek_refresh)
+        elif self.video_player.is_playing():
+            self.prefetcher.update(position, rate=self.video_player.get_rate())
+
+    def set_motion_index(self, motion_index):
+        self.motion_index = motion_index
+
+    def update_static_skip(self, position):
+        # accelerate while both this and the next second are static
+        static = self.skip_static and self.motion_index is not None and self.video_player.is_playing() and \
+            self.motion_index.is_static(position) and self.motion_index.is_static(position + 1000)
+
+        if static and self._speed_before_skip is None:
+            LOG.info('Skipping static part at {}ms (thread={})'.format(position, threading.current_thread().getName()))
+            self._speed_before_skip = self.video_player.get_rate()
+            self.video_player.set_rate(max(self._speed_before_skip, self.skip_static_speed))
+            self.controller.playback_rate_changed()
+        elif not static and self._speed_before_skip is not None:
+            LOG.info('End of static part at {}ms (thread={})'.format(position, threading.current_thread().getName()))
+            self.video_player.set_rate(self._speed_before_skip)
+            self._speed_before_skip = None
+            self.controller.playback_rate_changed()
+
+    def arm_end_of_video(self, position):
+        # position events are not frequent enough to catch the last frame, so we time it, taking the speed into account
+        remaining_ms = (self.get_last_frame_time() - position) / max(0.1, self.video_player.get_rate())
+
+        if remaining_ms < 1000 and self.video_player.is_playing():
+            self._end_timeout = GLib.timeout_add(max(1, int(remaining_ms)), self.check_end_of_video)
+
+    def check_end_of_video(self):
+        self._end_timeout = 0
+
+        if not self.video_player.is_playing():
+            return False
+
+        last_frame_time = self.get_last_frame_time()
+        remaining_ms = (last_frame_time - self.get_current_position()) / max(0.1, self.video_player.get_rate())
+
+        if remaining_ms > 40:
+            # we are not there yet (e.g. the video has been slowed down), check again later
+            self._end_timeout = GLib.timeout_add(int(remaining_ms), self.check_end_of_video)
+        else:
+            LOG.info('Pausing on the last frame (thread={})'.format(threading.current_thread().getName()))
+            self.pause_video()
+            self.seek_scheduler.request(last_frame_time)
+            self.controller.video_reached_end(last_frame_time)
+
+        return False
 
     def start_seek(self, direction):
         LOG.info('Start seeking (thread={})'.format(threading.current_thread().getName()))
@@ -154,8 +490,10 @@ class Player:
         else:
             self.was_playing_before_seek = False
 
-        step = self.seek_step if direction == 'forward' else - self.seek_step
-        self._seeking_timeout = GLib.timeout_add(self.seek_refresh, self.seek, step)
+        self._seek_started = time.perf_counter()
+        self._seek_direction = 1 if direction == 'forward' else -1
+        self._seek_target = self.get_target_position()
+        self._seeking_timeout = GLib.timeout_add(self.seek_refresh, self.seek)
 
     def stop_seek(self):
         LOG.info('Stop seeking (thread={})'.format(threading.current_thread().getName()))
@@ -163,54 +501,127 @@ class Player:
         GLib.source_remove(self._seeking_timeout)
         self._seeking_timeout = 0
 
+        # intermediate steps were key frame seeks, land precisely where the user stopped
+        if self._is_seeking:
+            self.seek_scheduler.request(self._seek_target, fast=False)
+
         if self.was_playing_before_seek:
             self.play_video()
 
         self._is_seeking = False
 
-    def seek(self, step):
-        seek_pos = self.get_current_position() + step
+    def get_seek_step(self):
+        # the longer the key is held, the bigger the step
+        held_for = time.perf_counter() - self._seek_started
+        return get_seek_step(held_for, self.seek_step, self.seek_max_step, self.seek_doubling_time)
+
+    def seek(self):
+        seek_pos = max(1, min(self.video_length - 1, self._seek_target + self._seek_direction * self.get_seek_step()))
 
-        if 0 < seek_pos < self.video_length:
+        if seek_pos != self._seek_target:
             self._is_seeking = True
-            self.video_player.set_time(int(seek_pos))
-            self.controller.signal_sender.emit('video_moving', self.get_current_position(), self.is_seeking())
+            self._seek_target = int(seek_pos)
+            self.seek_scheduler.request(self._seek_target, fast=True)
+            self.controller.signal_sender.emit('video_moving', self._seek_target, self.is_seeking())
 
         # always return True to make sure the event id is kept in glib
         return True
 
-    def go_to(self, time_ms):
-        LOG.info('Go to {}ms (thread={})'.format(time_ms, threading.current_thread().getName()))
+    def go_to(self, time_ms, fast=False):
+        # this is called constantly when dragging the slider, avoid logging
+        self.prefetcher.update(time_ms)
+        self.seek_scheduler.request(int(time_ms), fast=fast)
+
+    def set_time(self, time_ms, fast=False):
+        if fast:
+            try:
+                # libvlc 4 accepts a fast flag to seek to the closest key frame
+                self.video_player.set_time(time_ms, True)
+                return
+            except TypeError:
+                pass  # libvlc 3 seeks precisely only
+
+        self.video_player.set_time(time_ms)
+
+    def get_target_position(self):
+        # the position we will be at once the pending seeks complete
+        target = self.seek_scheduler.get_target()
+        return target if target is not None else self.get_current_position()
+
+    def is_seek_pending(self):
+        return self.seek_scheduler.is_busy()
+
+    def get_seek_stats(self):
+        return self.seek_scheduler.get_stats()
 
-        self.video_player.set_time(int(time_ms))
+    def reset_seek_stats(self):
+        self.seek_scheduler.reset_stats()
 
     def video_ended_handler(self, *args):
         GLib.idle_add(self.video_ended)
 
     def video_ended(self):
+        # with pause_at_end this happens only if VLC reached the end before we could pause it
         LOG.info('Video ended (thread={})'.format(threading.current_thread().getName()))
         self.video_player.stop()
+        self.seek_scheduler.reset()
         self.controller.reload_current_video()
 
-    def play_recording(self, recording_path):
-        LOG.info('Playing recording at {} (thread={})'.format(recording_path, threading.current_thread().getName()))
+    def play_recording(self, recording_path, speed=1, start_ms=0, stop_ms=None):
+        LOG.info('Playing recording at {} (speed={}, thread={})'.format(recording_path, speed,
+                                                                        threading.current_thread().getName()))
 
         audio_media = self.vlc_instance.media_new_path(recording_path)
+
+        # VLC stretches the audio when the rate changes, so faster playback keeps the pitch
+        audio_media.add_option(':audio-time-stretch')
+
+        if start_ms > 0:
+            audio_media.add_option(':start-time={:.3f}'.format(start_ms / 1000))
+
+        if stop_ms is not None:
+            audio_media.add_option(':stop-time={:.3f}'.format(stop_ms / 1000))
+
         self.rec_player.audio_set_mute(False)  # we need to this every time
-        self.rec_player.set_mrl(audio_media.get_mrl())
+        self.rec_player.set_media(audio_media)
+        self.rec_player.set_rate(speed)
         self.rec_player.play()
 
     def finished_playing_recording_handler(self, *args):
         GLib.idle_add(self.finished_playing_recording)
 
     def finished_playing_recording(self):
+        if self.rec_player.get_state() in (vlc.State.Opening, vlc.State.Buffering, vlc.State.Playing):
+            return  # stopped because the next recording has been started already
+
         self.controller.recording_finished_playing()
 
+    def stop_playing_recording(self):
+        LOG.info('Stop playing recording (thread={})'.format(threading.current_thread().getName()))
+        self.rec_player.stop()
+
     def reset(self):
         LOG.info('Resetting (thread={})'.format(threading.current_thread().getName()))
 
+        if self.prefetcher.is_enabled():
+            LOG.info('Read ahead stats: {}'.format(self.prefetcher.get_stats()))
+
+        self.prefetcher.set_video(None, 0)
+
         self.video_length = 0
+        self.video_info = None
+        self._waiting_for_media = False
+        self._resume_after_reopen = False
         self._seeking_timeout = 0
+        self.restore_video_audio()
+        self.motion_index = None
+        self._speed_before_skip = None
+
+        if self._end_timeout != 0:
+            GLib.source_remove(self._end_timeout)
+            self._end_timeout = 0
+
         self.was_playing_before_seek = None
         self._is_seeking = False
+        self.seek_scheduler.reset()
 
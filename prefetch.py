@@ -0,0 +1,162 @@
+import collections
+import logging
+import os
+import threading
+
+LOG = logging.getLogger('epic_narrator.prefetch')
+
+
+class ReadAheadPrefetcher:
+    """
+    Reads the part of the video file that is about to be played in a background thread, so it is in the OS cache
+    when VLC asks for it. This hides the latency of network storage on playback start and seeks. Byte offsets are
+    estimated from the time assuming a constant bitrate, so the read ahead window is a bit larger than needed.
+
+    The data itself is thrown away, we only keep track of which chunks have been read (up to the budget) to count
+    hits and misses as the playhead moves and not to read them twice.
+    """
+
+    def __init__(self, budget_mb=64, chunk_kb=1024, read_ahead_s=10):
+        self.chunk_size = chunk_kb * 1024
+        self.read_ahead_s = read_ahead_s
+        self.budget_chunks = int(budget_mb * 1024 * 1024 // self.chunk_size)
+        self.video_path = None
+        self.file_size = 0
+        self.video_length = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self._chunks = collections.OrderedDict()  # chunks already read, least recently used first
+        self._queue = collections.deque()  # chunks ahead of the playhead, replaced as it moves
+        self._targets = collections.deque()  # chunks around the narrations, read once the playhead is covered
+        self._last_chunk = None
+        self._generation = 0  # changes with the video, so the worker drops reads for the previous one
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._work, name='read-ahead', daemon=True)
+        self._worker.start()
+
+    def set_budget(self, budget_mb):
+        with self._condition:
+            self.budget_chunks = int(budget_mb * 1024 * 1024 // self.chunk_size)
+
+            while len(self._chunks) > self.budget_chunks:
+                self._chunks.popitem(last=False)
+
+    def is_enabled(self):
+        return self.budget_chunks > 0 and self.video_path is not None
+
+    def set_video(self, video_path, video_length):
+        try:
+            file_size = os.path.getsize(video_path) if video_path is not None else 0
+        except OSError:
+            file_size = 0
+
+        with self._condition:
+            self._generation += 1
+            self.video_path = video_path if file_size > 0 and video_length > 0 else None
+            self.file_size = file_size
+            self.video_length = video_length
+            self._chunks.clear()
+            self._queue.clear()
+            self._targets.clear()
+            self._last_chunk = None
+            self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+
+    def get_stats(self):
+        n_checked = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, hit_rate=self.hits / n_checked if n_checked else 0,
+                    mb_read=self.bytes_read / (1024 * 1024))
+
+    def get_chunk(self, time_ms):
+        offset = int(self.file_size * max(0, min(time_ms, self.video_length)) / self.video_length)
+        return min(offset, self.file_size - 1) // self.chunk_size
+
+    def update(self, position_ms, direction=1, rate=1):
+        """Called as the playhead moves: counts hits and misses, and reads ahead in the direction of the playback"""
+        if not self.is_enabled():
+            return
+
+        with self._condition:
+            chunk = self.get_chunk(position_ms)
+
+            if chunk != self._last_chunk:
+                self._last_chunk = chunk
+
+                if chunk in self._chunks:
+                    self.hits += 1
+                    self._chunks.move_to_end(chunk)
+                else:
+                    self.misses += 1
+
+            end_ms = position_ms + direction * self.read_ahead_s * 1000 * max(1, rate)
+            last_chunk = self.get_chunk(end_ms)
+            step = 1 if last_chunk >= chunk else -1
+            ahead = [c for c in range(chunk, last_chunk + step, step) if c not in self._chunks]
+            # the playhead moved, so what was queued before is less urgent than what is ahead of it now
+            self._queue.clear()
+            self._queue.extend(ahead[:self.budget_chunks])
+            self._condition.notify()
+
+    def prefetch_times(self, times_ms, window_ms=2000):
+        """Reads around the given times (e.g. narrations we might jump to), after what is ahead of the playhead"""
+        if not self.is_enabled():
+            return
+
+        with self._condition:
+            for time_ms in times_ms:
+                first_chunk = self.get_chunk(time_ms - window_ms)
+                last_chunk = self.get_chunk(time_ms + window_ms)
+
+                for chunk in range(first_chunk, last_chunk + 1):
+                    if chunk not in self._chunks and len(self._targets) < self.budget_chunks:
+                        self._targets.append(chunk)
+
+            self._condition.notify()
+
+    def _work(self):
+        buffer = bytearray(self.chunk_size)
+        video_file = None
+        file_path = None
+
+        while True:
+            with self._condition:
+                while not self._queue and not self._targets:
+                    self._condition.wait()
+
+                chunk = self._queue.popleft() if self._queue else self._targets.popleft()
+                video_path = self.video_path
+                generation = self._generation
+
+                if chunk in self._chunks or video_path is None:
+                    continue
+
+            try:
+                if file_path != video_path:
+                    if video_file is not None:
+                        video_file.close()
+
+                    video_file = open(video_path, 'rb', buffering=0)
+                    file_path = video_path
+
+                video_file.seek(chunk * self.chunk_size)
+                n_read = video_file.readinto(buffer)
+            except OSError:
+                LOG.exception('Could not read ahead {}'.format(video_path))
+                video_file = None
+                file_path = None
+                continue
+
+            with self._condition:
+                if generation != self._generation:
+                    continue
+
+                self.bytes_read += n_read
+                self._chunks[chunk] = True
+
+                while len(self._chunks) > self.budget_chunks:
+                    self._chunks.popitem(last=False)
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+
+import vlc
+
+from background import BackgroundWorker, FileIndex
+from settings import Settings
+
+LOG = logging.getLogger('epic_narrator.probe')
+
+
+class MediaInfo:
+    def __init__(self, duration_ms=0, fps=0, width=0, height=0):
+        self.duration_ms = duration_ms
+        self.fps = fps
+        self.width = width
+        self.height = height
+
+    def to_dict(self):
+        return dict(duration_ms=self.duration_ms, fps=self.fps, width=self.width, height=self.height)
+
+    def __repr__(self):
+        return 'MediaInfo(duration_ms={}, fps={}, width={}, height={})'.format(self.duration_ms, self.fps,
+                                                                               self.width, self.height)
+
+
+class MediaProbe:
+    """
+    Reads duration, frame rate and resolution of videos in background threads, with ffprobe if available or
+    libvlc's parser otherwise. Results are cached per file (path, size and modification time) in the narrator
+    directory, so each video is probed once.
+    """
+
+    def __init__(self, vlc_instance, parse_timeout_ms=10000):
+        self.vlc_instance = vlc_instance
+        self.parse_timeout_ms = parse_timeout_ms
+        self.ffprobe = shutil.which('ffprobe')
+        self.cache_path = os.path.join(Settings.get_epic_narrator_directory(), 'media_info.yml')
+        self._cache = FileIndex(self.cache_path, log=LOG)
+        # two workers, so a video VLC takes its whole timeout to parse does not hold up the next one
+        self._worker = BackgroundWorker(self._probe, 'media-probe', 'Could not probe {}', log=LOG, workers=2,
+                                        report_failures=True)
+        self._worker.start()
+
+    def get_cached(self, video_path):
+        entry = self._cache.get(video_path)
+        return MediaInfo(**entry['info']) if entry is not None else None
+
+    def probe(self, video_path, callback):
+        """
+        Calls `callback(video_path, media_info)` with the cached info or, if not cached, from a worker thread once
+        probed. `media_info` is None if the video could not be probed.
+        """
+        info = self.get_cached(video_path)
+
+        if info is not None:
+            LOG.info('Media info for {} found in cache: {}'.format(video_path, info))
+            callback(video_path, info)
+        else:
+            self._worker.request(video_path, callback)
+
+    def probe_now(self, video_path):
+        """Probes in the calling thread, use it only off the main thread"""
+        info = self.get_cached(video_path)
+
+        if info is None:
+            info = self._probe(video_path)
+
+        return info
+
+    def _probe(self, video_path):
+        info = None
+
+        if self.ffprobe is not None:
+            try:
+                info = self.probe_with_ffprobe(video_path)
+            except Exception:
+                LOG.warning('ffprobe could not probe {}, trying with VLC'.format(video_path))
+
+        if info is None:
+            try:
+                info = self.probe_with_vlc(video_path)
+            except Exception:
+                LOG.exception('Could not probe {}'.format(video_path))
+
+        if info is not None and info.duration_ms > 0:
+            LOG.info('Probed {}: {}'.format(video_path, info))
+            self._cache.put(video_path, info=info.to_dict())
+        else:
+            info = None
+
+        return info
+
+    def probe_with_ffprobe(self, video_path):
+        output = subprocess.run([self.ffprobe, '-v', 'error', '-select_streams', 'v:0',
+                                 '-show_entries', 'stream=width,height,avg_frame_rate,r_frame_rate:format=duration',
+                                 '-of', 'json', video_path],
+                                check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        probed = json.loads(output.stdout.decode('utf-8'))
+        streams = probed.get('streams', [])
+
+        if not streams or 'duration' not in probed.get('format', {}):
+            return None
+
+        stream = streams[0]
+        fps = parse_rate(stream.get('avg_frame_rate', '0/0')) or parse_rate(stream.get('r_frame_rate', '0/0'))
+
+        return MediaInfo(duration_ms=int(float(probed['format']['duration']) * 1000), fps=fps,
+                         width=stream.get('width', 0), height=stream.get('height', 0))
+
+    def probe_with_vlc(self, video_path):
+        media = self.vlc_instance.media_new_path(video_path)
+        parsed = threading.Event()
+        media.event_manager().event_attach(vlc.EventType.MediaParsedChanged, lambda *args: parsed.set())
+        media.parse_with_options(vlc.MediaParseFlag.local, self.parse_timeout_ms)
+        parsed.wait(self.parse_timeout_ms / 1000 + 1)
+
+        duration_ms = media.get_duration()
+
+        if duration_ms <= 0:
+            media.release()
+            return None
+
+        info = MediaInfo(duration_ms=duration_ms)
+
+        for track in media.tracks_get() or []:
+            if track.type == vlc.TrackType.video:
+                video = track.video.contents
+                info.width = video.width
+                info.height = video.height
+                info.fps = video.frame_rate_num / video.frame_rate_den if video.frame_rate_den else 0
+                break
+
+        media.release()
+
+        return info
+
+
+def parse_rate(rate):
+    try:
+        num, den = rate.split('/')
+        return float(num) / float(den) if float(den) else 0
+    except ValueError:
+        return 0
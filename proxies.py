@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+
+from background import BackgroundWorker, FileIndex, get_file_key
+from settings import Settings
+
+LOG = logging.getLogger('epic_narrator.proxies')
+
+
+class ProxyCache:
+    """
+    Transcodes videos to low resolution, short GOP proxies with ffmpeg in a bounded pool of workers, so weak machines
+    can decode them smoothly and seek to any frame quickly. Proxies keep the timeline of the original video, so
+    positions are the same in both. They are stored under the narrator directory and named after a hash of the
+    content of the video, so renaming or moving a video does not transcode it again.
+    """
+
+    def __init__(self, height=360, gop=12, crf=28, workers=1, sample_bytes=4 * 1024 * 1024):
+        self.height = height
+        self.gop = gop
+        self.crf = crf
+        self.sample_bytes = sample_bytes
+        self.ffmpeg = shutil.which('ffmpeg')
+        self.cache_folder = os.path.join(Settings.get_epic_narrator_directory(), 'proxies')
+        self.index_path = os.path.join(self.cache_folder, 'index.yml')
+        self._index = None  # absolute video path -> dict(size, mtime_ns, content_hash)
+        # every worker runs one ffmpeg, which is multi-threaded already
+        self._worker = BackgroundWorker(self.get_or_transcode, 'proxy-worker', 'Could not create a proxy for {}',
+                                        log=LOG, workers=workers)
+
+        if self.ffmpeg is None:
+            LOG.warning('ffmpeg not found, proxies will not be available')
+        else:
+            os.makedirs(self.cache_folder, exist_ok=True)
+            self._index = FileIndex(self.index_path, log=LOG)
+            self._worker.start()
+
+    def is_available(self):
+        return self.ffmpeg is not None
+
+    def get_proxy_path(self, content_hash):
+        return os.path.join(self.cache_folder, '{}_{}p.mp4'.format(content_hash, self.height))
+
+    def get_proxy(self, video_path):
+        """Returns the path of the proxy of the video if it has been transcoded already, None otherwise"""
+        if not self.is_available():
+            return None
+
+        entry = self._index.get(video_path)
+
+        if entry is None:
+            return None
+
+        proxy_path = self.get_proxy_path(entry['content_hash'])
+
+        return proxy_path if os.path.exists(proxy_path) else None
+
+    def request(self, video_path, callback):
+        """
+        Transcodes the video in the background if there is no proxy for it yet.
+        `callback(video_path, proxy_path)` is called from a worker thread when the proxy is ready
+        """
+        if not self.is_available():
+            return
+
+        self._worker.request(video_path, callback)
+
+    def get_or_transcode(self, video_path):
+        content_hash = self.get_content_hash(video_path, get_file_key(video_path)['size'])
+        proxy_path = self.get_proxy_path(content_hash)
+
+        if not os.path.exists(proxy_path):
+            self.transcode(video_path, proxy_path)
+
+        self._index.put(video_path, content_hash=content_hash)
+
+        return proxy_path
+
+    def get_content_hash(self, video_path, file_size):
+        # hashing whole videos of several GB would take longer than it is worth, size plus the beginning and the end of
+        # the file (where containers keep their headers and indexes) identify a video well enough
+        sha1 = hashlib.sha1(str(file_size).encode('utf-8'))
+
+        with open(video_path, 'rb') as f:
+            sha1.update(f.read(self.sample_bytes))
+
+            if file_size > 2 * self.sample_bytes:
+                f.seek(file_size - self.sample_bytes)
+                sha1.update(f.read(self.sample_bytes))
+
+        return sha1.hexdigest()
+
+    def transcode(self, video_path, proxy_path):
+        LOG.info('Transcoding {} to {}'.format(video_path, proxy_path))
+        tmp_path = '{}.tmp.mp4'.format(os.path.splitext(proxy_path)[0])
+
+        # a key frame every `gop` frames keeps seeks cheap, scene cut detection is off so the interval is fixed
+        subprocess.run([self.ffmpeg, '-nostdin', '-v', 'error', '-i', video_path,
+                        '-map', '0:v:0', '-map', '0:a:0?',
+                        '-vf', 'scale=-2:{}'.format(self.height),
+                        '-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'fastdecode', '-crf', str(self.crf),
+                        '-g', str(self.gop), '-keyint_min', str(self.gop), '-sc_threshold', '0', '-bf', '0',
+                        '-c:a', 'aac', '-b:a', '96k', '-movflags', '+faststart', '-y', tmp_path],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        os.replace(tmp_path, proxy_path)
+        LOG.info('Proxy for {} ready'.format(video_path))
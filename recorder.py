@@ -1,18 +1,87 @@
+import collections
+import functools
 import logging
+import threading
+from time import perf_counter
 
+import numpy as np
 import sounddevice as sd
 import queue
 import soundfile as sf
 
+from levels import LevelMeter, TakeStats
+from resampler import StreamingResampler
+from routing import ChannelRouter
+
 LOG = logging.getLogger('epic_narrator.recorder')
 
 
+class CallbackJitter:
+    """
+    Measures how regularly the audio callback is called: each interval between two callbacks is compared to the
+    duration of the block the second one brings. Callbacks that come late, e.g. because another thread held the
+    GIL, show up as large deviations. The last `max_samples` deviations are kept for percentiles.
+    """
+
+    def __init__(self, max_samples=65536):
+        self.deviations = collections.deque(maxlen=max_samples)
+        self.reset()
+
+    def reset(self):
+        self.last_call = None
+        self.n_intervals = 0
+        self.total_deviation = 0
+        self.max_deviation = 0
+        self.deviations.clear()
+
+    def update(self, frames, sample_rate):
+        now = perf_counter()
+
+        if self.last_call is not None:
+            deviation = abs(now - self.last_call - frames / sample_rate)
+            self.n_intervals += 1
+            self.total_deviation += deviation
+            self.max_deviation = max(self.max_deviation, deviation)
+            self.deviations.append(deviation)
+
+        self.last_call = now
+
+    def get_stats(self):
+        mean = self.total_deviation / self.n_intervals if self.n_intervals else 0
+        return dict(jitter_mean_ms=1000 * mean, jitter_max_ms=1000 * self.max_deviation)
+
+    def get_percentiles(self, percentiles=(50, 95, 99)):
+        """Returns the given percentiles of the recent deviations in ms, None if there are none yet"""
+        if not self.deviations:
+            return None
+
+        return [1000 * float(value) for value in np.percentile(list(self.deviations), percentiles)]
+
+
 class Recorder:
-    def __init__(self, channels=[1], device_id=sd.default.device[0], window=200, downsample=10):
+    # while we only feed the monitor large blocks wake us up less often, when we might record soon we want to start
+    # capturing as soon as possible
+    default_profiles = {
+        'idle': dict(blocksize=4096, latency='high'),
+        'low_latency': dict(blocksize=256, latency='low'),
+    }
+
+    def __init__(self, channels=[1], device_id=sd.default.device[0], window=200, downsample=10, profile='idle',
+                 profiles=None, auto_tune=False, max_blocksize=8192, downmix=False, output_rate=None,
+                 monitor_sink=None, monitor_mode='waveform', level_meter=None):
         LOG.info("Creating recorder for device id {}".format(device_id))
-        self.mapping = [c - 1 for c in channels]  # Channel numbers start with 1
         self.q = queue.Queue()
+        # where the monitor data goes, the queue unless the recorder runs in a capture process
+        self.monitor_sink = monitor_sink if monitor_sink is not None else self.q.put
         self.channels = channels
+        self.router = ChannelRouter(channels, max(channels), downmix=downmix)
+        # 'waveform' sends the monitor (decimated) audio, 'levels' only the peak, RMS and clips of every channel
+        self.monitor_mode = monitor_mode
+
+        if monitor_mode == 'levels':
+            self.level_meter = level_meter if level_meter is not None else LevelMeter(self.router.n_output_channels)
+        else:
+            self.level_meter = None
         self.device_info = dict()
         self.device_id = device_id
         self.downsample = downsample
@@ -20,9 +89,31 @@ class Recorder:
         self.length = int(self.window * self.sample_rate / (1000 * self.downsample))
         self.is_recording = False
         self.current_file = None
+        self.output_rate = output_rate  # rate of the recordings if it is not the rate of the device
+        self.resampler = None
+        self.take_stats = None
+        self.profile = profile
+        # profiles can be given as tuned in a previous run, so we start from a configuration that did not overflow
+        self.profiles = {name: dict(settings) for name, settings in self.default_profiles.items()}
+        self.profiles.update({name: dict(settings) for name, settings in (profiles or {}).items()})
+        self.auto_tune = auto_tune
+        self.max_blocksize = max_blocksize
+        self.overflows = 0
+        self.underflows = 0
+        self.recording_overflows = 0
+        self.recording_underflows = 0
+        self._tuned_overflows = 0  # overflows already taken into account when tuning
+        self.jitter = CallbackJitter()
+        self._stream_id = 0
+        self._active_stream_id = 0  # only the active stream feeds the monitor and the recording
+        self._handover = None  # (id of the stream we are switching to, event set when it takes over)
+        self._next_profile = None  # profile requested while switching, applied once the switch is done
+        self._lock = threading.Lock()
+        # the recording is written by the callback thread, and opened and closed by the thread that controls us
+        self._file_lock = threading.Lock()
 
-        self.stream = sd.InputStream(device=self.device_id, channels=max(self.channels),
-                                     samplerate=self.sample_rate, callback=self.audio_callback)
+        self.stream = self.open_stream(profile)
+        self._active_stream_id = self._stream_id
 
     @property
     def device_id(self):
@@ -37,12 +128,136 @@ class Recorder:
     def sample_rate(self):
         return self.device_info['default_samplerate']
 
+    def open_stream(self, profile):
+        self._stream_id += 1
+        settings = self.profiles[profile]
+        stream = sd.InputStream(device=self.device_id, channels=max(self.channels), samplerate=self.sample_rate,
+                                blocksize=settings['blocksize'], latency=settings['latency'],
+                                callback=functools.partial(self.audio_callback, stream_id=self._stream_id))
+        LOG.info('Opened {} stream (blocksize={}, latency={:.1f}ms)'.format(profile, stream.blocksize,
+                                                                             stream.latency * 1000))
+        return stream
+
+    def set_profile(self, profile):
+        """
+        Switches to another stream profile without gaps: the new stream is started while the current one is still
+        running, and takes over with its first block. The old stream is then closed in the background
+        """
+        with self._lock:
+            if self._handover is not None:
+                self._next_profile = profile
+                return
+
+            if profile == self.profile or not self.stream.active:
+                return
+
+            self._switch_stream(profile)
+
+    def _switch_stream(self, profile):
+        LOG.info('Switching recorder stream from {} to {}'.format(self.profile, profile))
+        old_stream = self.stream
+        new_stream = None
+
+        try:
+            new_stream = self.open_stream(profile)
+            new_stream.start()
+        except Exception:
+            # some devices cannot be opened twice, switch with a short gap instead
+            LOG.warning('Could not open a second stream, switching with a gap')
+
+            if new_stream is not None:
+                new_stream.close(ignore_errors=True)
+
+            old_stream.close(ignore_errors=True)
+            new_stream = self.open_stream(profile)
+            self._active_stream_id = self._stream_id
+            self.jitter.reset()
+            new_stream.start()
+            old_stream = None
+
+        self.stream = new_stream
+        self.profile = profile
+
+        if old_stream is not None:
+            handover = threading.Event()
+            self._handover = (self._stream_id, handover)
+            threading.Thread(target=self.retire_stream, args=(old_stream, self._stream_id, handover),
+                             name='stream-handover', daemon=True).start()
+
+    def retire_stream(self, old_stream, stream_id, handover, timeout_s=2):
+        if not handover.wait(timeout_s):
+            LOG.warning('The new stream did not start in {}s, closing the old one anyway'.format(timeout_s))
+
+        with self._lock:
+            if self._handover is not None and self._handover[0] == stream_id:  # unless the device changed meanwhile
+                self._active_stream_id = stream_id
+                self._handover = None
+
+            old_stream.close(ignore_errors=True)
+            next_profile, self._next_profile = self._next_profile, None
+
+        if next_profile is not None:
+            self.set_profile(next_profile)
+
+    def tune_profile(self):
+        """
+        Doubles the blocksize of the current profile and asks for a higher latency if the stream overflowed since the
+        last time this was called. Returns the new settings of the profile, or None if they did not change
+        """
+        overflows = self.overflows - self._tuned_overflows
+        self._tuned_overflows = self.overflows
+
+        if not self.auto_tune or overflows == 0 or self.is_recording:
+            return None
+
+        settings = self.profiles[self.profile]
+
+        if settings['blocksize'] >= self.max_blocksize:
+            LOG.warning('The {} stream overflowed {} times, but its blocksize is at its maximum already'.format(
+                self.profile, overflows))
+            return None
+
+        settings['blocksize'] = min(self.max_blocksize, 2 * settings['blocksize'])
+        # latency is given in seconds rather than 'low'/'high' from now on, as the device's 'high' may still be too low
+        settings['latency'] = round(2 * self.stream.latency, 4)
+        LOG.warning('The {} stream overflowed {} times, using blocksize={} and latency={:.1f}ms from now on'.format(
+            self.profile, overflows, settings['blocksize'], settings['latency'] * 1000))
+
+        with self._lock:
+            if self._handover is None and self.stream.active:
+                self._switch_stream(self.profile)  # otherwise the settings are used when the stream is next opened
+
+        return settings
+
+    def get_profiles(self):
+        return self.profiles
+
+    def set_auto_tune(self, auto_tune):
+        self.auto_tune = auto_tune
+
+    def get_stream_info(self):
+        info = dict(profile=self.profile, blocksize=self.stream.blocksize, latency_ms=self.stream.latency * 1000,
+                    sample_rate=self.stream.samplerate, overflows=self.overflows, underflows=self.underflows)
+        info.update(self.jitter.get_stats())
+        return info
+
+    def get_jitter_percentiles(self, percentiles=(50, 95, 99)):
+        return self.jitter.get_percentiles(percentiles)
+
+    def start_stream(self):
+        self.stream.start()
+
     def change_device(self, device_id):
         LOG.info("Changing recorder device to {}".format(device_id))
         self.close_stream()
         self.device_id = device_id
-        self.stream = sd.InputStream(device=self.device_id, channels=max(self.channels),
-                                     samplerate=self.sample_rate, callback=self.audio_callback)
+
+        with self._lock:
+            self._handover = None
+            self._next_profile = None
+            self.stream = self.open_stream(self.profile)
+            self._active_stream_id = self._stream_id
+            self.jitter.reset()
 
     def close_stream(self):
         if self.is_recording:
@@ -53,30 +268,121 @@ class Recorder:
 
     def start_recording(self, filename):
         LOG.info("Starting new recording, saving to {}".format(filename))
-        self.is_recording = True
-        self.current_file = sf.SoundFile(filename, mode='w', samplerate=int(self.sample_rate),
-                                         channels=len(self.channels))
+        self.recording_overflows = 0
+        self.recording_underflows = 0
+        n_channels = self.router.n_output_channels
+
+        if self.output_rate and int(self.output_rate) != int(self.sample_rate):
+            # a new resampler for every recording, so none of the previous recording leaks into this one
+            resampler = StreamingResampler(self.sample_rate, self.output_rate, n_channels)
+            file_rate = int(self.output_rate)
+        else:
+            resampler = None
+            file_rate = int(self.sample_rate)
+
+        sound_file = sf.SoundFile(filename, mode='w', samplerate=file_rate, channels=n_channels)
 
-    def stop_recording(self):
+        with self._file_lock:
+            self.resampler = resampler
+            self.take_stats = TakeStats()
+            self.current_file = sound_file
+            self.is_recording = True
+
+    def stop_recording(self, callback=None):
+        """Returns the statistics of the recording, also passing them to `callback(stats)` if given"""
         LOG.info("Stopping recording, saved to {}".format(self.current_file.name))
-        self.is_recording = False
-        LOG.debug("Closing {}".format(self.current_file.name))
-        self.current_file.close()
 
-    def audio_callback(self, indata, frames, time, status):
+        with self._file_lock:
+            # the callback may be writing a block, the end of the resampled signal must come after it
+            self.is_recording = False
+
+            if self.resampler is not None:
+                self.current_file.buffer_write(self.resampler.flush(), dtype='float32')
+
+            LOG.debug("Closing {}".format(self.current_file.name))
+            self.current_file.close()
+
+        if self.recording_overflows or self.recording_underflows:
+            LOG.warning('{} overflows and {} underflows while recording {}'.format(
+                self.recording_overflows, self.recording_underflows, self.current_file.name))
+
+        # the stream the take was recorded with, so overflows can be put down to its settings
+        stats = dict(overflows=self.recording_overflows, underflows=self.recording_underflows,
+                     blocksize=self.stream.blocksize, latency_ms=round(self.stream.latency * 1000, 1))
+        stats.update(self.take_stats.get_stats())
+        LOG.info('Recording stats: {}'.format(stats))
+
+        if callback is not None:
+            callback(stats)
+
+        return stats
+
+    def audio_callback(self, indata, frames, time, status, stream_id=0):
         """This is called (from a separate thread) for each audio block."""
+        if stream_id != self._active_stream_id:
+            handover = self._handover
+
+            if handover is None or handover[0] != stream_id:
+                return  # a stream we are switching away from
+
+            # first block of the stream we are switching to, from now on the old stream is ignored
+            self._active_stream_id = stream_id
+            handover[1].set()
+            self.jitter.reset()  # the blocks have a different size from now on
+
+        self.jitter.update(frames, self.sample_rate)
 
-        # Fancy indexing with mapping creates a (necessary!) copy:
-        self.q.put(indata[::self.downsample, self.mapping])
+        if status:
+            self.count_status(status)
 
-        if self.current_file is None or self.current_file.closed:
+        block = self.router.route(indata)
+        if self.level_meter is not None:
+            self.level_meter.add_block(block)
+        else:
+            # the block may be a view of indata, which is only valid during the callback, so the monitor gets a copy
+            self.monitor_sink(block[::self.downsample].copy())
+
+        if not self.is_recording:
             return
 
-        if self.is_recording:
-            self.current_file.buffer_write(indata, dtype='float32')
+        with self._file_lock:
+            if not self.is_recording:
+                return  # stopped while we were waiting for the lock
+
+            # before resampling, which would smooth out clipped samples
+            self.take_stats.add_block(block)
+
+            if self.resampler is not None:
+                block = self.resampler.process(block)
+
+            self.current_file.buffer_write(block, dtype='float32')
+
+    def count_status(self, status):
+        # an overflow means PortAudio dropped input because we did not keep up, i.e. there is a gap in the recording
+        if status.input_overflow:
+            self.overflows += 1
+
+            if self.is_recording:
+                self.recording_overflows += 1
+
+        if status.input_underflow:
+            self.underflows += 1
+
+            if self.is_recording:
+                self.recording_underflows += 1
+
+    def get_monitor_data(self):
+        """Returns the next block of monitor data, raises queue.Empty if there is none"""
+        return self.q.get_nowait()
+
+    def get_levels(self):
+        return self.level_meter.read() if self.level_meter is not None else None
+
+    def get_monitor_mode(self):
+        return self.monitor_mode
 
     def get_window_size(self):
-        return self.length, len(self.channels)
+        return self.length, self.router.n_output_channels
 
     @staticmethod
     def get_devices():
@@ -3,11 +3,16 @@ import logging
 import math
 import os
 import bisect
+import csv
+
+import yaml
 
 LOG = logging.getLogger('epic_narrator.recordings')
 
 
 class Recordings:
+    metadata_filename = 'narrations.yml'
+
     def __init__(self, output_parent, video_path, audio_extension='wav'):
         LOG.info('Creating recordings')
         self.base_folder = Recordings.get_recordings_path(output_parent)
@@ -18,6 +23,8 @@ class Recordings:
         self._recordings = {}
         self._recording_times = []
         self._highlighted_rec_index = None
+        self._metadata = {}  # time -> dict of what we know about the take, e.g. whether the stream overflowed
+        self.metadata_path = os.path.join(self.video_narrations_folder, self.metadata_filename)
         os.makedirs(self.video_narrations_folder, exist_ok=True)
 
     def add_recording(self, time, overwrite=False):
@@ -34,6 +41,7 @@ class Recordings:
             self._recording_times.insert(rec_index, time)
         else:
             rec_index = None
+            self.discard_metadata(time)  # it was about the previous take
 
         return path, rec_index
 
@@ -45,26 +53,50 @@ class Recordings:
             LOG.info("Deleted recording {}".format(filepath))
             del self._recordings[time]
             self._recording_times.remove(time)  # no need to sort when we delete
+            self.discard_metadata(time)
 
     def delete_last(self):
         self.delete_recording(self._recording_times[-1])
 
     def scan_folder(self):
-        LOG.info("Scanning {} for audio files".format(self.video_narrations_folder))
-        audio_files = glob.glob(os.path.join(self.video_narrations_folder, '*.{}'.format(self.audio_extension)))
-        LOG.info("Found {} existing recordings".format(len(audio_files)))
-        return audio_files
+        return Recordings.scan_recordings(self.video_narrations_folder, self.audio_extension)
 
     def narrations_exist(self):
         return os.path.exists(self.video_narrations_folder) and len(self.scan_folder()) > 0
 
-    def load_narrations(self):
-        for f in self.scan_folder():
+    def load_narrations(self, audio_files=None):
+        # audio files can be given if the folder has been scanned already, e.g. when preloading the video
+        for f in (audio_files if audio_files is not None else self.scan_folder()):
             LOG.debug("Loading recording {}".format(f))
             time_ms = int(os.path.splitext(os.path.basename(f))[0])
             self._recordings[time_ms] = f
             bisect.insort(self._recording_times, time_ms)
 
+        self._metadata = self.load_metadata()
+
+    def load_metadata(self):
+        return Recordings.read_metadata(self.metadata_path)
+
+    def save_metadata(self):
+        os.makedirs(self.video_narrations_folder, exist_ok=True)
+
+        with open(self.metadata_path, 'w') as f:
+            yaml.dump(self._metadata, f, default_flow_style=False)
+
+    def get_metadata(self, time):
+        return self._metadata.get(time, {})
+
+    def set_metadata(self, time, **values):
+        self._metadata.setdefault(time, {}).update(values)
+        self.save_metadata()
+
+    def discard_metadata(self, time):
+        if self._metadata.pop(time, None) is not None:
+            self.save_metadata()
+
+    def get_issues(self, time):
+        return get_take_issues(self.get_metadata(time))
+
     def get_path_for_recording(self, time_ms):
         if time_ms in self._recordings:
             return self._recordings[time_ms]
@@ -103,6 +135,17 @@ class Recordings:
         else:
             return None
 
+    def get_recordings_between(self, start_ms, end_ms):
+        # recordings in (start_ms, end_ms], i.e. the ones crossed when moving from start_ms to end_ms
+        start = bisect.bisect_right(self._recording_times, start_ms)
+        end = bisect.bisect_right(self._recording_times, end_ms)
+        return self._recording_times[start:end]
+
+    def get_next_recording(self, time_ms):
+        # first recording strictly after time_ms
+        pos = bisect.bisect_right(self._recording_times, time_ms)
+        return self._recording_times[pos] if pos < len(self._recording_times) else None
+
     def empty(self):
         return not bool(self._recordings)
 
@@ -159,6 +202,55 @@ class Recordings:
     def reset_highlighted(self):
         self._highlighted_rec_index = None
 
+    @staticmethod
+    def scan_recordings(narrations_folder, audio_extension='wav'):
+        LOG.info("Scanning {} for audio files".format(narrations_folder))
+        audio_files = glob.glob(os.path.join(narrations_folder, '*.{}'.format(audio_extension)))
+        LOG.info("Found {} existing recordings".format(len(audio_files)))
+        return audio_files
+
+    @staticmethod
+    def write_report(output_parent, report_file):
+        """
+        Writes a CSV line per narration under the output folder, with the statistics saved when it was recorded and
+        its issues, so takes to record again can be found without reading the audio
+        """
+        base_folder = Recordings.get_recordings_path(output_parent)
+        fields = ['video', 'time_ms', 'timestamp', 'peak_db', 'rms_db', 'voiced_rms_db', 'clipped', 'overflows',
+                  'issues']
+        writer = csv.DictWriter(report_file, fields, extrasaction='ignore')
+        writer.writeheader()
+        # no narrations were recorded under the output folder yet
+        video_names = sorted(os.listdir(base_folder)) if os.path.isdir(base_folder) else []
+
+        for video_name in video_names:
+            narrations_folder = os.path.join(base_folder, video_name)
+
+            if not os.path.isdir(narrations_folder):
+                continue
+
+            metadata = Recordings.read_metadata(os.path.join(narrations_folder, Recordings.metadata_filename))
+            times = sorted(int(os.path.splitext(os.path.basename(f))[0])
+                           for f in Recordings.scan_recordings(narrations_folder))
+
+            for time_ms in times:
+                row = dict(metadata.get(time_ms, {}), video=video_name, time_ms=time_ms,
+                           timestamp=ms_to_timestamp(time_ms))
+                row['issues'] = ' '.join(get_take_issues(row)) if 'rms_db' in row else 'unchecked'
+                writer.writerow(row)
+
+    @staticmethod
+    def read_metadata(metadata_path):
+        if not os.path.exists(metadata_path):
+            return {}
+
+        try:
+            with open(metadata_path) as f:
+                return yaml.load(f, Loader=yaml.FullLoader) or {}
+        except Exception:
+            LOG.exception('Could not read narrations metadata {}'.format(metadata_path))
+            return {}
+
     @staticmethod
     def get_recordings_path(output_parent):
         return os.path.join(output_parent, 'epic_narrator_recordings')
@@ -175,6 +267,26 @@ class Recordings:
         return os.path.join(base_folder, video_name)
 
 
+def get_take_issues(metadata, max_clipped=0, min_rms_db=-45, max_overflows=0):
+    """
+    Returns what is wrong with a narration given its metadata, takes recorded before we kept statistics pass. The
+    level is judged while the narrator speaks (`voiced_rms_db`), or over the whole take, pauses included, for takes
+    recorded before we measured it
+    """
+    issues = []
+
+    if metadata.get('clipped', 0) > max_clipped:
+        issues.append('clipped')
+
+    if metadata.get('voiced_rms_db', metadata.get('rms_db', 0)) < min_rms_db:
+        issues.append('quiet')
+
+    if metadata.get('overflows', 0) > max_overflows:
+        issues.append('dropouts')
+
+    return issues
+
+
 def ms_to_timestamp(millis):
     seconds = (millis / 1000) % 60
     minutes = (millis / (1000 * 60)) % 60
@@ -0,0 +1,85 @@
+import logging
+import math
+
+import numpy as np
+
+LOG = logging.getLogger('epic_narrator.resampler')
+
+
+class StreamingResampler:
+    """
+    Polyphase resampler for audio that comes in blocks, e.g. from the microphone stream. The rate is changed by the
+    rational factor up / down (160 / 441 from 44.1kHz to 16kHz) with a windowed sinc low pass filter split in `up`
+    phases of `taps` coefficients each, so every output sample costs `taps` multiply-adds per channel whatever the
+    rates. Blocks of any size can be given, the output is delayed by taps / 2 input samples at most and the delay
+    is removed from the result, so the concatenated output lines up with the input.
+    """
+
+    def __init__(self, input_rate, output_rate, n_channels, taps=32, rolloff=0.9, beta=8.0):
+        input_rate, output_rate = int(input_rate), int(output_rate)
+        gcd = math.gcd(input_rate, output_rate)
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.up = output_rate // gcd
+        self.down = input_rate // gcd
+        self.taps = taps
+        self.delay = taps // 2  # in input samples, i.e. how far ahead of an output sample the filter reads
+        self.bank = self.design_filter(self.up, self.down, taps, self.delay, rolloff, beta)
+        self._offsets = np.arange(taps)
+        self._n_in = 0
+        self._n_out = 0
+        # input samples still needed, starting from global index _buffer_start. Before the first block the signal is 0
+        self._buffer = np.zeros((taps - 1, n_channels), dtype=np.float32)
+        self._buffer_start = -(taps - 1)
+        LOG.info('Resampling from {}Hz to {}Hz (up {}, down {}, {} taps)'.format(input_rate, output_rate, self.up,
+                                                                                 self.down, taps))
+
+    @staticmethod
+    def design_filter(up, down, taps, delay, rolloff, beta):
+        """Returns the filter split in phases, as an array of shape (up, taps)"""
+        # the filter is centred on `delay` input samples, so the output is not shifted by a fraction of a sample
+        t = np.arange(up * taps) - delay * up
+        # the cutoff is at the lowest of the two Nyquist frequencies, in cycles per sample of the upsampled signal
+        cutoff = rolloff * 0.5 / max(up, down)
+        window = np.i0(beta * np.sqrt(np.clip(1 - (t / (delay * up)) ** 2, 0, None))) / np.i0(beta)
+        h = 2 * cutoff * np.sinc(2 * cutoff * t) * window
+        h *= up / h.sum()  # unit gain in the pass band, once the zeros inserted by upsampling are accounted for
+
+        # phase p holds the coefficients p, p + up, p + 2 * up, ... which are applied to consecutive input samples
+        return h.reshape(taps, up).T.astype(np.float32)
+
+    def process(self, block, final=False):
+        """
+        Resamples the next block of shape (frames, channels) and returns the output samples that can be computed
+        so far. With `final` the signal is considered finished and the rest of the output is returned
+        """
+        self._n_in += len(block)
+        parts = [self._buffer, block]
+
+        if final:
+            parts.append(np.zeros((self.delay, self._buffer.shape[1]), dtype=np.float32))
+            last = self._n_in - 1
+        else:
+            last = self._n_in - 1 - self.delay  # the last input sample we can centre an output on
+
+        self._buffer = np.concatenate(parts).astype(np.float32, copy=False)
+        # output n is centred on input (n * down) / up, so outputs up to ceil((last + 1) * up / down) are ready
+        n_end = max(self._n_out, -(-(last + 1) * self.up // self.down))
+        positions = np.arange(self._n_out, n_end) * self.down
+        inputs = positions // self.up + self.delay - self._buffer_start
+        phases = positions % self.up
+
+        windows = self._buffer[inputs[:, None] - self._offsets[None, :]]  # (outputs, taps, channels)
+        output = np.einsum('nk,nkc->nc', self.bank[phases], windows)
+        self._n_out = n_end
+
+        # keep the inputs the next output needs
+        first_needed = (self._n_out * self.down) // self.up + self.delay - (self.taps - 1)
+        drop = max(0, first_needed - self._buffer_start)
+        self._buffer = self._buffer[drop:]
+        self._buffer_start += drop
+
+        return output.astype(np.float32, copy=False)
+
+    def flush(self):
+        return self.process(np.zeros((0, self._buffer.shape[1]), dtype=np.float32), final=True)
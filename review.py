@@ -0,0 +1,99 @@
+import logging
+import threading
+
+LOG = logging.getLogger('epic_narrator.review')
+
+
+class ReviewEngine:
+    """
+    Plays the narrations of the video back to back, from the current position, at a configurable speed (VLC stretches
+    the audio preserving the pitch). Leading and trailing silence is skipped using the waveforms, and the video jumps to
+    each narration as it is played. The next few recordings are prefetched so moving from one clip to the next is
+    immediate.
+    """
+
+    def __init__(self, controller, speed=1.5, skip_silence=True, prefetch=3, silence_threshold=0.02):
+        self.controller = controller
+        self.speed = speed
+        self.skip_silence = skip_silence
+        self.prefetch = prefetch
+        self.silence_threshold = silence_threshold
+        self.is_active = False
+        self._queue = []
+        self._prefetched = set()
+
+    def start(self, from_time_ms):
+        self._queue = [t for t in self.controller.get_recording_times() if t >= from_time_ms]
+
+        if not self._queue:
+            LOG.info('Nothing to review after {}ms'.format(from_time_ms))
+            return False
+
+        LOG.info('Starting review of {} narrations at {}x'.format(len(self._queue), self.speed))
+        self.is_active = True
+        self.play_next()
+        return True
+
+    def stop(self):
+        if self.is_active:
+            LOG.info('Stopping review')
+
+        self.is_active = False
+        self._queue = []
+        self._prefetched = set()
+
+    def play_next(self):
+        if not self._queue:
+            LOG.info('Review finished')
+            self.stop()
+            return False
+
+        rec_time = self._queue.pop(0)
+        self.prefetch_next()
+        recording_path = self.controller.recordings.get_path_for_recording(rec_time)
+
+        if recording_path is None:  # deleted while reviewing
+            return self.play_next()
+
+        start_ms, stop_ms = self.get_clip_range(rec_time)
+        self.controller.go_to(rec_time, jumped=True)
+        self.controller.highlighted_rec = rec_time
+        self.controller.signal_sender.emit('set_highlighted_rec', rec_time, False)
+        self.controller.player.play_recording(recording_path, speed=self.speed, start_ms=start_ms, stop_ms=stop_ms)
+        return True
+
+    def get_clip_range(self, rec_time):
+        if not self.skip_silence:
+            return 0, None
+
+        # never blocks, if the waveform is not ready we just play the whole recording
+        waveform = self.controller.get_waveform(rec_time)
+
+        if waveform is None:
+            return 0, None
+
+        return waveform.get_active_range(threshold=self.silence_threshold)
+
+    def prefetch_next(self):
+        for rec_time in self._queue[:self.prefetch]:
+            if rec_time in self._prefetched:
+                continue
+
+            self._prefetched.add(rec_time)
+            recording_path = self.controller.recordings.get_path_for_recording(rec_time)
+
+            if recording_path is None:
+                continue
+
+            self.controller.get_waveform(rec_time)  # computed in the background if needed, to trim silence
+            threading.Thread(target=warm_up_file, args=(recording_path,), name='review-prefetch', daemon=True).start()
+
+
+def warm_up_file(path, chunk_size=1 << 16):
+    # reading the file once brings it into the OS cache, so VLC can open it immediately
+    try:
+        with open(path, 'rb') as f:
+            while f.read(chunk_size):
+                pass
+    except OSError:
+        LOG.warning('Could not prefetch {}'.format(path))
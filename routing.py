@@ -0,0 +1,31 @@
+import numpy as np
+
+
+class ChannelRouter:
+    """
+    Extracts the configured channels (numbered from 1) from the blocks of a stream that has `n_stream_channels`
+    channels, optionally mixing them down to mono. Blocks are returned as C-contiguous float32 arrays of shape
+    (frames, n_output_channels), which is what the sound file expects. When the configured channels are all the
+    channels of the stream the block is returned as it is, otherwise one copy is made.
+    """
+
+    def __init__(self, channels, n_stream_channels, downmix=False):
+        self.mapping = [c - 1 for c in channels]
+        self.downmix = downmix and len(channels) > 1
+        self.n_output_channels = 1 if self.downmix else len(channels)
+        first = self.mapping[0]
+
+        if self.mapping == list(range(n_stream_channels)):
+            self.selection = None
+        elif self.mapping == list(range(first, first + len(self.mapping))):
+            self.selection = slice(first, first + len(self.mapping))  # a contiguous range is copied in one go
+        else:
+            self.selection = self.mapping
+
+    def route(self, indata):
+        block = indata if self.selection is None else np.ascontiguousarray(indata[:, self.selection])
+
+        if self.downmix:
+            block = block.mean(axis=1, keepdims=True, dtype=np.float32)
+
+        return block
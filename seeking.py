@@ -0,0 +1,110 @@
+import time
+
+
+class SeekScheduler:
+    """
+    Keeps at most one seek in flight. Requests arriving while VLC is still seeking replace any pending request, so only
+    the latest target is sought once the current seek completes. A seek is considered complete when VLC reports a
+    position within `tolerance_ms` of its target or after `timeout_ms`, whichever comes first. VLC reports positions
+    all the time while playing, so any position would not tell that the seek was handled. Key frame seeks landing
+    further than `tolerance_ms` from their target are completed by the timeout.
+
+    The timer functions are given by the player (`GLib.timeout_add` and `GLib.source_remove`), so this does not
+    depend on GLib.
+    """
+
+    def __init__(self, set_time, add_timeout, remove_timeout, timeout_ms=250, tolerance_ms=1000):
+        self.set_time = set_time
+        self.add_timeout = add_timeout
+        self.remove_timeout = remove_timeout
+        self.timeout_ms = timeout_ms
+        self.tolerance_ms = tolerance_ms
+        self._in_flight = None  # (time_ms, fast, start time)
+        self._pending = None
+        self._timeout_id = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.n_requested = 0
+        self.n_issued = 0
+        self.n_dropped = 0
+        self.n_timed_out = 0
+        self.total_latency = 0
+        self.max_latency = 0
+        self.n_completed = 0
+
+    def reset(self):
+        if self._timeout_id != 0:
+            self.remove_timeout(self._timeout_id)
+
+        self._timeout_id = 0
+        self._in_flight = None
+        self._pending = None
+
+    def is_busy(self):
+        return self._in_flight is not None
+
+    def get_target(self):
+        if self._pending is not None:
+            return self._pending[0]
+        elif self._in_flight is not None:
+            return self._in_flight[0]
+        else:
+            return None
+
+    def request(self, time_ms, fast=False):
+        self.n_requested += 1
+
+        if self._in_flight is None:
+            self._issue(time_ms, fast)
+        else:
+            if self._pending is not None:
+                self.n_dropped += 1
+
+            self._pending = (time_ms, fast)
+
+    def _issue(self, time_ms, fast):
+        self.n_issued += 1
+        self._in_flight = (time_ms, fast, time.perf_counter())
+        self.set_time(time_ms, fast)
+        self._timeout_id = self.add_timeout(self.timeout_ms, self._timed_out)
+
+    def _timed_out(self):
+        self._timeout_id = 0
+        self.n_timed_out += 1
+        self.completed()
+        return False
+
+    def position_reported(self, time_ms):
+        """Called with the positions reported by VLC, completes the seek in flight if VLC got there"""
+        if self._in_flight is not None and abs(time_ms - self._in_flight[0]) <= self.tolerance_ms:
+            self.completed()
+
+    def completed(self):
+        if self._in_flight is None:
+            return
+
+        latency = (time.perf_counter() - self._in_flight[2]) * 1000
+        self.n_completed += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self._in_flight = None
+
+        if self._timeout_id != 0:
+            self.remove_timeout(self._timeout_id)
+            self._timeout_id = 0
+
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self._issue(*pending)
+
+    def get_stats(self):
+        return dict(requested=self.n_requested, issued=self.n_issued, dropped=self.n_dropped,
+                    timed_out=self.n_timed_out,
+                    mean_latency_ms=self.total_latency / self.n_completed if self.n_completed else 0,
+                    max_latency_ms=self.max_latency)
+
+
+def get_seek_step(held_for_s, step_ms, max_step_ms, doubling_time_s):
+    """The step of keyboard seeks, which doubles every `doubling_time_s` the key is held, up to `max_step_ms`"""
+    return min(max_step_ms, step_ms * 2 ** (held_for_s / doubling_time_s))
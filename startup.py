@@ -0,0 +1,40 @@
+import logging
+import time
+
+LOG = logging.getLogger('epic_narrator.startup')
+
+
+class StartupProfiler:
+    """
+    Times the phases of the startup. Phases are marked as they end, from whichever part of the narrator completes
+    them, and each one is printed with the time it took and the time since the start when profiling is enabled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases = []
+
+    def enable(self, start=None):
+        self.enabled = True
+
+        if start is not None:
+            self.start = start
+            self.last = start
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+
+        now = time.perf_counter()
+        took, total = now - self.last, now - self.start
+        self.phases.append((phase, took, total))
+        self.last = now
+        line = '[startup] {:<28} {:8.1f}ms {:8.1f}ms total'.format(phase, 1000 * took, 1000 * total)
+        print(line, flush=True)
+        LOG.info(line)
+
+
+# shared by all the modules, so it can be imported anywhere without passing it around
+PROFILER = StartupProfiler()
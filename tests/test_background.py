@@ -0,0 +1,88 @@
+import os
+import threading
+
+from background import BackgroundWorker, FileIndex, get_file_hash
+
+
+def test_index_entries_expire_when_the_file_changes(tmp_path):
+    video_path = tmp_path / 'video.mp4'
+    video_path.write_bytes(b'video')
+    index = FileIndex(str(tmp_path / 'index.yml'))
+
+    index.put(str(video_path), content_hash='abc')
+
+    assert index.get(str(video_path))['content_hash'] == 'abc'
+    assert FileIndex(str(tmp_path / 'index.yml')).get(str(video_path))['content_hash'] == 'abc'
+
+    video_path.write_bytes(b'another video')
+
+    assert index.get(str(video_path)) is None
+    assert index.get(str(tmp_path / 'missing.mp4')) is None
+
+
+def test_file_hash_changes_with_the_file_and_the_parameters(tmp_path):
+    video_path = tmp_path / 'video.mp4'
+    video_path.write_bytes(b'video')
+    file_hash = get_file_hash(str(video_path), 4, '64x36')
+
+    assert get_file_hash(str(video_path), 4, '64x36') == file_hash
+    assert get_file_hash(str(video_path), 8, '64x36') != file_hash
+
+    stat = os.stat(str(video_path))
+    os.utime(str(video_path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    assert get_file_hash(str(video_path), 4, '64x36') != file_hash
+
+
+def test_requests_in_the_works_add_their_callback():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+    stored = {}
+
+    def work(key, value):
+        calls.append(key)
+        started.set()
+        release.wait(5)
+        return value * 2
+
+    worker = BackgroundWorker(work, 'test-worker', 'Could not work on {}', store=stored.__setitem__)
+    worker.start()
+    worker.request('a', lambda key, result: results.append((key, result)), 21)
+    started.wait(5)
+    worker.request('a', lambda key, result: results.append((key, result)), 21)
+    release.set()
+
+    for _ in range(500):
+        if len(results) == 2:
+            break
+
+        threading.Event().wait(0.01)
+
+    assert calls == ['a']
+    assert results == [('a', 42), ('a', 42)]
+    assert stored == {'a': 42}
+
+
+def test_failures_are_logged_and_dropped(caplog):
+    results = []
+
+    def work(key):
+        raise ValueError(key)
+
+    worker = BackgroundWorker(work, 'test-worker', 'Could not work on {}')
+    worker.request('a', lambda key, result: results.append(result))
+
+    assert worker.run('a') is None
+    assert results == []
+    assert 'Could not work on a' in caplog.text
+
+    with worker.lock:
+        assert not worker.is_pending('a')
+
+    reporting = BackgroundWorker(work, 'test-worker', 'Could not work on {}', report_failures=True)
+    reporting.request('b', lambda key, result: results.append((key, result)))
+    reporting.run('b')
+
+    assert results == [('b', None)]
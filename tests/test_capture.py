@@ -0,0 +1,98 @@
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from capture import CaptureConnection, MonitorRing
+
+
+def make_frames(start, n_frames, n_channels=2):
+    # frame i holds i in every channel, so we can tell which frames we got back
+    return np.repeat(np.arange(start, start + n_frames, dtype=np.float32)[:, None], n_channels, axis=1)
+
+
+def test_frames_are_read_once():
+    ring = MonitorRing(8, 2)
+
+    assert ring.read() is None
+
+    ring.write(make_frames(0, 3))
+    ring.write(make_frames(3, 2))
+    np.testing.assert_array_equal(ring.read(), make_frames(0, 5))
+    assert ring.read() is None
+
+
+def test_writes_wrap_around():
+    ring = MonitorRing(8, 2)
+    ring.write(make_frames(0, 6))
+    ring.read()
+    ring.write(make_frames(6, 5))
+
+    np.testing.assert_array_equal(ring.read(), make_frames(6, 5))
+
+
+def test_slow_reader_gets_the_latest_frames():
+    ring = MonitorRing(8, 2)
+    ring.write(make_frames(0, 6))
+    ring.write(make_frames(6, 6))
+
+    np.testing.assert_array_equal(ring.read(), make_frames(4, 8))
+
+    # a block larger than the ring only leaves its end
+    ring.write(make_frames(12, 20))
+    np.testing.assert_array_equal(ring.read(), make_frames(24, 8))
+
+
+def serve(connection, replies):
+    # stands for the capture process, answering the requests in the order given by `replies`
+    connection.send((0, 'ok', 'started'))
+    requests = {}
+
+    for method in replies:
+        while method not in requests:
+            request_id, name, args = connection.recv()
+            requests[name] = (request_id, args)
+
+        request_id, args = requests.pop(method)
+        connection.send((request_id, 'ok', (method, args)))
+
+    connection.close()
+
+
+def test_replies_go_to_their_caller_and_sending_does_not_wait_for_them():
+    ours, theirs = multiprocessing.Pipe()
+    server = threading.Thread(target=serve, args=(theirs, ['stop_recording', 'get_stream_info']), daemon=True)
+    server.start()
+    connection = CaptureConnection(ours, timeout_s=5)
+    stopped = []
+
+    assert connection.receive_started() == 'started'
+
+    # the stream info is asked first but answered last, the stop request is sent while it waits for its reply
+    info = threading.Thread(target=lambda: stopped.append(connection.call('get_stream_info')), daemon=True)
+    info.start()
+    time.sleep(0.1)
+    connection.request('stop_recording', callback=lambda error, result: stopped.append(result))
+    info.join(5)
+
+    assert stopped == [('stop_recording', ()), ('get_stream_info', ())]
+
+
+def test_waiting_requests_fail_when_the_capture_process_is_gone():
+    ours, theirs = multiprocessing.Pipe()
+    connection = CaptureConnection(ours, timeout_s=5)
+    theirs.send((0, 'ok', 'started'))
+    connection.receive_started()
+    errors = []
+
+    connection.request('stop_recording', callback=lambda error, result: errors.append(error))
+    theirs.recv()
+    theirs.close()  # without answering
+
+    with pytest.raises(RuntimeError):
+        connection.call('stop_recording')
+
+    connection._reader.join(5)
+    assert errors == ['The capture process is gone']
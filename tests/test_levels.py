@@ -0,0 +1,94 @@
+import numpy as np
+
+from levels import LevelMeter, TakeStats, to_db
+
+
+def constant_block(values, n_frames=100):
+    return np.tile(np.asarray(values, dtype=np.float32), (n_frames, 1))
+
+
+def test_to_db():
+    assert to_db(1) == 0
+    assert to_db(0.1) == -20
+    assert to_db(0) == -120
+
+
+def test_nothing_to_read_before_the_first_block():
+    assert LevelMeter(2).read() is None
+
+
+def test_levels_since_the_previous_read():
+    meter = LevelMeter(2)
+    meter.add_block(constant_block([0.5, -0.25]))
+    meter.add_block(constant_block([0.1, 1.0]))
+
+    levels = meter.read()
+    np.testing.assert_allclose(levels['peak'], [0.5, 1.0])
+    np.testing.assert_allclose(levels['rms'], [np.sqrt((0.25 + 0.01) / 2), np.sqrt((0.0625 + 1) / 2)], rtol=1e-6)
+    np.testing.assert_array_equal(levels['clips'], [0, 100])
+
+    assert meter.read() is None
+
+    # the next read only sees what came after the previous one
+    meter.add_block(constant_block([0.2, 0.2]))
+    levels = meter.read()
+    np.testing.assert_allclose(levels['peak'], [0.2, 0.2], rtol=1e-6)
+    np.testing.assert_array_equal(levels['clips'], [0, 0])
+
+
+def test_every_read_after_a_block_has_levels():
+    meter = LevelMeter(1)
+    n_clips = 0
+
+    for i in range(10):
+        meter.add_block(constant_block([1.0 if i % 3 == 0 else 0.5], n_frames=10))
+        levels = meter.read()
+
+        assert levels is not None
+        n_clips += levels['clips'][0]
+
+    # no block is lost between reads
+    assert n_clips == 40
+
+
+def test_peak_of_the_last_blocks_only_if_read_late():
+    meter = LevelMeter(1, history=4)
+    meter.add_block(constant_block([0.9]))
+
+    for _ in range(4):
+        meter.add_block(constant_block([0.1]))
+
+    levels = meter.read()
+    np.testing.assert_allclose(levels['peak'], [0.1], rtol=1e-6)
+    # the sums are not limited by the history
+    np.testing.assert_allclose(levels['rms'], [np.sqrt((0.81 + 4 * 0.01) / 5)], rtol=1e-6)
+
+
+def test_take_stats():
+    stats = TakeStats()
+    stats.add_block(constant_block([0.1, -1.0]))
+    stats.add_block(np.zeros((0, 2), dtype=np.float32))
+
+    result = stats.get_stats()
+    assert result['peak_db'] == 0
+    assert result['rms_db'] == to_db(np.sqrt((0.01 + 1) / 2))
+    assert result['clipped'] == 100
+
+
+def test_take_stats_leave_the_pauses_out_of_the_voiced_level():
+    stats = TakeStats(voice_gate_db=-50)
+    stats.add_block(constant_block([0.1]))
+
+    for _ in range(9):
+        stats.add_block(constant_block([0.001]))  # -60 dBFS, a pause
+
+    result = stats.get_stats()
+    assert result['voiced_rms_db'] == -20
+    assert result['rms_db'] < -29
+
+
+def test_silent_take_has_no_voiced_level():
+    stats = TakeStats()
+    stats.add_block(np.zeros((100, 1), dtype=np.float32))
+
+    assert stats.get_stats()['voiced_rms_db'] == -120
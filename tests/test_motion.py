@@ -0,0 +1,29 @@
+import logging
+
+import numpy as np
+
+from motion import MotionAnalyzer, MotionIndex
+
+
+def test_static_spans():
+    energy = np.array([5, 5, 0, 0, 0, 0, 5, 0, 0, 5], dtype=np.float32)
+    index = MotionIndex(energy, threshold=1, min_static_s=3)
+
+    # the short pause at 7s is not skipped
+    assert index.get_static_spans() == [(2000, 6000)]
+    assert index.is_static(2500)
+    assert not index.is_static(7500)
+    assert not index.is_static(60000)
+
+
+def test_video_of_unknown_length_is_not_analysed(tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    video_path = tmp_path / 'P01_01.mp4'
+    video_path.write_bytes(b'')
+    analyzer = MotionAnalyzer(workers=1)
+
+    with caplog.at_level(logging.INFO, logger='epic_narrator.motion'):
+        assert analyzer._worker.run(str(video_path), 0) is None
+
+    assert analyzer.compute(str(video_path), None) is None
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
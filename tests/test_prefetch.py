@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from prefetch import ReadAheadPrefetcher
+
+
+@pytest.fixture
+def prefetcher(tmp_path):
+    # 100 chunks of 1kB for a 100s video, i.e. one chunk per second
+    video_path = tmp_path / 'P01_01.mp4'
+    video_path.write_bytes(bytes(100 * 1024))
+    prefetcher = ReadAheadPrefetcher(budget_mb=1, chunk_kb=1, read_ahead_s=3)
+    prefetcher.set_video(str(video_path), 100000)
+
+    return prefetcher
+
+
+def wait_for_reads(prefetcher, timeout_s=5):
+    deadline = time.time() + timeout_s
+
+    while prefetcher._queue or prefetcher._targets:
+        assert time.time() < deadline, 'the read ahead worker did not catch up'
+        time.sleep(0.01)
+
+    time.sleep(0.05)  # the last chunk popped may still be being read
+
+
+def test_read_ahead_follows_the_playhead(prefetcher):
+    # holding the condition keeps the worker from taking chunks off the queues while we look at them
+    with prefetcher._condition:
+        prefetcher.update(10000)
+        assert list(prefetcher._queue) == [10, 11, 12, 13]
+
+        prefetcher.update(50000, direction=-1)
+        assert list(prefetcher._queue) == [50, 49, 48, 47]
+
+
+def test_moving_the_playhead_keeps_the_narration_targets(prefetcher):
+    with prefetcher._condition:
+        prefetcher.prefetch_times([80000], window_ms=1000)
+        prefetcher.update(10000)
+        prefetcher.update(20000)
+
+        assert list(prefetcher._targets) == [79, 80, 81]
+        assert list(prefetcher._queue) == [20, 21, 22, 23]
+
+    wait_for_reads(prefetcher)
+
+    assert all(chunk in prefetcher._chunks for chunk in (20, 23, 79, 80, 81))
+
+
+def test_hits_and_misses(prefetcher):
+    prefetcher.update(10000)
+    wait_for_reads(prefetcher)
+    assert prefetcher.get_stats()['misses'] == 1
+
+    for time_ms in (11000, 11500, 12000, 13000):
+        prefetcher.update(time_ms)
+
+    stats = prefetcher.get_stats()
+    # the same chunk is only counted once
+    assert (stats['hits'], stats['misses']) == (3, 1)
+
+    prefetcher.set_video(None, 0)
+    assert not prefetcher.is_enabled()
+    assert prefetcher.get_stats()['hits'] == 0
@@ -0,0 +1,92 @@
+import io
+
+import pytest
+
+from recordings import Recordings, get_take_issues
+
+
+@pytest.fixture
+def recordings(tmp_path):
+    recordings = Recordings(str(tmp_path), str(tmp_path / 'P01_01.mp4'))
+
+    for time_ms in (3000, 1000, 2000, 5000):
+        recordings.add_recording(time_ms)
+
+    return recordings
+
+
+def test_recordings_are_kept_sorted(recordings):
+    assert recordings.get_recordings_times() == [1000, 2000, 3000, 5000]
+
+
+def test_recordings_between_excludes_start_and_includes_end(recordings):
+    assert recordings.get_recordings_between(1000, 3000) == [2000, 3000]
+    assert recordings.get_recordings_between(999, 1000) == [1000]
+    assert recordings.get_recordings_between(3000, 4999) == []
+    assert recordings.get_recordings_between(5000, 9000) == []
+
+
+def test_next_recording_is_strictly_after(recordings):
+    assert recordings.get_next_recording(0) == 1000
+    assert recordings.get_next_recording(1000) == 2000
+    assert recordings.get_next_recording(2999) == 3000
+    assert recordings.get_next_recording(5000) is None
+
+
+def test_recording_just_made_is_not_next(recordings):
+    # the narration timer starts from the time of the recording that was just made
+    path, rec_index = recordings.add_recording(4000)
+
+    assert rec_index == 3
+    assert recordings.get_next_recording(4000) == 5000
+
+
+def test_metadata_is_kept_next_to_the_recordings(recordings, tmp_path):
+    recordings.set_metadata(1000, overflows=2)
+    recordings.set_metadata(1000, clipped=0)
+
+    reloaded = Recordings(str(tmp_path), str(tmp_path / 'P01_01.mp4'))
+    reloaded.load_narrations(audio_files=[])
+
+    assert reloaded.get_metadata(1000) == dict(overflows=2, clipped=0)
+    assert reloaded.get_metadata(2000) == {}
+
+
+def test_overwriting_a_recording_discards_its_metadata(recordings):
+    recordings.set_metadata(2000, overflows=1)
+    recordings.set_metadata(3000, overflows=4)
+    recordings.add_recording(2000, overwrite=True)
+
+    assert recordings.get_metadata(2000) == {}
+    assert recordings.get_metadata(3000) == dict(overflows=4)
+    assert recordings.load_metadata() == {3000: dict(overflows=4)}
+
+
+def test_take_issues():
+    assert get_take_issues({}) == []
+    assert get_take_issues(dict(clipped=3, rms_db=-60, overflows=1)) == ['clipped', 'quiet', 'dropouts']
+    # the level while speaking is what matters, if we have it
+    assert get_take_issues(dict(rms_db=-60, voiced_rms_db=-30)) == []
+    assert get_take_issues(dict(rms_db=-40, voiced_rms_db=-120)) == ['quiet']
+
+
+def test_report(recordings, tmp_path):
+    for time_ms in (1000, 2000):
+        open(recordings.get_path_for_recording(time_ms), 'w').close()
+
+    recordings.set_metadata(1000, peak_db=-3.0, rms_db=-30.0, voiced_rms_db=-20.0, clipped=2, overflows=0)
+    report = io.StringIO()
+    Recordings.write_report(str(tmp_path), report)
+
+    lines = report.getvalue().splitlines()
+    assert lines[0] == 'video,time_ms,timestamp,peak_db,rms_db,voiced_rms_db,clipped,overflows,issues'
+    assert lines[1:] == ['P01_01,1000,00:00:01.000,-3.0,-30.0,-20.0,2,0,clipped',
+                         'P01_01,2000,00:00:02.000,,,,,,unchecked']
+
+
+def test_report_without_narrations(tmp_path):
+    report = io.StringIO()
+    Recordings.write_report(str(tmp_path), report)
+
+    assert report.getvalue().splitlines() == [
+        'video,time_ms,timestamp,peak_db,rms_db,voiced_rms_db,clipped,overflows,issues']
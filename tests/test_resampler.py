@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+import pytest
+
+from resampler import StreamingResampler
+
+
+def sine(frequency, rate, n_frames, n_channels=1):
+    t = np.arange(n_frames) / rate
+    return np.repeat(np.sin(2 * np.pi * frequency * t)[:, None], n_channels, axis=1).astype(np.float32)
+
+
+def resample_in_blocks(resampler, signal, block_sizes):
+    outputs = []
+    start = 0
+
+    for block_size in block_sizes:
+        outputs.append(resampler.process(signal[start:start + block_size]))
+        start += block_size
+
+    outputs.append(resampler.process(signal[start:]))
+    outputs.append(resampler.flush())
+
+    return np.concatenate(outputs)
+
+
+@pytest.mark.parametrize('input_rate, output_rate', [(44100, 16000), (48000, 44100), (16000, 48000)])
+def test_output_length_does_not_depend_on_the_blocks(input_rate, output_rate):
+    signal = sine(440, input_rate, input_rate // 2, n_channels=2)
+    block_sizes = np.random.RandomState(0).randint(0, 1500, size=10)
+    output = resample_in_blocks(StreamingResampler(input_rate, output_rate, 2), signal, block_sizes)
+
+    assert output.shape == (math.ceil(len(signal) * output_rate / input_rate), 2)
+    assert output.dtype == np.float32
+
+
+@pytest.mark.parametrize('input_rate, output_rate', [(44100, 16000), (48000, 44100), (16000, 48000)])
+def test_sine_is_resampled_in_phase(input_rate, output_rate):
+    frequency = 1000
+    signal = sine(frequency, input_rate, input_rate)
+    output = resample_in_blocks(StreamingResampler(input_rate, output_rate, 1), signal, [256] * 20)
+    expected = sine(frequency, output_rate, len(output))
+
+    # away from the edges, where the filter sees the zeros before and after the signal
+    margin = output_rate // 100
+    error = np.abs(output[margin:-margin] - expected[margin:-margin]).max()
+
+    assert error < 1e-2
+
+
+def test_same_rate_keeps_the_signal():
+    signal = sine(1000, 16000, 4000, n_channels=2)
+    output = resample_in_blocks(StreamingResampler(16000, 16000, 2), signal, [1000, 7, 993])
+
+    assert output.shape == signal.shape
+    np.testing.assert_allclose(output[100:-100], signal[100:-100], atol=1e-2)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from routing import ChannelRouter
+
+
+def make_block(n_frames=8, n_channels=4):
+    # channel c holds c + 1 plus a small ramp, so we can tell the channels apart
+    ramp = np.linspace(0, 0.01, n_frames, dtype=np.float32)[:, None]
+    return ramp + np.arange(1, n_channels + 1, dtype=np.float32)[None, :]
+
+
+def test_all_channels_are_passed_through():
+    block = make_block(n_channels=2)
+    router = ChannelRouter([1, 2], 2)
+
+    assert router.n_output_channels == 2
+    assert router.route(block) is block
+
+
+def test_contiguous_channels_are_sliced():
+    block = make_block()
+    routed = ChannelRouter([2, 3], 4).route(block)
+
+    assert routed.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(routed, block[:, 1:3])
+
+
+def test_channels_in_any_order():
+    block = make_block()
+    router = ChannelRouter([4, 1], 4)
+    routed = router.route(block)
+
+    assert router.n_output_channels == 2
+    assert routed.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(routed, block[:, [3, 0]])
+
+
+def test_downmix_to_mono():
+    block = make_block()
+    router = ChannelRouter([1, 3], 4, downmix=True)
+    routed = router.route(block)
+
+    assert router.n_output_channels == 1
+    assert routed.dtype == np.float32 and routed.shape == (8, 1)
+    np.testing.assert_allclose(routed[:, 0], (block[:, 0] + block[:, 2]) / 2, rtol=1e-6)
+
+
+def test_downmix_of_a_single_channel_does_nothing():
+    block = make_block(n_channels=1)
+    router = ChannelRouter([1], 1, downmix=True)
+
+    assert not router.downmix
+    assert router.route(block) is block
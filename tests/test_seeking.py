@@ -0,0 +1,104 @@
+from seeking import SeekScheduler, get_seek_step
+
+
+class FakeTimer:
+    def __init__(self):
+        self.timeouts = {}
+        self.next_id = 1
+
+    def add(self, timeout_ms, callback):
+        timeout_id = self.next_id
+        self.next_id += 1
+        self.timeouts[timeout_id] = callback
+        return timeout_id
+
+    def remove(self, timeout_id):
+        del self.timeouts[timeout_id]
+
+    def fire_all(self):
+        for timeout_id, callback in list(self.timeouts.items()):
+            del self.timeouts[timeout_id]
+            callback()
+
+
+def make_scheduler():
+    sought = []
+    timer = FakeTimer()
+    scheduler = SeekScheduler(lambda time_ms, fast: sought.append((time_ms, fast)), timer.add, timer.remove)
+    return scheduler, sought, timer
+
+
+def test_only_the_latest_request_is_sought_after_the_one_in_flight():
+    scheduler, sought, timer = make_scheduler()
+
+    for time_ms in (1000, 2000, 3000, 4000):
+        scheduler.request(time_ms, fast=True)
+
+    assert sought == [(1000, True)]
+    assert scheduler.get_target() == 4000
+
+    scheduler.completed()
+
+    assert sought == [(1000, True), (4000, True)]
+    assert scheduler.get_stats()['dropped'] == 2
+    assert len(timer.timeouts) == 1  # the timeout of the first seek was removed
+
+
+def test_timeout_completes_the_seek():
+    scheduler, sought, timer = make_scheduler()
+    scheduler.request(1000)
+    scheduler.request(2000)
+
+    timer.fire_all()
+
+    assert sought == [(1000, False), (2000, False)]
+    assert scheduler.get_stats()['timed_out'] == 1
+    assert scheduler.is_busy()
+
+
+def test_reset_forgets_pending_seeks():
+    scheduler, sought, timer = make_scheduler()
+    scheduler.request(1000)
+    scheduler.request(2000)
+
+    scheduler.reset()
+    scheduler.completed()
+
+    assert sought == [(1000, False)]
+    assert not scheduler.is_busy()
+    assert scheduler.get_target() is None
+    assert not timer.timeouts
+
+
+def test_seek_step_doubles_while_the_key_is_held():
+    assert get_seek_step(0, 500, 60000, 1) == 500
+    assert get_seek_step(1, 500, 60000, 1) == 1000
+    assert get_seek_step(3, 500, 60000, 1) == 4000
+    assert get_seek_step(0.5, 500, 60000, 1) == 500 * 2 ** 0.5
+
+
+def test_seek_step_is_capped():
+    assert get_seek_step(20, 500, 60000, 1) == 60000
+
+
+def test_seek_completes_once_vlc_reports_its_target():
+    scheduler, sought, timer = make_scheduler()
+    scheduler.request(10000)
+    scheduler.request(20000)
+
+    # the video is still playing where it was, VLC has not handled the seek yet
+    scheduler.position_reported(3000)
+    scheduler.position_reported(3040)
+
+    assert sought == [(10000, False)]
+    assert scheduler.get_stats()['dropped'] == 0
+
+    scheduler.position_reported(10020)
+
+    assert sought == [(10000, False), (20000, False)]
+    assert scheduler.get_target() == 20000
+
+    scheduler.position_reported(20000)
+
+    assert not scheduler.is_busy()
+    assert not timer.timeouts
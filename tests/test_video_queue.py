@@ -0,0 +1,50 @@
+from work_queue import VideoQueue
+
+
+def make_videos(folder, names):
+    for name in names:
+        (folder / name).write_bytes(b'')
+
+
+def test_queue_from_folder_keeps_videos_in_order(tmp_path):
+    make_videos(tmp_path, ['P01_02.MP4', 'P01_01.mp4', 'notes.txt', 'P01_03.mkv'])
+    video_queue = VideoQueue.from_path(str(tmp_path))
+
+    assert [v.rsplit('/', 1)[1] for v in video_queue.videos] == ['P01_01.mp4', 'P01_02.MP4', 'P01_03.mkv']
+
+
+def test_queue_from_list_file(tmp_path):
+    (tmp_path / 'videos').mkdir()
+    make_videos(tmp_path / 'videos', ['P01_01.mp4', 'P01_02.mp4'])
+    list_path = tmp_path / 'queue.txt'
+    list_path.write_text('# to narrate this week\n\nvideos/P01_02.mp4\n{}\nvideos/P01_09.mp4\n'.format(
+        tmp_path / 'videos' / 'P01_01.mp4'))
+
+    video_queue = VideoQueue.from_path(str(list_path))
+
+    # relative paths are relative to the list, and missing videos are skipped
+    assert video_queue.videos == [str(tmp_path / 'videos' / 'P01_02.mp4'), str(tmp_path / 'videos' / 'P01_01.mp4')]
+
+
+def test_advance_and_move_to():
+    video_queue = VideoQueue(['/videos/a.mp4', '/videos/b.mp4', '/videos/c.mp4'])
+
+    assert video_queue.get_current() == '/videos/a.mp4'
+    assert video_queue.get_next() == '/videos/b.mp4'
+    assert video_queue.advance() == '/videos/b.mp4'
+
+    assert video_queue.move_to('/videos/c.mp4')
+    assert not video_queue.has_next()
+    assert video_queue.get_next() is None
+    assert video_queue.advance() == '/videos/c.mp4'
+
+    assert not video_queue.move_to('/videos/d.mp4')
+    assert video_queue.get_current() == '/videos/c.mp4'
+
+
+def test_empty_queue():
+    video_queue = VideoQueue([], position=3)
+
+    assert len(video_queue) == 0
+    assert video_queue.get_current() is None
+    assert video_queue.advance() is None
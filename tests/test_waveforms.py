@@ -0,0 +1,63 @@
+import wave
+
+import numpy as np
+
+from waveforms import WaveformCache, open_pcm
+
+
+def write_wav(path, samples, sample_rate=16000):
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.astype('<i2').tobytes())
+
+
+def test_open_pcm_memory_maps_16_bit_wav(tmp_path):
+    audio_path = tmp_path / '1000.wav'
+    write_wav(audio_path, np.arange(-500, 500))
+
+    sample_rate, samples = open_pcm(str(audio_path))
+
+    assert sample_rate == 16000
+    assert samples.shape == (1000, 1)
+    assert samples[0, 0] == -500 and samples[-1, 0] == 499
+
+
+def test_peaks_round_trip(tmp_path):
+    audio_path = tmp_path / '1000.wav'
+    write_wav(audio_path, (np.sin(np.arange(10000) / 10) * 20000))
+    cache = WaveformCache(base_bin=128, min_bins=4)
+    waveform = cache.compute(str(audio_path))
+    peaks_path = WaveformCache.get_peaks_path(str(audio_path))
+
+    cache.save(peaks_path, waveform, 1234, 5678)
+    loaded = cache.load(peaks_path, 1234, 5678)
+
+    assert loaded.sample_rate == waveform.sample_rate
+    assert loaded.n_frames == waveform.n_frames == 10000
+    assert loaded.base_bin == 128
+    assert len(loaded.levels) == len(waveform.levels)
+
+    for (mins, maxs), (loaded_mins, loaded_maxs) in zip(waveform.levels, loaded.levels):
+        np.testing.assert_array_equal(mins, loaded_mins)
+        np.testing.assert_array_equal(maxs, loaded_maxs)
+
+
+def test_peaks_are_stale_when_the_recording_changes(tmp_path):
+    audio_path = tmp_path / '1000.wav'
+    write_wav(audio_path, np.zeros(1000))
+    cache = WaveformCache()
+    peaks_path = WaveformCache.get_peaks_path(str(audio_path))
+    cache.save(peaks_path, cache.compute(str(audio_path)), 1234, 5678)
+
+    assert cache.load(peaks_path, 1235, 5678) is None
+    assert cache.load(peaks_path, 1234, 5679) is None
+
+
+def test_pyramid_halves_resolution():
+    cache = WaveformCache(base_bin=2, min_bins=2)
+    mins, maxs = cache.compute_base_level(np.array([[0.], [0.5], [-0.5], [0.], [1.], [0.]], dtype=np.float32))
+
+    np.testing.assert_array_equal(mins, [0, -16383, 0])
+    np.testing.assert_array_equal(maxs, [16383, 0, 32767])
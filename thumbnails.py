@@ -0,0 +1,209 @@
+import collections
+import logging
+import math
+import os
+import shutil
+import subprocess
+import threading
+
+import gi
+import yaml
+
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf
+from background import BackgroundWorker, get_file_hash
+from settings import Settings
+
+LOG = logging.getLogger('epic_narrator.thumbnails')
+
+
+class PixbufCache:
+    """
+    LRU cache of pixbufs capped by the memory they take rather than by their number, as a whole sprite sheet takes
+    megabytes while a thumbnail takes a few kilobytes. The most recent pixbuf is always kept, even if it is larger
+    than the cap on its own.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self._pixbufs = collections.OrderedDict()  # key -> (pixbuf, size in bytes)
+
+    def __contains__(self, key):
+        return key in self._pixbufs
+
+    def get(self, key):
+        if key not in self._pixbufs:
+            return None
+
+        self._pixbufs.move_to_end(key)
+        return self._pixbufs[key][0]
+
+    def put(self, key, pixbuf):
+        if key in self._pixbufs:
+            self.n_bytes -= self._pixbufs.pop(key)[1]
+
+        size = pixbuf.get_rowstride() * pixbuf.get_height()
+        self._pixbufs[key] = (pixbuf, size)
+        self.n_bytes += size
+
+        while self.n_bytes > self.max_bytes and len(self._pixbufs) > 1:
+            _, (_, evicted_size) = self._pixbufs.popitem(last=False)
+            self.n_bytes -= evicted_size
+
+
+class ThumbnailSheet:
+    def __init__(self, sheet_path, interval_ms, width, height, columns, count):
+        self.sheet_path = sheet_path
+        self.interval_ms = interval_ms
+        self.width = width
+        self.height = height
+        self.columns = columns
+        self.count = count
+
+    def get_index(self, time_ms):
+        return max(0, min(self.count - 1, int(round(time_ms / self.interval_ms))))
+
+    def get_rectangle(self, index):
+        return (index % self.columns) * self.width, (index // self.columns) * self.height, self.width, self.height
+
+
+class ThumbnailCache:
+    """
+    Extracts thumbnails at a fixed interval with ffmpeg in a background thread, storing all the thumbnails of a video
+    in a single sprite sheet under the narrator directory. Decoded sheets and cropped thumbnails are kept in LRU caches
+    so hovering the slider never touches the disk or the video.
+    """
+
+    def __init__(self, interval_ms=5000, width=160, height=90, columns=30, max_thumbnails=1500,
+                 max_sheets_mb=96, max_cached_thumbnails_mb=16):
+        LOG.info('Creating thumbnail cache')
+        self.interval_ms = interval_ms
+        self.width = width
+        self.height = height
+        self.columns = columns
+        self.max_thumbnails = max_thumbnails
+        self.cache_folder = os.path.join(Settings.get_epic_narrator_directory(), 'thumbnails')
+        self.ffmpeg = shutil.which('ffmpeg')
+        self._sheets = {}  # video path -> ThumbnailSheet
+        # a decoded sheet of 1500 thumbnails takes about 65MB, so this keeps the sheet of the current video
+        self._pixbufs = PixbufCache(max_sheets_mb * 1024 * 1024)  # sheet path -> decoded sheet
+        self._thumbnails = PixbufCache(max_cached_thumbnails_mb * 1024 * 1024)  # (sheet path, index) -> thumbnail
+        self._lock = threading.Lock()
+        self._worker = BackgroundWorker(self.load_or_extract, 'thumbnail-worker', 'Could not extract thumbnails for {}',
+                                        log=LOG, lock=self._lock, store=self._store_sheet)
+
+        if self.ffmpeg is None:
+            LOG.warning('ffmpeg not found, slider previews will not be available')
+        else:
+            os.makedirs(self.cache_folder, exist_ok=True)
+            self._worker.start()
+
+    def is_available(self):
+        return self.ffmpeg is not None
+
+    def has_thumbnails(self, video_path):
+        with self._lock:
+            return video_path in self._sheets
+
+    def request(self, video_path, video_length, callback=None):
+        """
+        Loads or extracts the thumbnails of the video in the background.
+        `callback(video_path)` is called from the worker thread when the thumbnails are ready
+        """
+        if not self.is_available():
+            return
+
+        with self._lock:
+            if video_path in self._sheets:
+                return
+
+        self._worker.request(video_path, (lambda path, sheet: callback(path)) if callback is not None else None,
+                             video_length)
+
+    def get_thumbnail(self, video_path, time_ms):
+        with self._lock:
+            sheet = self._sheets.get(video_path, None)
+
+            if sheet is None:
+                return None
+
+            index = sheet.get_index(time_ms)
+            key = (sheet.sheet_path, index)
+
+            if key in self._thumbnails:
+                return self._thumbnails.get(key)
+
+            sheet_pixbuf = self._get_sheet_pixbuf(sheet)
+
+            if sheet_pixbuf is None:
+                return None
+
+            x, y, w, h = sheet.get_rectangle(index)
+            thumbnail = sheet_pixbuf.new_subpixbuf(x, y, w, h).copy()
+            self._thumbnails.put(key, thumbnail)
+
+            return thumbnail
+
+    def _get_sheet_pixbuf(self, sheet):
+        if sheet.sheet_path in self._pixbufs:
+            return self._pixbufs.get(sheet.sheet_path)
+
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(sheet.sheet_path)
+        except Exception:
+            LOG.exception('Could not read thumbnails {}'.format(sheet.sheet_path))
+            return None
+
+        self._pixbufs.put(sheet.sheet_path, pixbuf)
+
+        return pixbuf
+
+    def _store_sheet(self, video_path, sheet):
+        # called by the worker under the lock, decoding the sheet here keeps the first hover cheap
+        self._sheets[video_path] = sheet
+        self._get_sheet_pixbuf(sheet)
+
+    def get_interval(self, video_length):
+        # long videos get a coarser interval so the sheet stays within a reasonable size
+        return max(self.interval_ms, int(math.ceil(video_length / self.max_thumbnails)))
+
+    def get_cache_key(self, video_path, interval_ms):
+        return get_file_hash(video_path, interval_ms, '{}x{}'.format(self.width, self.height))
+
+    def load_or_extract(self, video_path, video_length):
+        interval_ms = self.get_interval(video_length)
+        key = self.get_cache_key(video_path, interval_ms)
+        sheet_path = os.path.join(self.cache_folder, '{}.jpg'.format(key))
+        index_path = os.path.join(self.cache_folder, '{}.yml'.format(key))
+
+        if os.path.exists(sheet_path) and os.path.exists(index_path):
+            with open(index_path) as f:
+                index = yaml.load(f, Loader=yaml.FullLoader)
+
+            LOG.info('Loaded thumbnails for {} from {}'.format(video_path, sheet_path))
+            return ThumbnailSheet(sheet_path, **index)
+
+        count = max(1, int(math.ceil(video_length / interval_ms)))
+        columns = min(self.columns, count)
+        rows = int(math.ceil(count / columns))
+        LOG.info('Extracting {} thumbnails from {} every {}ms'.format(count, video_path, interval_ms))
+
+        video_filter = 'fps=1000/{},scale={w}:{h}:force_original_aspect_ratio=decrease,' \
+                       'pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,tile={c}x{r}'.format(interval_ms, w=self.width, h=self.height,
+                                                                            c=columns, r=rows)
+        tmp_path = os.path.join(self.cache_folder, '{}.tmp.jpg'.format(key))
+
+        # decoding only key frames is much faster and good enough for previews
+        subprocess.run([self.ffmpeg, '-nostdin', '-v', 'error', '-skip_frame', 'nokey', '-i', video_path,
+                        '-vf', video_filter, '-frames:v', '1', '-q:v', '5', '-y', tmp_path],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+        index = dict(interval_ms=interval_ms, width=self.width, height=self.height, columns=columns, count=count)
+
+        with open(index_path, 'w') as f:
+            yaml.dump(index, f, default_flow_style=False)
+
+        os.replace(tmp_path, sheet_path)
+
+        return ThumbnailSheet(sheet_path, **index)
@@ -1,25 +1,145 @@
 import logging
 import os
 import queue
-import matplotlib as mpl
+import time
 
 from __version__ import __version__, __author__
 
-mpl.use('PS')
-import matplotlib.pyplot as plt
 import gi
 import numpy as np
 
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk, Pango, GObject, GdkPixbuf
-from matplotlib.animation import FuncAnimation
-from matplotlib.backends.backend_gtk3agg import (FigureCanvasGTK3Agg as FigureCanvas)
 from recordings import ms_to_timestamp
+from startup import PROFILER
 
 
 LOG = logging.getLogger('epic_narrator.ui')
 
 
+class FrameScheduler:
+    """
+    Drives the periodic updates of the interface from the frame clock of a window, so they happen at most once per
+    frame and not at all while the window is minimised or covered by other windows. Each task runs when at least its
+    interval has passed since it last ran, tasks without an interval run at the next frame after `schedule` is called.
+    While the window is hidden, tasks with a `hidden_callback` (e.g. to drain a queue) are run from a slow timer
+    instead.
+
+    The tick callback keeps the frame clock running, so it is only there while a task is due within a frame or so.
+    Otherwise it is removed, and added again by a timer when the next task is due or when a task is scheduled.
+    """
+
+    def __init__(self, window, hidden_interval_ms=1000, min_sleep_ms=50):
+        self.window = window
+        self.hidden_interval_ms = hidden_interval_ms
+        self.min_sleep_ms = min_sleep_ms
+        self.tasks = {}  # name -> [callback, interval_ms, hidden_callback, last run in microseconds (0 when due)]
+        self.is_iconified = False
+        self.is_obscured = False
+        self._hidden_timeout = 0
+        self._tick_id = 0
+        self._wake_timeout = 0
+        window.add_events(Gdk.EventMask.VISIBILITY_NOTIFY_MASK)
+        window.connect('window-state-event', self.window_state_changed)
+        window.connect('visibility-notify-event', self.visibility_changed)
+        # after the default handler, which is what marks the window as mapped
+        window.connect_after('map', self.window_mapped)
+
+    def add(self, name, callback, interval_ms=None, hidden_callback=None):
+        self.tasks[name] = [callback, interval_ms, hidden_callback, 0]
+        self.start_ticking()
+
+    def set_interval(self, name, interval_ms):
+        self.tasks[name][1] = interval_ms
+        self.start_ticking()  # the task may be due sooner than when we planned to wake up
+
+    def schedule(self, name):
+        """Runs the task at the next frame"""
+        self.tasks[name][3] = 0
+        self.start_ticking()
+
+    def is_visible(self):
+        return self.window.get_mapped() and not self.is_iconified and not self.is_obscured
+
+    def start_ticking(self):
+        if self._wake_timeout != 0:
+            GLib.source_remove(self._wake_timeout)
+            self._wake_timeout = 0
+
+        if self._tick_id == 0 and self.tasks and self.is_visible():
+            self._tick_id = self.window.add_tick_callback(self.tick)
+
+    def wake_up(self):
+        self._wake_timeout = 0
+        self.start_ticking()
+        return False
+
+    def get_next_run(self, now):
+        """Returns when the next task is due in microseconds, or None if no task will be unless it is scheduled"""
+        next_runs = [now if last_run == 0 else last_run + interval_ms * 1000
+                     for _, interval_ms, _, last_run in self.tasks.values() if last_run == 0 or interval_ms is not None]
+
+        return min(next_runs) if next_runs else None
+
+    def tick(self, widget, frame_clock):
+        if not self.is_visible():
+            self._tick_id = 0
+            return False
+
+        now = frame_clock.get_frame_time()  # microseconds
+
+        for task in list(self.tasks.values()):
+            callback, interval_ms, _, last_run = task
+
+            if last_run == 0 or (interval_ms is not None and now - last_run >= interval_ms * 1000):
+                task[3] = now
+                callback()
+
+        next_run = self.get_next_run(now)
+
+        if next_run is not None and next_run - now < self.min_sleep_ms * 1000:
+            return True
+
+        self._tick_id = 0
+
+        if next_run is not None:
+            self._wake_timeout = GLib.timeout_add((next_run - now) // 1000, self.wake_up)
+
+        return False
+
+    def window_mapped(self, widget):
+        self.start_ticking()
+
+    def window_state_changed(self, widget, event):
+        self.is_iconified = bool(event.new_window_state & (Gdk.WindowState.ICONIFIED | Gdk.WindowState.WITHDRAWN))
+        self.visibility_updated()
+
+    def visibility_changed(self, widget, event):
+        self.is_obscured = event.state == Gdk.VisibilityState.FULLY_OBSCURED
+        self.visibility_updated()
+
+    def visibility_updated(self):
+        if self.is_visible():
+            if self._hidden_timeout != 0:
+                GLib.source_remove(self._hidden_timeout)
+                self._hidden_timeout = 0
+
+            # run everything at the next frame, to catch up with what happened while hidden
+            for task in self.tasks.values():
+                task[3] = 0
+
+            self.start_ticking()
+        elif self._hidden_timeout == 0:
+            self._hidden_timeout = GLib.timeout_add(self.hidden_interval_ms, self.run_hidden_callbacks)
+
+    def run_hidden_callbacks(self):
+        for _, _, hidden_callback, _ in self.tasks.values():
+            if hidden_callback is not None:
+                hidden_callback()
+
+        return True
+
+
 class MainWindow(Gtk.ApplicationWindow):
     def __init__(self, controller, this_os, single_window=True):
         LOG.info('Creating main window')
@@ -27,11 +147,6 @@ class MainWindow(Gtk.ApplicationWindow):
         gtk_settings = Gtk.Settings.get_default()
         gtk_settings.set_property("gtk-application-prefer-dark-theme", False)
 
-        if this_os == 'mac_os':
-            plt.switch_backend('MacOSX')
-        else:
-            plt.switch_backend('GTK3Agg')
-
         icon_path = get_icon_path()
 
         if icon_path is not None:
@@ -39,6 +154,10 @@ class MainWindow(Gtk.ApplicationWindow):
 
         self.controller = controller
         self.ready = False
+        self.scheduler = FrameScheduler(self)
+        self._time_label_text = None
+        self._video_length_str = ms_to_timestamp(0)
+        self._pending_position = None  # last position reported by the player, shown at the next frame
 
         # generic properties
         self.red_tick_colour = "#ff3300"
@@ -65,6 +184,8 @@ class MainWindow(Gtk.ApplicationWindow):
         # slider
         self.slider = Gtk.Scale(orientation=Gtk.Orientation.HORIZONTAL, adjustment=None)
         self.set_slider()
+        self.slider_preview = SliderPreview(self.controller, self.slider)
+        self.motion_strip = MotionStrip(self.controller, self.slider)
 
         # boxes and packing
         self.left_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
@@ -76,7 +197,7 @@ class MainWindow(Gtk.ApplicationWindow):
         # microphone monitor
         self.monitor_label = Gtk.Label()
         self.set_monitor_label(None, 'not_recording')
-        self.mic_monitor = MicMonitor(self.controller)
+        self.mic_monitor = MicMonitor(self.controller, self.scheduler)
 
         # path labels
         self.video_path_label = Gtk.Label(label=' ')
@@ -98,6 +219,7 @@ class MainWindow(Gtk.ApplicationWindow):
         self.main_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
 
         self.connect_signals()  # must connect before packing
+        self.scheduler.add('video_position', self.show_pending_position)
 
         self.pack_widgets()
         self.add(self.main_box)
@@ -107,7 +229,15 @@ class MainWindow(Gtk.ApplicationWindow):
 
     def slider_moved(self, *args):
         slider_pos_ms = self.slider.get_value()
-        self.controller.go_to(slider_pos_ms)
+
+        if self.controller.is_dragging and self.controller.has_thumbnails():
+            # the preview follows the pointer, the video will seek only when the slider is released
+            self.update_time_label(slider_pos_ms)
+        elif self.controller.is_dragging:
+            # key frame seeks are enough while dragging, stop_dragging will seek precisely
+            self.controller.go_to(slider_pos_ms, fast=self.controller.get_setting('fast_seek_when_dragging', True))
+        else:
+            self.controller.go_to(slider_pos_ms)
 
     def slider_clicked(self, *args):
         LOG.info("Slider clicked")
@@ -115,9 +245,17 @@ class MainWindow(Gtk.ApplicationWindow):
 
     def slider_released(self, *args):
         LOG.info("Slider released")
+        self.slider_preview.hide()
         slider_pos_ms = int(self.slider.get_value())
         self.controller.stop_dragging(slider_pos_ms)
 
+    def slider_hovered(self, widget, event):
+        self.slider_preview.show_at(event.x)
+
+    def slider_left(self, *args):
+        if not self.controller.is_dragging:
+            self.slider_preview.hide()
+
     def get_monitor_size(self):
         screen = self.get_screen()
         monitor = screen.get_monitor_at_window(screen.get_active_window())
@@ -157,6 +295,7 @@ class MainWindow(Gtk.ApplicationWindow):
 
         self.left_box.pack_start(self.speed_time_box, False, False, 10)
         self.left_box.pack_start(self.slider, False, False, 0)
+        self.left_box.pack_start(self.motion_strip, False, False, 0)
         self.left_box.pack_start(self.playback_controller, False, False, 20)
         self.left_box.pack_start(self.monitor_label, False, False, 0)
         self.left_box.pack_start(self.mic_monitor, False, False, 10)
@@ -205,13 +344,18 @@ class MainWindow(Gtk.ApplicationWindow):
     def connect_signals(self):
         self.connect('destroy', self.closing)
         self.connect('show', self.showing)
+        self._first_draw_handler = self.connect('draw', self.first_drawn)
         self.connect("key-press-event", self.controller.main_window_key_pressed)
         self.connect("key-release-event", self.controller.main_window_key_released)
         self.slider.connect('change-value', self.slider_moved)
         self.slider.connect('button-press-event', self.slider_clicked)
         self.slider.connect('button-release-event', self.slider_released)
+        self.slider.add_events(Gdk.EventMask.POINTER_MOTION_MASK | Gdk.EventMask.LEAVE_NOTIFY_MASK)
+        self.slider.connect('motion-notify-event', self.slider_hovered)
+        self.slider.connect('leave-notify-event', self.slider_left)
         self.controller.signal_sender.connect('video_loaded', self.video_loaded)
         self.controller.signal_sender.connect('ask_video_path', self.choose_video)
+        self.controller.signal_sender.connect('ask_video_queue_path', self.choose_video_queue)
         self.controller.signal_sender.connect('ask_output_path', self.choose_output_folder)
         self.controller.signal_sender.connect('video_moving', self.video_moving)
         self.controller.signal_sender.connect('video_jumped', self.video_jumped)
@@ -229,9 +373,25 @@ class MainWindow(Gtk.ApplicationWindow):
         self.update_time_label(current_time_ms)
 
     def video_moving(self, sender, current_time_ms, is_seeking):
-        self.update_time_position(current_time_ms)
+        # VLC reports positions more often than we draw, only the last one before the next frame is shown
+        self._pending_position = current_time_ms
+        self.scheduler.schedule('video_position')
+
+    def show_pending_position(self):
+        if self._pending_position is None:
+            return
+
+        current_time_ms = self._pending_position
+        self._pending_position = None
+
+        if self.controller.is_dragging:
+            # the slider follows the pointer, moving it to where the video is would fight the user
+            self.update_time_label(current_time_ms)
+        else:
+            self.update_time_position(current_time_ms)
 
     def video_jumped(self, sender, current_time_ms):
+        self._pending_position = None
         self.update_time_position(current_time_ms)
 
     def choose_video(self, sender, saved_video_folder, reset):
@@ -288,6 +448,34 @@ class MainWindow(Gtk.ApplicationWindow):
         else:
             file_dialog.destroy()
 
+    def choose_video_queue(self, sender, from_folder):
+        LOG.info('Opening file chooser dialog for video queue (from folder={})'.format(from_folder))
+
+        if from_folder:
+            file_dialog = Gtk.FileChooserDialog(title="Open folder of videos", parent=self,
+                                                action=Gtk.FileChooserAction.SELECT_FOLDER)
+        else:
+            file_dialog = Gtk.FileChooserDialog(title="Open list of videos", parent=self,
+                                                action=Gtk.FileChooserAction.OPEN)
+            list_file_filter = Gtk.FileFilter()
+            list_file_filter.set_name('Text files')
+            list_file_filter.add_mime_type('text/plain')
+            file_dialog.add_filter(list_file_filter)
+
+        file_dialog.add_button("Cancel", Gtk.ResponseType.CANCEL)
+        file_dialog.add_button("OK", Gtk.ResponseType.OK)
+        saved_video_folder = self.controller.get_setting('video_folder', None)
+
+        if saved_video_folder is not None and os.path.exists(saved_video_folder):
+            file_dialog.set_current_folder(saved_video_folder)
+
+        response = file_dialog.run()
+        path = file_dialog.get_filename()
+        file_dialog.destroy()
+
+        if response == Gtk.ResponseType.OK and path is not None:
+            self.controller.video_queue_selected(path)
+
     def choose_output_folder(self, sender, suggested_folder, changing_output):
         LOG.info('Opening file chooser dialog for output '
                  '(suggested folder={}, changing output={})'.format(suggested_folder, changing_output))
@@ -320,6 +508,7 @@ class MainWindow(Gtk.ApplicationWindow):
         self.controller.output_path_selected(path, changing_output)
 
     def video_loaded(self, controller, video_length, video_path, output_path):
+        self._video_length_str = ms_to_timestamp(video_length)
         self.slider.set_range(1, video_length)
         self.update_time_label(0)
         self.set_video_recordings_paths_labels(video_path, output_path)
@@ -337,6 +526,11 @@ class MainWindow(Gtk.ApplicationWindow):
     def showing(self, *args):
         self.ready = True
 
+    def first_drawn(self, *args):
+        PROFILER.mark('window drawn')
+        self.disconnect(self._first_draw_handler)
+        return False
+
     def closing(self, *args):
         if not self.single_window:
             self.video_area.area.destroy()
@@ -348,7 +542,7 @@ class MainWindow(Gtk.ApplicationWindow):
     def add_speed_check_boxes(self):
         saved_playback_speed = self.controller.get_setting('playback_speed', 1)
         speed_item = None
-        speeds = [0.50, 0.75, 1, 1.50, 2]
+        speeds = [0.50, 0.75, 1, 1.50, 2, 3, 4]
 
         for speed in speeds:
             speed_item = Gtk.RadioButton(label='{:0.2f}'.format(speed), group=speed_item)
@@ -361,10 +555,12 @@ class MainWindow(Gtk.ApplicationWindow):
             self.speed_time_box.pack_start(speed_item, False, False, 0)
 
     def update_time_label(self, ms):
-        ms_str = ms_to_timestamp(ms)
-        total_length_str = ms_to_timestamp(self.controller.get_video_length())
-        time_txt = ' {} / {} '.format(ms_str, total_length_str)
-        self.time_label.set_markup('<span bgcolor="black" fgcolor="white"><tt>{}</tt></span>'.format(time_txt))
+        time_txt = ' {} / {} '.format(ms_to_timestamp(ms), self._video_length_str)
+
+        # setting the markup means parsing it and laying out the label again, skip it if nothing changed
+        if time_txt != self._time_label_text:
+            self._time_label_text = time_txt
+            self.time_label.set_markup('<span bgcolor="black" fgcolor="white"><tt>{}</tt></span>'.format(time_txt))
 
     def set_slider(self):
         self.slider.set_hexpand(True)
@@ -446,15 +642,31 @@ class Menu(Gtk.MenuBar):
         self.change_output_menu_item = Gtk.MenuItem(label='Change output folder')
         self.change_output_menu_item.connect('button-press-event', self.controller.change_output_menu_pressed)
 
+        self.load_queue_folder_menu_item = Gtk.MenuItem(label='Load video queue from folder')
+        self.load_queue_folder_menu_item.connect('button-press-event', self.controller.load_video_queue_menu_pressed,
+                                                 True)
+        self.load_queue_list_menu_item = Gtk.MenuItem(label='Load video queue from list')
+        self.load_queue_list_menu_item.connect('button-press-event', self.controller.load_video_queue_menu_pressed,
+                                               False)
+        self.next_video_menu_item = Gtk.MenuItem(label='Next video in queue')
+        self.next_video_menu_item.connect('button-press-event', self.controller.next_video_menu_pressed)
+        self.update_video_queue_item(None, *controller.get_video_queue_state())
+        self.controller.signal_sender.connect('video_queue_changed', self.update_video_queue_item)
+
         self.file_menu.append(self.load_video_menu_item)
         self.file_menu.append(self.change_output_menu_item)
+        self.file_menu.append(Gtk.SeparatorMenuItem())
+        self.file_menu.append(self.load_queue_folder_menu_item)
+        self.file_menu.append(self.load_queue_list_menu_item)
+        self.file_menu.append(self.next_video_menu_item)
         self.file_menu_item = Gtk.MenuItem(label='File')
         self.file_menu_item.set_submenu(self.file_menu)
 
         self.mic_menu = Gtk.Menu()
         self.mic_menu_item = Gtk.MenuItem(label='Select microphone')
         self.mic_menu_item.set_submenu(self.mic_menu)
-        self.set_mic_items(controller.get_mic_devices(), controller.get_current_mic_device())
+        # devices are listed once the recorder is ready, listing them means initialising PortAudio
+        self.controller.signal_sender.connect('recorder_ready', self.recorder_ready)
 
         self.settings_menu = Gtk.Menu()
         self.hold_to_record_menu_item = Gtk.CheckMenuItem(label='Hold to record')
@@ -465,11 +677,52 @@ class Menu(Gtk.MenuBar):
         self.play_after_delete_menu_item.set_active(controller.get_setting('play_after_delete', False))
         self.play_after_delete_menu_item.connect('toggled', self.controller.play_after_delete_toggled)
 
+        self.skip_static_menu_item = Gtk.CheckMenuItem(label='Skip static parts of the video')
+        self.skip_static_menu_item.set_active(controller.get_setting('skip_static', False))
+        self.skip_static_menu_item.connect('toggled', self.controller.skip_static_toggled)
+
+        self.use_proxies_menu_item = Gtk.CheckMenuItem(label='Play low resolution copies of the videos')
+        self.use_proxies_menu_item.set_active(controller.get_setting('use_proxies', False))
+        self.use_proxies_menu_item.connect('toggled', self.controller.use_proxies_toggled)
+
+        self.show_playback_stats_menu_item = Gtk.CheckMenuItem(label='Show playback statistics')
+        self.show_playback_stats_menu_item.set_active(controller.get_setting('show_playback_stats', False))
+        self.show_playback_stats_menu_item.connect('toggled', self.controller.show_playback_stats_toggled)
+
+        self.auto_tune_audio_menu_item = Gtk.CheckMenuItem(label='Increase the audio block size if samples are dropped')
+        self.auto_tune_audio_menu_item.set_active(controller.get_setting('auto_tune_audio', False))
+        self.auto_tune_audio_menu_item.connect('toggled', self.controller.auto_tune_audio_toggled)
+
+        self.play_recs_over_video_menu_item = Gtk.CheckMenuItem(label='Play recordings over the video without pausing')
+        self.play_recs_over_video_menu_item.set_active(controller.get_setting('play_recs_over_video', False))
+        self.play_recs_over_video_menu_item.connect('toggled', self.controller.play_recordings_over_video_toggled)
+
         self.settings_menu.append(self.hold_to_record_menu_item)
         self.settings_menu.append(self.play_after_delete_menu_item)
+        self.settings_menu.append(self.play_recs_over_video_menu_item)
+        self.settings_menu.append(self.skip_static_menu_item)
+        self.settings_menu.append(self.use_proxies_menu_item)
+        self.settings_menu.append(self.show_playback_stats_menu_item)
+        self.settings_menu.append(self.auto_tune_audio_menu_item)
         self.settings_menu_item = Gtk.MenuItem(label='Settings')
         self.settings_menu_item.set_submenu(self.settings_menu)
 
+        self.review_menu = Gtk.Menu()
+        self.start_review_menu_item = Gtk.MenuItem(label='Review recordings from current position')
+        self.start_review_menu_item.connect('activate', self.controller.start_review)
+        self.stop_review_menu_item = Gtk.MenuItem(label='Stop review')
+        self.stop_review_menu_item.connect('activate', self.controller.stop_review)
+        self.review_skip_silence_menu_item = Gtk.CheckMenuItem(label='Skip silence')
+        self.review_skip_silence_menu_item.set_active(controller.get_setting('review_skip_silence', True))
+        self.review_skip_silence_menu_item.connect('toggled', self.controller.review_skip_silence_toggled)
+        self.review_menu.append(self.start_review_menu_item)
+        self.review_menu.append(self.stop_review_menu_item)
+        self.review_menu.append(Gtk.SeparatorMenuItem())
+        self.review_menu.append(self.review_skip_silence_menu_item)
+        self.add_review_speed_items()
+        self.review_menu_item = Gtk.MenuItem(label='Review')
+        self.review_menu_item.set_submenu(self.review_menu)
+
         self.help_window = HelpWindow()
 
         self.info_menu_ = Gtk.Menu()
@@ -485,14 +738,41 @@ class Menu(Gtk.MenuBar):
         self.append(self.file_menu_item)
         self.append(self.mic_menu_item)
         self.append(self.settings_menu_item)
+        self.append(self.review_menu_item)
         self.append(self.info_menu_item)
 
+    def update_video_queue_item(self, sender, position, length):
+        if length > 0:
+            self.next_video_menu_item.set_label('Next video in queue ({}/{})'.format(position, length))
+        else:
+            self.next_video_menu_item.set_label('Next video in queue')
+
+        self.next_video_menu_item.set_sensitive(0 < position < length)
+
+    def add_review_speed_items(self):
+        saved_speed = self.controller.get_setting('review_speed', 1.5)
+        speed_item = None
+        self.review_menu.append(Gtk.SeparatorMenuItem())
+
+        for speed in [1, 1.25, 1.5, 1.75, 2]:
+            speed_item = Gtk.RadioMenuItem(label='Speed {:0.2f}x'.format(speed), group=speed_item)
+
+            if speed == saved_speed:
+                speed_item.set_active(True)
+
+            speed_item.connect('toggled', self.controller.review_speed_selected, speed)
+            self.review_menu.append(speed_item)
+
     def closing(self):
         self.help_window.destroy()
 
     def show_help(self, *args):
         self.help_window.show_all()
 
+    def recorder_ready(self, *args):
+        self.set_mic_items(self.controller.get_mic_devices(), self.controller.get_current_mic_device())
+        self.mic_menu.show_all()
+
     def set_mic_items(self, mic_devices, current_mic):
         mic_item = None
 
@@ -571,6 +851,82 @@ class VideoArea:
         self.controller.ui_video_area_ready(widget)
 
 
+class SliderPreview(Gtk.Popover):
+    def __init__(self, controller, slider):
+        Gtk.Popover.__init__(self)
+        self.controller = controller
+        self.slider = slider
+        self.set_relative_to(slider)
+        self.set_modal(False)
+        self.set_position(Gtk.PositionType.TOP)
+        self.set_can_focus(False)
+
+        self.image = Gtk.Image()
+        self.time_label = Gtk.Label()
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        box.pack_start(self.image, False, False, 0)
+        box.pack_start(self.time_label, False, False, 2)
+        self.add(box)
+
+    def x_to_time(self, x):
+        rect = self.slider.get_range_rect()
+        adjustment = self.slider.get_adjustment()
+        fraction = min(1, max(0, (x - rect.x) / max(1, rect.width)))
+        lower, upper = adjustment.get_lower(), adjustment.get_upper()
+        return lower + fraction * (upper - lower)
+
+    def show_at(self, x):
+        # thumbnails come from the in-memory cache, we never seek the video here
+        time_ms = self.x_to_time(x)
+        thumbnail = self.controller.get_thumbnail(time_ms)
+
+        if thumbnail is None:
+            self.hide()
+            return
+
+        self.image.set_from_pixbuf(thumbnail)
+        self.time_label.set_markup('<tt>{}</tt>'.format(ms_to_timestamp(time_ms)))
+        pointing_rect = Gdk.Rectangle()
+        pointing_rect.x = int(x)
+        pointing_rect.y = 0
+        pointing_rect.width = 1
+        pointing_rect.height = 1
+        self.set_pointing_to(pointing_rect)
+        self.show_all()
+
+
+class MotionStrip(Gtk.DrawingArea):
+    def __init__(self, controller, slider, height=4):
+        Gtk.DrawingArea.__init__(self)
+        self.controller = controller
+        self.slider = slider
+        self.set_size_request(-1, height)
+        self.connect('draw', self.draw_static_spans)
+        self.controller.signal_sender.connect('motion_index_ready', self.refresh)
+        self.controller.signal_sender.connect('video_loaded', self.refresh)
+
+    def refresh(self, *args):
+        self.queue_draw()
+
+    def draw_static_spans(self, widget, cairo_ctx):
+        video_length = self.controller.get_video_length()
+
+        if video_length <= 0:
+            return
+
+        # align the spans with the slider trough
+        rect = self.slider.get_range_rect()
+        height = widget.get_allocated_height()
+        cairo_ctx.set_source_rgb(0.45, 0.6, 0.85)
+
+        for start_ms, end_ms in self.controller.get_static_spans():
+            x = rect.x + rect.width * start_ms / video_length
+            width = max(1, rect.width * (min(end_ms, video_length) - start_ms) / video_length)
+            cairo_ctx.rectangle(x, 0, width, height)
+
+        cairo_ctx.fill()
+
+
 class PlaybackBox(Gtk.ButtonBox):
     def __init__(self, controller):
         Gtk.ButtonBox.__init__(self)
@@ -645,55 +1001,187 @@ class PlaybackBox(Gtk.ButtonBox):
             LOG.error('Got unrecognised recording state signal {}'.format(state))
 
 
-class MicMonitor(FigureCanvas):
-    def __init__(self, controller, plot_interval_ms=30):
-        # microphone monitor
+class MicMonitor(Gtk.DrawingArea):
+    """
+    Microphone monitor drawn with Cairo: the last window of audio is summarised in a min/max column per pixel, which
+    is computed once when new audio arrives. It refreshes less often when we are not recording, and it is only
+    drained (not drawn) while the window is hidden.
+
+    When the recorder runs in levels mode, there is no audio to draw, a bar per channel shows the RMS and the peak
+    level in dB instead, with a red mark at the end while the channel clips.
+    """
+
+    def __init__(self, controller, scheduler, refresh_ms=30, idle_refresh_ms=100, y_range=0.25, min_db=-60,
+                 clip_hold_s=1):
+        Gtk.DrawingArea.__init__(self)
         self.controller = controller
-        self.fig, self.ax, self.lines, self.data = self.prepare_monitor_fig()
-        FigureCanvas.__init__(self, self.fig)  # a Gtk.DrawingArea
-        self.set_size_request(100, 50)
-        self.monitor_animation = FuncAnimation(self.fig, self.update_mic_monitor, interval=plot_interval_ms, blit=True)
+        self.scheduler = scheduler
+        self.refresh_ms = refresh_ms
+        self.idle_refresh_ms = idle_refresh_ms
+        self.y_range = y_range
+        self.data = None  # allocated once the recorder is ready
+        self.columns = None  # min and max arrays of shape (width, channels)
+        self.min_db = min_db
+        self.clip_hold_s = clip_hold_s
+        self.levels = None  # last peak, rms and clips per channel in levels mode
+        self.clipped_until = None  # per channel, until when the clip mark is shown
         self.is_recording = False
+        self.set_size_request(100, 50)
+        self.set_has_tooltip(True)
+        self.connect('query-tooltip', self.show_stream_info)
+        self.connect('draw', self.draw_monitor)
         self.controller.signal_sender.connect('recording_state_changed', self.change_recording_state)
+        self.controller.signal_sender.connect('recorder_ready', self.recorder_ready)
 
-    def prepare_monitor_fig(self):
-        plt.style.use('dark_background')
-        mpl.rcParams['toolbar'] = 'None'
-        fig, ax = plt.subplots()
-
+    def recorder_ready(self, *args):
         window_length, n_channels = self.controller.get_recorder_window_size()
-        data = np.zeros((window_length, n_channels))
-        lines = ax.plot(data, color='w')
-        ax.axis((0, len(data), -0.25, 0.25))
-        ax.set_yticks([0])
-        ax.yaxis.grid(True)
-        fig.tight_layout(pad=-5)
-        ax.axis('off')
-        fig.canvas.set_window_title('Epic Narrator Monitor')
-
-        return fig, ax, lines, data
-
-    def update_mic_monitor(self, *args):
+        self.columns = None
+
+        if self.controller.get_recorder_monitor_mode() == 'levels':
+            self.clipped_until = np.zeros(n_channels)
+            self.scheduler.add('mic_monitor', self.update_levels, self.get_refresh_ms(),
+                               hidden_callback=self.controller.get_recorder_levels)
+        else:
+            self.data = np.zeros((window_length, n_channels), dtype=np.float32)
+            self.scheduler.add('mic_monitor', self.update_mic_monitor, self.get_refresh_ms(),
+                               hidden_callback=self.drain_mic_data)
+
+    def show_stream_info(self, widget, x, y, keyboard_mode, tooltip):
+        info = self.controller.get_recorder_stream_info()
+
+        if info is None:
+            return False
+
+        tooltip.set_text('{profile} stream: {blocksize} frames per block, {latency_ms:.1f}ms latency, '
+                         '{sample_rate:.0f}Hz, {overflows} overflows, callback jitter {jitter_mean_ms:.2f}ms '
+                         '(max {jitter_max_ms:.1f}ms)'.format(**info))
+        return True
+
+    def get_refresh_ms(self):
+        return self.refresh_ms if self.is_recording else self.idle_refresh_ms
+
+    def drain_mic_data(self):
+        while True:
+            try:
+                self.controller.get_recorder_data()
+            except queue.Empty:
+                break
+
+    def update_mic_monitor(self):
+        new_data = False
+
         while True:
             try:
                 data = self.controller.get_recorder_data()
             except queue.Empty:
                 break
 
-            shift = len(data)
-            self.data = np.roll(self.data, -shift, axis=0)
-            self.data[-shift:, :] = data
+            shift = min(len(data), len(self.data))
+
+            if shift == 0:
+                continue
+
+            self.data[:-shift] = self.data[shift:]
+            self.data[-shift:] = data[-shift:]
+            new_data = True
+
+        if new_data:
+            self.columns = None
+            self.queue_draw()
+
+    def update_levels(self):
+        levels = self.controller.get_recorder_levels()
+
+        if levels is not None:
+            self.levels = levels
+            self.clipped_until[levels['clips'] > 0] = time.monotonic() + self.clip_hold_s
+            self.queue_draw()
+
+    def level_to_width(self, level, width):
+        db = 20 * np.log10(np.maximum(level, 1e-6))
+        return width * np.clip(1 - db / self.min_db, 0, 1)
 
-        for column, line in enumerate(self.lines):
-            line.set_ydata(self.data[:, column])
-            color = 'red' if self.is_recording else 'white'
-            line.set_color(color)
+    def compute_columns(self, n_columns):
+        n_samples = len(self.data)
 
-        return self.lines
+        if n_samples >= n_columns:
+            starts = (np.arange(n_columns) * n_samples) // n_columns
+            return np.minimum.reduceat(self.data, starts, axis=0), np.maximum.reduceat(self.data, starts, axis=0)
+        else:
+            idx = (np.arange(n_columns) * n_samples) // n_columns
+            return self.data[idx], self.data[idx]
+
+    def draw_monitor(self, widget, cairo_ctx):
+        width = widget.get_allocated_width()
+        height = widget.get_allocated_height()
+        cairo_ctx.set_source_rgb(0, 0, 0)
+        cairo_ctx.paint()
+
+        if self.levels is not None:
+            self.draw_levels(cairo_ctx, width, height)
+            return
+
+        if width <= 0 or self.data is None or len(self.data) == 0:
+            return
+
+        if self.columns is None or len(self.columns[0]) != width:
+            self.columns = self.compute_columns(width)
+
+        mins, maxs = self.columns
+        middle = height / 2
+        scale = middle / self.y_range
+        tops = np.clip(middle - maxs * scale, 0, height)
+        bottoms = np.maximum(np.clip(middle - mins * scale, 0, height), tops + 1)  # silence is still a flat line
+
+        if self.is_recording:
+            cairo_ctx.set_source_rgb(1, 0, 0)
+        else:
+            cairo_ctx.set_source_rgb(1, 1, 1)
+
+        cairo_ctx.set_line_width(1)
+
+        for channel in range(tops.shape[1]):
+            for x, (top, bottom) in enumerate(zip(tops[:, channel].tolist(), bottoms[:, channel].tolist())):
+                cairo_ctx.move_to(x + 0.5, top)
+                cairo_ctx.line_to(x + 0.5, bottom)
+
+        cairo_ctx.stroke()
+
+    def draw_levels(self, cairo_ctx, width, height):
+        n_channels = len(self.levels['rms'])
+        row_height = height / n_channels
+        rms_widths = self.level_to_width(self.levels['rms'], width).tolist()
+        peak_widths = self.level_to_width(self.levels['peak'], width).tolist()
+        clipping = (self.clipped_until > time.monotonic()).tolist()
+        clip_width = max(2, width // 20)
+
+        for channel in range(n_channels):
+            top = channel * row_height + 1
+            bar_height = max(1, row_height - 2)
+
+            if self.is_recording:
+                cairo_ctx.set_source_rgb(1, 0, 0)
+            else:
+                cairo_ctx.set_source_rgb(1, 1, 1)
+
+            cairo_ctx.rectangle(0, top, rms_widths[channel], bar_height)
+            cairo_ctx.fill()
+            cairo_ctx.rectangle(max(0, peak_widths[channel] - 1), top, 1, bar_height)
+            cairo_ctx.fill()
+
+            if clipping[channel]:
+                cairo_ctx.set_source_rgb(1, 0.2, 0)
+                cairo_ctx.rectangle(width - clip_width, top, clip_width, bar_height)
+                cairo_ctx.fill()
 
     def change_recording_state(self, sender, state):
         self.is_recording = state == 'recording'
 
+        if self.data is not None or self.clipped_until is not None:
+            self.scheduler.set_interval('mic_monitor', self.get_refresh_ms())
+
+        self.queue_draw()
+
 
 class NarrationsBox(Gtk.ListBox):
     def __init__(self, controller, main_window):
@@ -710,6 +1198,8 @@ class NarrationsBox(Gtk.ListBox):
         self.controller = controller
         self.main_window = main_window
         self.narrations_map = {}
+        self.waveform_previews = {}
+        self.issue_icons = {}
         self.highlighted_recording_button = None
 
         self.controller.signal_sender.connect('recording_added', self.add_narration)
@@ -717,6 +1207,8 @@ class NarrationsBox(Gtk.ListBox):
         self.controller.signal_sender.connect('set_highlighted_rec', self.highlight_recording)
         self.controller.signal_sender.connect('recording_deleted', self.remove_annotation_box)
         self.controller.signal_sender.connect('resetting_recordings', self.reset)
+        self.controller.signal_sender.connect('waveform_ready', self.update_waveform)
+        self.controller.signal_sender.connect('narration_checked', self.update_issues)
 
     def add_narration(self, sender, time_ms, rec_idx, new):
         box = Gtk.ButtonBox()
@@ -732,6 +1224,10 @@ class NarrationsBox(Gtk.ListBox):
         play_button.set_image(Gtk.Image.new_from_icon_name('media-playback-start', Gtk.IconSize.BUTTON))
         delete_button = Gtk.Button()
         delete_button.set_image(Gtk.Image.new_from_icon_name('user-trash', Gtk.IconSize.BUTTON))
+        waveform_preview = WaveformPreview(self.controller.get_waveform(time_ms))
+        # only shown for takes that clipped, are too quiet or lost audio
+        issue_icon = Gtk.Image.new_from_icon_name('dialog-warning', Gtk.IconSize.BUTTON)
+        issue_icon.set_no_show_all(True)
 
         time_button.connect('button-press-event', self.recording_timestamp_pressed, time_ms)
         play_button.connect('button-press-event', self.play_recording_pressed, time_ms)
@@ -741,6 +1237,10 @@ class NarrationsBox(Gtk.ListBox):
         box.pack_start(time_button, False, False, 0)
         box.pack_start(play_button, False, False, 0)
         box.pack_start(delete_button, False, False, 0)
+        box.pack_start(waveform_preview, False, False, 0)
+        box.pack_start(issue_icon, False, False, 0)
+        box.set_child_non_homogeneous(waveform_preview, True)
+        box.set_child_non_homogeneous(issue_icon, True)
         box.set_layout(Gtk.ButtonBoxStyle.CENTER)
         box.set_spacing(5)
         box.show_all()
@@ -751,6 +1251,9 @@ class NarrationsBox(Gtk.ListBox):
             b.connect('key-release-event', do_nothing_on_key_press)
 
         self.narrations_map[time_ms] = box
+        self.waveform_previews[time_ms] = waveform_preview
+        self.issue_icons[time_ms] = issue_icon
+        self.update_issues(None, time_ms)
         self.insert(box, rec_idx)
 
         if new:
@@ -762,13 +1265,33 @@ class NarrationsBox(Gtk.ListBox):
         if new:
             self.scroll_to_rec(time_ms, box=widget)
 
+    def update_waveform(self, sender, time_ms):
+        if time_ms in self.waveform_previews:
+            self.waveform_previews[time_ms].set_waveform(self.controller.get_waveform(time_ms))
+
+    def update_issues(self, sender, time_ms):
+        issue_icon = self.issue_icons.get(time_ms, None)
+
+        if issue_icon is None:
+            return
+
+        issues = self.controller.get_narration_issues(time_ms)
+        issue_icon.set_tooltip_text('This narration {}'.format(', '.join(
+            {'clipped': 'is too loud (it clipped)', 'quiet': 'is too quiet',
+             'dropouts': 'lost some audio (the microphone overflowed)'}[issue] for issue in issues)))
+        issue_icon.set_visible(bool(issues))
+
     def reset(self, *args):
         self.remove_all_narrations_boxes()
         self.reset_highlighted()
         self.narrations_map = {}
+        self.waveform_previews = {}
+        self.issue_icons = {}
 
     def remove_annotation_box(self, sender, time_ms):
         box = self.narrations_map.pop(time_ms, None)
+        self.waveform_previews.pop(time_ms, None)
+        self.issue_icons.pop(time_ms, None)
 
         if box is None:
             return
@@ -854,6 +1377,43 @@ class NarrationsBox(Gtk.ListBox):
         self.main_window.ask_confirmation_for_deleting(None, time_ms, False)
 
 
+class WaveformPreview(Gtk.DrawingArea):
+    def __init__(self, waveform, width=80, height=24):
+        Gtk.DrawingArea.__init__(self)
+        self.waveform = waveform
+        self.set_size_request(width, height)
+        self.set_valign(Gtk.Align.CENTER)
+        self.connect('draw', self.draw_waveform)
+
+    def set_waveform(self, waveform):
+        self.waveform = waveform
+        self.queue_draw()
+
+    def draw_waveform(self, widget, cairo_ctx):
+        width = widget.get_allocated_width()
+        height = widget.get_allocated_height()
+        middle = height / 2
+
+        cairo_ctx.set_source_rgb(0.5, 0.5, 0.5)
+        cairo_ctx.set_line_width(1)
+
+        if self.waveform is None:
+            # nothing computed yet, just draw the zero line
+            cairo_ctx.move_to(0, middle)
+            cairo_ctx.line_to(width, middle)
+            cairo_ctx.stroke()
+            return
+
+        # the waveform picks the pyramid level closest to the number of columns, so this is cheap
+        mins, maxs = self.waveform.get_columns(width)
+
+        for x, (low, high) in enumerate(zip(mins, maxs)):
+            cairo_ctx.move_to(x + 0.5, middle - high * middle)
+            cairo_ctx.line_to(x + 0.5, middle - low * middle + 1)
+
+        cairo_ctx.stroke()
+
+
 class HelpWindow(Gtk.Assistant):
     def __init__(self):
         Gtk.Assistant.__init__(self)
@@ -916,7 +1476,8 @@ class HelpWindow(Gtk.Assistant):
         return [
             'Use the playback buttons to pause/play the video, as well as seeking backwards/forwards',
             'and mute/unmute the video.',
-            'You can also use the slider to move across the video.\n',
+            'You can also use the slider to move across the video. Hovering or dragging the slider shows a preview',
+            'of the video at that position (this requires <tt>ffmpeg</tt> to be installed).\n',
             'To annotate an action press the microphone button.',
             'This will pause the video and will start recording your voice immediately.',
             'Once you have narrated the action, press the button again to stop the recording and',
@@ -933,10 +1494,30 @@ class HelpWindow(Gtk.Assistant):
             'You will see all your recording in the right-hand side panel.',
             'You can jump to the action location by left-clicking on the timestamp (see more below).',
             'You can play and delete each recording with the corresponding buttons.',
+            'Next to the buttons you will see a small preview of the waveform of each recording.',
             'If you switch on <tt> Settings -> Play video after deleting recording</tt>',
             'the video will play automatically after you delete a recording.',
             'If you want to play a recording and also jump to the video location at the same time',
             'right-click the recording play button.\n',
+            'When <tt>Play recordings with video</tt> is ticked, the video pauses while each recording is played.',
+            'Switch on <tt>Settings -> Play recordings over the video without pausing</tt> to keep the video going',
+            'instead: its audio will be lowered while recordings play.\n',
+            '<b>Skipping static parts</b>\n',
+            'Switch on <tt>Settings -> Skip static parts of the video</tt> to play the parts of the video where nothing',
+            'moves at 4x. These are found analysing the video in the background (this requires <tt>ffmpeg</tt>) and',
+            'are shown in blue under the slider.\n',
+            '<b>Video queue</b>\n',
+            'Use <tt>File -> Load video queue from folder</tt> (or <tt>from list</tt>, a text file with a video path',
+            'per line) to narrate several videos one after the other. Use <tt>File -> Next video in queue</tt> to',
+            'move on: the next video is prepared in the background while you narrate, so it opens straight away.\n',
+            '<b>Low resolution copies</b>\n',
+            'If the playback is choppy, switch on <tt>Settings -> Play low resolution copies of the videos</tt>.',
+            'A small copy of each video is made in the background (this requires <tt>ffmpeg</tt>) and played',
+            'instead of the original as soon as it is ready. Recordings are still timed on the original video.\n',
+            '<b>Reviewing recordings</b>\n',
+            'Use <tt>Review -> Review recordings from current position</tt> to listen to all the following recordings',
+            'back to back, faster and without the silence at their start and end. The video will jump to each',
+            'recording as it is played. Press the space bar or use <tt>Review -> Stop review</tt> to stop.\n',
             '<b>Overwriting recording</b>\n',
             'You can override a recording by right-clicking on its timestamp on the recording panel.',
             'You will be asked for a confirmation before overwriting the recording.',
@@ -946,8 +1527,8 @@ class HelpWindow(Gtk.Assistant):
 
     def keyboard_shortcuts_text(self):
         return [
-            '<b><tt>left arrow</tt></b> : seek backwards',
-            '<b><tt>right arrow</tt></b> : seek forwards',
+            '<b><tt>left arrow</tt></b> : seek backwards (hold it down to seek faster)',
+            '<b><tt>right arrow</tt></b> : seek forwards (hold it down to seek faster)',
             '<b><tt>space bar</tt></b> : pause/play video',
             '<b><tt>enter</tt></b> : start/stop recording',
             '<b><tt>delete</tt></b> or <b><tt>backspace</tt></b> : delete the highlighted recording',
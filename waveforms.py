@@ -0,0 +1,305 @@
+import logging
+import os
+import struct
+import threading
+
+import numpy as np
+
+from background import BackgroundWorker, get_file_key
+
+LOG = logging.getLogger('epic_narrator.waveforms')
+
+
+class Waveform:
+    """
+    Min/max peak pyramid of a recording. Level 0 summarises `base_bin` frames per bin, every following level
+    halves the resolution of the previous one. Peaks are stored as int16 regardless of the audio format.
+    """
+
+    def __init__(self, sample_rate, n_frames, base_bin, levels):
+        self.sample_rate = sample_rate
+        self.n_frames = n_frames
+        self.base_bin = base_bin
+        self.levels = levels  # list of (mins, maxs) int16 arrays
+
+    @property
+    def duration_ms(self):
+        return 1000 * self.n_frames / self.sample_rate if self.sample_rate else 0
+
+    def get_level_for_columns(self, n_columns):
+        # pick the coarsest level that still has at least one bin per column
+        for mins, maxs in reversed(self.levels):
+            if len(mins) >= n_columns:
+                return mins, maxs
+
+        return self.levels[0]
+
+    def get_columns(self, n_columns):
+        """Returns min and max arrays with exactly `n_columns` values, normalised in [-1, 1]"""
+        if n_columns <= 0 or not self.levels or len(self.levels[0][0]) == 0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+        mins, maxs = self.get_level_for_columns(n_columns)
+        n_bins = len(mins)
+
+        if n_bins >= n_columns:
+            starts = (np.arange(n_columns) * n_bins) // n_columns
+            mins = np.minimum.reduceat(mins, starts)
+            maxs = np.maximum.reduceat(maxs, starts)
+        else:
+            # fewer bins than columns, stretch the bins
+            idx = (np.arange(n_columns) * n_bins) // n_columns
+            mins = mins[idx]
+            maxs = maxs[idx]
+
+        return mins.astype(np.float32) / 32767, maxs.astype(np.float32) / 32767
+
+    def get_active_range(self, threshold=0.02, padding_ms=100):
+        """Returns start and end times (ms) of the part above the threshold, i.e. without leading and trailing silence"""
+        mins, maxs = self.levels[0]
+        peaks = np.maximum(np.abs(mins.astype(np.int32)), np.abs(maxs.astype(np.int32)))
+        active = np.flatnonzero(peaks > threshold * 32767)
+
+        if len(active) == 0:
+            return 0, self.duration_ms
+
+        bin_ms = 1000 * self.base_bin / self.sample_rate
+        start = max(0, active[0] * bin_ms - padding_ms)
+        end = min(self.duration_ms, (active[-1] + 1) * bin_ms + padding_ms)
+        return float(start), float(end)
+
+    def get_slice(self, start_ms, end_ms, level=0):
+        """Returns min and max peaks of the given level between the two times"""
+        mins, maxs = self.levels[level]
+        frames_per_bin = self.base_bin * (2 ** level)
+        start = max(0, int(start_ms * self.sample_rate / (1000 * frames_per_bin)))
+        end = max(start, int(end_ms * self.sample_rate / (1000 * frames_per_bin)) + 1)
+        return mins[start:end], maxs[start:end]
+
+
+class WaveformCache:
+    """
+    Computes waveform pyramids in a background thread and persists them next to the recordings, in a small binary
+    file keyed by the size and modification time of the audio file, so they are computed once per recording.
+    """
+
+    magic = b'EPKS'
+    version = 1
+    header = struct.Struct('<4sHQqIQIH')
+    level_header = struct.Struct('<I')
+    extension = 'peaks'
+
+    def __init__(self, base_bin=128, min_bins=16, chunk_bins=4096):
+        LOG.info('Creating waveform cache')
+        self.base_bin = base_bin
+        self.min_bins = min_bins
+        self.chunk_bins = chunk_bins
+        self._waveforms = {}
+        self._lock = threading.Lock()
+        self._worker = BackgroundWorker(self.load_or_compute, 'waveform-worker', 'Could not compute waveform for {}',
+                                        log=LOG, lock=self._lock, store=self._waveforms.__setitem__)
+        self._worker.start()
+
+    @staticmethod
+    def get_peaks_path(audio_path):
+        return '{}.{}'.format(os.path.splitext(audio_path)[0], WaveformCache.extension)
+
+    def get(self, audio_path):
+        """Returns the waveform if it is already in memory, never touches the disk"""
+        with self._lock:
+            return self._waveforms.get(audio_path, None)
+
+    def request(self, audio_path, callback):
+        """
+        Loads or computes the waveform in the background. `callback(audio_path, waveform)` is called from the worker
+        thread, so use `GLib.idle_add` in it if you need to touch the UI
+        """
+        self._worker.request(audio_path, callback)
+
+    def discard(self, audio_path):
+        with self._lock:
+            self._waveforms.pop(audio_path, None)
+
+        peaks_path = self.get_peaks_path(audio_path)
+
+        if os.path.exists(peaks_path):
+            os.remove(peaks_path)
+
+    def clear(self):
+        with self._lock:
+            self._waveforms.clear()
+
+    def load_or_compute(self, audio_path):
+        if not os.path.exists(audio_path):
+            return None
+
+        key = get_file_key(audio_path)
+        peaks_path = self.get_peaks_path(audio_path)
+        waveform = self.load(peaks_path, key['size'], key['mtime_ns'])
+
+        if waveform is None:
+            LOG.debug('Computing waveform for {}'.format(audio_path))
+            waveform = self.compute(audio_path)
+            self.save(peaks_path, waveform, key['size'], key['mtime_ns'])
+
+            if not os.path.exists(audio_path):  # deleted while we were computing
+                self.discard(audio_path)
+                return None
+
+        return waveform
+
+    def load(self, peaks_path, file_size, mtime_ns):
+        if not os.path.exists(peaks_path):
+            return None
+
+        with open(peaks_path, 'rb') as f:
+            header = f.read(self.header.size)
+
+            if len(header) < self.header.size:
+                return None
+
+            magic, version, size, mtime, sample_rate, n_frames, base_bin, n_levels = self.header.unpack(header)
+
+            if magic != self.magic or version != self.version or size != file_size or mtime != mtime_ns:
+                return None
+
+            levels = []
+
+            for _ in range(n_levels):
+                n_bins, = self.level_header.unpack(f.read(self.level_header.size))
+                peaks = np.frombuffer(f.read(n_bins * 4), dtype='<i2')
+
+                if len(peaks) != n_bins * 2:
+                    return None
+
+                levels.append((peaks[0::2], peaks[1::2]))
+
+        return Waveform(sample_rate, n_frames, base_bin, levels)
+
+    def save(self, peaks_path, waveform, file_size, mtime_ns):
+        tmp_path = peaks_path + '.tmp'
+
+        with open(tmp_path, 'wb') as f:
+            f.write(self.header.pack(self.magic, self.version, file_size, mtime_ns, int(waveform.sample_rate),
+                                     waveform.n_frames, waveform.base_bin, len(waveform.levels)))
+
+            for mins, maxs in waveform.levels:
+                peaks = np.empty(len(mins) * 2, dtype='<i2')
+                peaks[0::2] = mins
+                peaks[1::2] = maxs
+                f.write(self.level_header.pack(len(mins)))
+                f.write(peaks.tobytes())
+
+        os.replace(tmp_path, peaks_path)
+
+    def compute(self, audio_path):
+        sample_rate, samples = open_pcm(audio_path)
+        n_frames = samples.shape[0]
+        mins, maxs = self.compute_base_level(samples)
+        levels = [(mins, maxs)]
+
+        while len(mins) > self.min_bins:
+            # pad odd lengths by repeating the last bin, then merge pairs of bins
+            if len(mins) % 2:
+                mins = np.append(mins, mins[-1])
+                maxs = np.append(maxs, maxs[-1])
+
+            mins = mins.reshape(-1, 2).min(axis=1)
+            maxs = maxs.reshape(-1, 2).max(axis=1)
+            levels.append((mins, maxs))
+
+        return Waveform(sample_rate, n_frames, self.base_bin, levels)
+
+    def compute_base_level(self, samples):
+        n_frames = samples.shape[0]
+        n_full = n_frames // self.base_bin
+        n_bins = n_full + (1 if n_frames % self.base_bin else 0)
+        mins = np.empty(n_bins, dtype=np.int16)
+        maxs = np.empty(n_bins, dtype=np.int16)
+
+        # go through the memory map in chunks of bins to keep memory bounded on long recordings
+        for start in range(0, n_full, self.chunk_bins):
+            end = min(n_full, start + self.chunk_bins)
+            block = samples[start * self.base_bin:end * self.base_bin].reshape(end - start, -1)
+            mins[start:end] = to_int16(block.min(axis=1))
+            maxs[start:end] = to_int16(block.max(axis=1))
+
+        if n_bins > n_full:
+            tail = samples[n_full * self.base_bin:]
+            mins[-1] = to_int16(tail.min())
+            maxs[-1] = to_int16(tail.max())
+
+        return mins, maxs
+
+
+def to_int16(values):
+    values = np.asarray(values)
+
+    if values.dtype == np.int16:
+        return values
+    elif values.dtype == np.uint8:
+        return ((values.astype(np.int16) - 128) * 256).astype(np.int16)
+    elif values.dtype == np.int32:
+        return (values >> 16).astype(np.int16)
+    else:
+        return (np.clip(values, -1, 1) * 32767).astype(np.int16)
+
+
+def open_pcm(audio_path):
+    """
+    Memory-maps the PCM data of a wav file, returning the sample rate and a (frames, channels) array.
+    Formats that cannot be memory-mapped (e.g. 24 bit) are read with soundfile.
+    """
+    with open(audio_path, 'rb') as f:
+        riff = f.read(12)
+
+        if len(riff) == 12 and riff[:4] == b'RIFF' and riff[8:12] == b'WAVE':
+            fmt = None
+
+            while True:
+                chunk_header = f.read(8)
+
+                if len(chunk_header) < 8:
+                    break
+
+                chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+
+                if chunk_id == b'fmt ':
+                    fmt_data = f.read(chunk_size + (chunk_size % 2))
+                    fmt = list(struct.unpack('<HHIIHH', fmt_data[:16]))
+
+                    if fmt[0] == 0xFFFE and chunk_size >= 26:
+                        fmt[0], = struct.unpack('<H', fmt_data[24:26])  # the sub format of WAVE_FORMAT_EXTENSIBLE
+                elif chunk_id == b'data' and fmt is not None:
+                    dtype = get_pcm_dtype(fmt[0], fmt[5])
+
+                    if dtype is None:
+                        break
+
+                    offset = f.tell()
+                    channels = fmt[1]
+                    # the header might not be updated if the file was not closed properly
+                    available = os.path.getsize(audio_path) - offset
+                    n_frames = min(chunk_size, available) // (channels * np.dtype(dtype).itemsize)
+
+                    if n_frames == 0:
+                        return fmt[2], np.zeros((0, channels), dtype=dtype)
+
+                    samples = np.memmap(audio_path, dtype=dtype, mode='r', offset=offset,
+                                        shape=(n_frames, channels))
+                    return fmt[2], samples
+                else:
+                    f.seek(chunk_size + (chunk_size % 2), os.SEEK_CUR)
+
+    import soundfile as sf
+    samples, sample_rate = sf.read(audio_path, dtype='float32', always_2d=True)
+    return sample_rate, samples
+
+
+def get_pcm_dtype(format_tag, bits_per_sample):
+    if format_tag == 1 and bits_per_sample in (8, 16, 32):
+        return {8: np.uint8, 16: '<i2', 32: '<i4'}[bits_per_sample]
+    elif format_tag == 3 and bits_per_sample == 32:
+        return '<f4'
+    else:
+        return None
@@ -0,0 +1,185 @@
+import logging
+import os
+import queue
+import threading
+
+from recordings import Recordings
+
+LOG = logging.getLogger('epic_narrator.work_queue')
+
+
+class VideoQueue:
+    """List of videos to narrate one after the other, read from a folder or from a text file with one path per line"""
+
+    video_extensions = ('.mp4', '.mov', '.avi', '.mkv', '.mts', '.m4v', '.webm', '.mpg', '.mpeg', '.lrv')
+
+    def __init__(self, videos, position=0):
+        self.videos = videos
+        self.position = max(0, min(position, len(videos) - 1))
+
+    @staticmethod
+    def from_path(path):
+        if os.path.isdir(path):
+            videos = [os.path.join(path, f) for f in sorted(os.listdir(path))
+                      if os.path.splitext(f)[1].lower() in VideoQueue.video_extensions]
+        else:
+            videos = []
+            list_folder = os.path.dirname(os.path.abspath(path))
+
+            with open(path) as f:
+                for line in f:
+                    line = line.strip()
+
+                    if line and not line.startswith('#'):
+                        # relative paths are relative to the list itself
+                        videos.append(os.path.join(list_folder, os.path.expanduser(line)))
+
+        missing = [v for v in videos if not os.path.exists(v)]
+
+        if missing:
+            LOG.warning('Skipping {} videos that do not exist: {}'.format(len(missing), missing))
+
+        return VideoQueue([os.path.abspath(v) for v in videos if os.path.exists(v)])
+
+    def __len__(self):
+        return len(self.videos)
+
+    def get_current(self):
+        return self.videos[self.position] if self.videos else None
+
+    def get_next(self):
+        return self.videos[self.position + 1] if self.has_next() else None
+
+    def has_next(self):
+        return self.position + 1 < len(self.videos)
+
+    def advance(self):
+        if self.has_next():
+            self.position += 1
+
+        return self.get_current()
+
+    def move_to(self, video_path):
+        """Makes the given video the current one if it is in the queue, returns whether it is"""
+        video_path = os.path.abspath(video_path)
+
+        if video_path in self.videos:
+            self.position = self.videos.index(video_path)
+            return True
+
+        return False
+
+
+class PreloadedVideo:
+    def __init__(self, video_path, output_path, media_info, narrations_folder, folder_mtime_ns, audio_files):
+        self.video_path = video_path
+        self.output_path = output_path
+        self.media_info = media_info
+        self.narrations_folder = narrations_folder
+        self.folder_mtime_ns = folder_mtime_ns
+        self.audio_files = audio_files
+
+    def get_audio_files(self):
+        """Returns the recordings found when preloading, or None if the narrations folder changed since then"""
+        try:
+            mtime_ns = os.stat(self.narrations_folder).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+
+        return self.audio_files if mtime_ns == self.folder_mtime_ns else None
+
+
+class VideoPreloader:
+    """
+    Gets the next video of the queue ready in a background thread while the current one is narrated: its media info
+    is probed (and cached by the probe), its recordings are listed and the beginning of the file is read so it is in
+    the OS cache when VLC opens it.
+    """
+
+    def __init__(self, media_probe, head_mb=16, chunk_kb=1024):
+        self.media_probe = media_probe
+        self.head_bytes = head_mb * 1024 * 1024
+        self.chunk_size = chunk_kb * 1024
+        self._preloaded = {}  # video path -> PreloadedVideo
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._work, name='video-preloader', daemon=True)
+        self._worker.start()
+
+    def preload(self, video_path, output_path, media_path=None, start_time_ms=0):
+        """
+        Preloads the video in the background. `media_path` is what the player will open (e.g. a proxy of the video)
+        if different from the video
+        """
+        with self._lock:
+            if video_path in self._preloaded:
+                return
+
+        self._requests.put((video_path, output_path, media_path or video_path, start_time_ms))
+
+    def pop(self, video_path, output_path):
+        """Returns what was preloaded for the video, if anything, and forgets about it"""
+        with self._lock:
+            preloaded = self._preloaded.pop(video_path, None)
+
+        if preloaded is None or preloaded.output_path != output_path:
+            return None
+
+        return preloaded
+
+    def _work(self):
+        while True:
+            video_path, output_path, media_path, start_time_ms = self._requests.get()
+
+            try:
+                preloaded = self.load(video_path, output_path, media_path, start_time_ms)
+            except Exception:
+                LOG.exception('Could not preload {}'.format(video_path))
+                continue
+
+            with self._lock:
+                # we only ever need the next video
+                self._preloaded = {video_path: preloaded}
+
+    def load(self, video_path, output_path, media_path, start_time_ms):
+        LOG.info('Preloading {}'.format(video_path))
+        media_info = self.media_probe.probe_now(video_path)
+        narrations_folder = Recordings.get_recordings_path_for_video(output_path, video_path)
+
+        if os.path.exists(narrations_folder):
+            folder_mtime_ns = os.stat(narrations_folder).st_mtime_ns
+            audio_files = Recordings.scan_recordings(narrations_folder)
+        else:
+            folder_mtime_ns = None
+            audio_files = []
+
+        self.read_head(media_path, media_info, start_time_ms)
+        LOG.info('Preloaded {} ({} recordings)'.format(video_path, len(audio_files)))
+
+        return PreloadedVideo(video_path, output_path, media_info, narrations_folder, folder_mtime_ns, audio_files)
+
+    def read_head(self, media_path, media_info, start_time_ms):
+        file_size = os.path.getsize(media_path)
+        # start from where the video will be opened, estimating the offset with a constant bitrate
+        if start_time_ms > 0 and media_info is not None and media_info.duration_ms > 0:
+            start = int(file_size * min(1, start_time_ms / media_info.duration_ms))
+        else:
+            start = 0
+
+        # containers often keep their index at the end of the file, which is read when opening the video
+        ranges = [(start, min(file_size, start + self.head_bytes)),
+                  (max(0, file_size - self.chunk_size), file_size)]
+        buffer = bytearray(self.chunk_size)
+
+        with open(media_path, 'rb', buffering=0) as f:
+            for range_start, range_end in ranges:
+                f.seek(range_start)
+                remaining = range_end - range_start
+
+                while remaining > 0:
+                    n_read = f.readinto(buffer)
+
+                    if not n_read:
+                        break
+
+                    remaining -= n_read